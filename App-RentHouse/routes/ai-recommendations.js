@@ -2,12 +2,56 @@
 const express = require('express');
 const router = express.Router();
 const axios = require('axios');
+const crypto = require('crypto');
 const admin = require('firebase-admin');
 const Rental = require('../models/Rental');
 
 // 🔥 PYTHON ML SERVICE URL
 const ML_SERVICE_URL = process.env.PYTHON_ML_URL || 'http://python-ml:8001';
 
+// ==================== ML CLIENT (X-Request-Id + Server-Timing) ====================
+
+/**
+ * Axios instance riêng cho ML service:
+ * - Gửi X-Request-Id để correlate log Node <-> Python
+ * - Log breakdown Server-Timing (redis, cf, geo, serialization, ...) khi nhận response
+ */
+const mlClient = axios.create();
+
+mlClient.interceptors.request.use((config) => {
+  config.headers = config.headers || {};
+  if (!config.headers['X-Request-Id']) {
+    config.headers['X-Request-Id'] = crypto.randomUUID();
+  }
+  config.metadata = { startedAt: Date.now() };
+  return config;
+});
+
+function _logMlTiming(config, response, error) {
+  const startedAt = config?.metadata?.startedAt;
+  const elapsed = startedAt ? Date.now() - startedAt : null;
+  const requestId = response?.headers?.['x-request-id'] || config?.headers?.['X-Request-Id'];
+  const serverTiming = response?.headers?.['server-timing'];
+  const path = (config?.url || '').replace(ML_SERVICE_URL, '');
+
+  console.log(`⏱️  [ML] ${config?.method?.toUpperCase()} ${path} id=${requestId} ` +
+    `status=${response?.status ?? error?.code ?? 'ERR'} e2e=${elapsed}ms`);
+  if (serverTiming) {
+    console.log(`   Server-Timing: ${serverTiming}`);
+  }
+}
+
+mlClient.interceptors.response.use(
+  (response) => {
+    _logMlTiming(response.config, response);
+    return response;
+  },
+  (error) => {
+    _logMlTiming(error.config, error.response, error);
+    return Promise.reject(error);
+  }
+);
+
 // ==================== MIDDLEWARE ====================
 const authMiddleware = async (req, res, next) => {
   const token = req.header('Authorization')?.replace('Bearer ', '');
@@ -94,7 +138,7 @@ router.get('/recommendations/personalized', authMiddleware, async (req, res) =>
     try {
       console.log(`🔗 Calling ML service: ${ML_SERVICE_URL}/recommend/personalized`);
 
-      const mlResponse = await axios.post(
+      const mlResponse = await mlClient.post(
         `${ML_SERVICE_URL}/recommend/personalized`,
         {
           userId: userId,
@@ -330,7 +374,7 @@ router.get('/recommendations/nearby/:rentalId', authMiddleware, async (req, res)
       console.log(`🔗 Calling ML service: ${ML_SERVICE_URL}/recommend/similar`);
 
       // 🔥 FIX: Gửi rentalId và enable location
-      const mlResponse = await axios.post(
+      const mlResponse = await mlClient.post(
         `${ML_SERVICE_URL}/recommend/similar`,
         {
           rentalId: rentalId,  // 🔥 SỬA: rental_id -> rentalId
@@ -501,7 +545,7 @@ router.get('/recommendations/personalized/context', authMiddleware, async (req,
     try {
       const totalAvailable = await Rental.countDocuments({ status: 'available' });
       // 🔥 CALL ML SERVICE WITH CONTEXT
-      const mlResponse = await axios.post(
+      const mlResponse = await mlClient.post(
         `${ML_SERVICE_URL}/recommend/personalized`,
         {
           userId,
@@ -717,7 +761,7 @@ router.post('/recommendations/personalized/with-poi', authMiddleware, async (req
 
       
 
-      const mlResponse = await axios.post(
+      const mlResponse = await mlClient.post(
         `${ML_SERVICE_URL}/recommend/personalized`,
         {
           userId: userId,
@@ -983,7 +1027,7 @@ router.get('/explain/:userId/:rentalId', authMiddleware, async (req, res) => {
 
     try {
       // Call ML service to explain
-      const mlResponse = await axios.post(
+      const mlResponse = await mlClient.post(
         `${ML_SERVICE_URL}/recommend/explain`,
         null,
         {
@@ -1060,7 +1104,7 @@ router.get('/user-preferences/:userId', authMiddleware, async (req, res) => {
     console.log(`👤 [PREFERENCES] User: ${userId}`);
 
     try {
-      const mlResponse = await axios.get(
+      const mlResponse = await mlClient.get(
         `${ML_SERVICE_URL}/user-preferences/${userId}`,
         { timeout: 5000 }
       );
@@ -1165,7 +1209,7 @@ router.post('/recommendations/similar', authMiddleware, async (req, res) => {
     try {
       console.log(`🔗 Calling ML: ${ML_SERVICE_URL}/recommend/similar`);
 
-      const mlResponse = await axios.post(
+      const mlResponse = await mlClient.post(
         `${ML_SERVICE_URL}/recommend/similar`,
         {
           rentalId: rentalId,
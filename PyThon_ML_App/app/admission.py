@@ -0,0 +1,294 @@
+"""
+🚦 ADMISSION CONTROL - Giới hạn concurrency + hàng đợi có giới hạn + load shedding theo priority
+
+Không có giới hạn thì 1 đợt request full-catalog (with-poi / map: n_recommendations = toàn bộ catalog)
+chiếm hết CPU và mọi request cùng chậm theo. Mỗi endpoint nặng thuộc 1 lane:
+
+    lane          priority  endpoint
+    interactive   0         /recommend/explain, /recommend/similar
+    personalized  1         /recommend/personalized (n_recommendations <= ADMISSION_MAP_MIN_N)
+    chat          1         /chat, /chat/explain-rental, /chat/conversation (chủ yếu chờ Groq, không dùng CPU slot chung)
+    map           2         /recommend/personalized full-catalog (n_recommendations > ADMISSION_MAP_MIN_N)
+
+- Lane có `limit` request chạy cùng lúc + hàng đợi tối đa `queue` request
+- Lane CPU (mọi lane trừ chat) dùng chung ADMISSION_CAPACITY slot; slot trống được giao cho
+  request đang chờ của lane priority cao nhất (FIFO trong lane) -> explain/similar luôn đi trước map
+- Từ chối nhanh (kèm Retry-After):
+    429 queue_full   hàng đợi của lane đã đầy
+    503 overloaded   thời gian chờ ước tính (EWMA thời gian xử lý của lane) > max_wait_ms
+    503 timeout      đã chờ quá max_wait_ms mà chưa có slot
+- Queue wait -> ml_admission_queue_wait_seconds{lane}; shed -> ml_admission_rejected_total{lane,reason};
+  ml_admission_in_flight / ml_admission_queue_depth (gauge)
+
+Việc nặng chạy trong thread (run_blocking) để event loop vẫn nhận / từ chối / xếp hàng request khác;
+request đang được profile (app/profiling.py đọc stack của event-loop thread) thì chạy inline.
+/recommend/popular, /user-preferences (lookup rẻ), /health, /ready, /metrics không qua admission.
+
+Env:
+    ADMISSION_ENABLED=1
+    ADMISSION_CAPACITY=<max(2, số CPU)>    slot CPU dùng chung
+    ADMISSION_MAP_MIN_N=100                n_recommendations lớn hơn -> lane map
+    ADMISSION_<LANE>_LIMIT / _QUEUE / _MAX_WAIT_MS   vd. ADMISSION_MAP_LIMIT=1
+"""
+import os
+import sys
+import math
+import time
+import asyncio
+import contextvars
+from collections import deque
+from contextlib import asynccontextmanager
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from instrumentation import (
+    ADMISSION_QUEUE_WAIT, ADMISSION_REJECTED, ADMISSION_IN_FLIGHT, ADMISSION_QUEUED, get_logger
+)
+
+log = get_logger('admission')
+
+DEFAULT_MAP_MIN_N = 100
+_EWMA_ALPHA = 0.2
+
+
+def _env_flag(name: str, default: bool) -> bool:
+    return os.getenv(name, '1' if default else '0').lower() in ('1', 'true', 'yes')
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+# ==================== ERRORS ====================
+
+class AdmissionRejected(Exception):
+    """Request bị shed: main.py trả status_code + header Retry-After"""
+
+    def __init__(self, lane: str, reason: str, status_code: int, retry_after: int):
+        super().__init__(f"{lane} lane {reason}")
+        self.lane = lane
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+# ==================== LANES ====================
+
+class Lane:
+    """1 lớp request: limit chạy cùng lúc, hàng đợi FIFO có giới hạn, EWMA thời gian xử lý"""
+
+    def __init__(self, name, priority, limit, queue_size, max_wait_ms, shared=True):
+        self.name = name
+        self.priority = priority
+        self.limit = max(limit, 1)
+        self.queue_size = max(queue_size, 0)
+        self.max_wait_ms = max(max_wait_ms, 1)
+        self.shared = shared  # True = dùng slot CPU chung của controller
+        self.active = 0
+        self.waiters = deque()
+        self.service_seconds = None
+
+    @classmethod
+    def from_env(cls, name, priority, limit, queue_size, max_wait_ms, shared=True):
+        prefix = f'ADMISSION_{name.upper()}'
+        return cls(
+            name, priority,
+            limit=_env_int(f'{prefix}_LIMIT', limit),
+            queue_size=_env_int(f'{prefix}_QUEUE', queue_size),
+            max_wait_ms=_env_int(f'{prefix}_MAX_WAIT_MS', max_wait_ms),
+            shared=shared,
+        )
+
+    def observe_service(self, seconds):
+        if self.service_seconds is None:
+            self.service_seconds = seconds
+        else:
+            self.service_seconds += _EWMA_ALPHA * (seconds - self.service_seconds)
+
+    def status(self):
+        return {
+            'priority': self.priority,
+            'limit': self.limit,
+            'queue_size': self.queue_size,
+            'max_wait_ms': self.max_wait_ms,
+            'shared': self.shared,
+            'in_flight': self.active,
+            'queued': len(self.waiters),
+            'service_ms': round(self.service_seconds * 1000, 2) if self.service_seconds is not None else None,
+        }
+
+
+class _Ticket:
+    __slots__ = ('lane', 'started')
+
+    def __init__(self, lane):
+        self.lane = lane
+        self.started = time.perf_counter()
+
+
+# ==================== CONTROLLER ====================
+
+class AdmissionController:
+    """Cấp slot cho request theo lane / priority; mọi state chỉ đổi trên event loop (không cần lock)"""
+
+    def __init__(self, lanes, capacity, map_min_n=DEFAULT_MAP_MIN_N, enabled=True):
+        self.lanes = {lane.name: lane for lane in lanes}
+        self._by_priority = sorted(lanes, key=lambda lane: lane.priority)
+        self.capacity = max(capacity, 1)
+        self.map_min_n = map_min_n
+        self.enabled = enabled
+        self.shared_active = 0
+
+    @classmethod
+    def from_env(cls):
+        capacity = _env_int('ADMISSION_CAPACITY', max(os.cpu_count() or 1, 2))
+        lanes = [
+            Lane.from_env('interactive', 0, limit=capacity, queue_size=32, max_wait_ms=1000),
+            Lane.from_env('personalized', 1, limit=capacity, queue_size=16, max_wait_ms=2000),
+            Lane.from_env('chat', 1, limit=8, queue_size=16, max_wait_ms=3000, shared=False),
+            # Node gọi with-poi với timeout 10s, các route personalized khác 5s -> chừa thời gian tính
+            Lane.from_env('map', 2, limit=max(capacity // 2, 1), queue_size=8, max_wait_ms=2500),
+        ]
+        return cls(
+            lanes, capacity,
+            map_min_n=_env_int('ADMISSION_MAP_MIN_N', DEFAULT_MAP_MIN_N),
+            enabled=_env_flag('ADMISSION_ENABLED', True),
+        )
+
+    def personalized_lane(self, n_recommendations):
+        """Full-catalog (map / with-poi) -> 'map', còn lại 'personalized'"""
+        return 'map' if n_recommendations > self.map_min_n else 'personalized'
+
+    def _can_run(self, lane):
+        return lane.active < lane.limit and (not lane.shared or self.shared_active < self.capacity)
+
+    def _start(self, lane):
+        lane.active += 1
+        if lane.shared:
+            self.shared_active += 1
+        ADMISSION_IN_FLIGHT.set(lane.active, lane=lane.name)
+
+    def _expected_wait(self, lane, ahead):
+        """Ước tính (giây) cho request xếp sau `ahead` request của lane; 0 khi chưa có số đo"""
+        if lane.service_seconds is None:
+            return 0.0
+        parallel = min(lane.limit, self.capacity) if lane.shared else lane.limit
+        return (ahead // parallel + 1) * lane.service_seconds
+
+    def _rejected(self, lane, reason, status_code, wait_seconds):
+        ADMISSION_REJECTED.inc(lane=lane.name, reason=reason)
+        retry_after = max(1, math.ceil(wait_seconds or lane.max_wait_ms / 1000))
+        log.debug("🚦 shed %s (%s): in_flight=%s queued=%s", lane.name, reason, lane.active, len(lane.waiters))
+        return AdmissionRejected(lane.name, reason, status_code, retry_after)
+
+    async def acquire(self, lane_name):
+        """Chờ slot của lane -> ticket (None khi tắt admission); AdmissionRejected khi bị shed"""
+        if not self.enabled:
+            return None
+        lane = self.lanes[lane_name]
+        started = time.perf_counter()
+
+        # Chỉ vào thẳng khi không có ai đang chờ trong lane (giữ FIFO)
+        if not lane.waiters and self._can_run(lane):
+            self._start(lane)
+            ADMISSION_QUEUE_WAIT.observe(0.0, lane=lane.name)
+            return _Ticket(lane)
+
+        if len(lane.waiters) >= lane.queue_size:
+            raise self._rejected(lane, 'queue_full', 429, self._expected_wait(lane, len(lane.waiters)))
+        expected = self._expected_wait(lane, len(lane.waiters))
+        if expected * 1000 > lane.max_wait_ms:
+            raise self._rejected(lane, 'overloaded', 503, expected)
+
+        granted = asyncio.get_running_loop().create_future()
+        lane.waiters.append(granted)
+        ADMISSION_QUEUED.set(len(lane.waiters), lane=lane.name)
+        try:
+            await asyncio.wait((granted,), timeout=lane.max_wait_ms / 1000)
+        except asyncio.CancelledError:
+            # Client ngắt kết nối khi đang chờ: trả lại slot nếu vừa được cấp
+            if granted.done():
+                self._finish(lane)
+            else:
+                self._forget(lane, granted)
+            raise
+
+        if not granted.done():
+            self._forget(lane, granted)
+            raise self._rejected(lane, 'timeout', 503, self._expected_wait(lane, len(lane.waiters)))
+
+        ADMISSION_QUEUE_WAIT.observe(time.perf_counter() - started, lane=lane.name)
+        return _Ticket(lane)
+
+    def _forget(self, lane, granted):
+        granted.cancel()
+        try:
+            lane.waiters.remove(granted)
+        except ValueError:
+            pass
+        ADMISSION_QUEUED.set(len(lane.waiters), lane=lane.name)
+
+    def release(self, ticket):
+        if ticket is None:
+            return
+        ticket.lane.observe_service(time.perf_counter() - ticket.started)
+        self._finish(ticket.lane)
+
+    def _finish(self, lane):
+        lane.active -= 1
+        if lane.shared:
+            self.shared_active -= 1
+        ADMISSION_IN_FLIGHT.set(lane.active, lane=lane.name)
+        self._dispatch()
+
+    def _dispatch(self):
+        """Giao slot trống cho request đang chờ: lane priority cao trước, FIFO trong lane"""
+        while True:
+            for lane in self._by_priority:
+                if lane.waiters and self._can_run(lane):
+                    granted = lane.waiters.popleft()
+                    ADMISSION_QUEUED.set(len(lane.waiters), lane=lane.name)
+                    self._start(lane)
+                    granted.set_result(None)
+                    break
+            else:
+                return
+
+    @asynccontextmanager
+    async def slot(self, lane_name):
+        ticket = await self.acquire(lane_name)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def status(self):
+        return {
+            'enabled': self.enabled,
+            'capacity': self.capacity,
+            'shared_in_flight': self.shared_active,
+            'map_min_n': self.map_min_n,
+            'lanes': {lane.name: lane.status() for lane in self._by_priority},
+        }
+
+
+# ==================== OFFLOAD ====================
+
+_run_inline: contextvars.ContextVar = contextvars.ContextVar('ml_admission_inline', default=False)
+
+
+def run_inline():
+    """Request hiện tại chạy việc nặng trên event-loop thread (middleware gọi khi request được profile)"""
+    _run_inline.set(True)
+
+
+async def run_blocking(func, *args, **kwargs):
+    """func(*args, **kwargs) trong thread (context được copy -> span / Server-Timing vẫn ghi đúng request)"""
+    if _run_inline.get():
+        return func(*args, **kwargs)
+    return await asyncio.to_thread(func, *args, **kwargs)
+
+
+ADMISSION = AdmissionController.from_env()
@@ -1,11 +1,23 @@
 import os
+import re
 import sys
+import time
+import asyncio
+import uuid
 from typing import List, Optional, Tuple, Dict, Any
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Query 
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, JSONResponse
+from starlette.routing import Match
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from openai_chat_service import RentalChatAssistant
+from profiling import PROFILER
+from warmup import WarmUp, WARMUP_HEADER, warm_model
+from admission import ADMISSION, AdmissionRejected, run_blocking, run_inline
 from pydantic import BaseModel, Field, model_validator
 import redis
 import json
@@ -14,13 +26,19 @@ from dotenv import load_dotenv
 from pydantic import ConfigDict
 from functools import wraps
 import hashlib
+import weakref
 
-# Add parent directory to path
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from training.train_model import RecommendationModel
+from training.shared_model import SharedModel, DEFAULT_CHECK_INTERVAL
+from instrumentation import (
+    REGISTRY, REQUEST_DURATION, CACHE_REQUESTS, SERVER_TIMING_ENABLED,
+    span, record_stage, begin_request, get_logger
+)
 
 load_dotenv()
 
+log = get_logger('api')
+
 
 # ==================== PYDANTIC MODELS ====================
 
@@ -46,6 +64,8 @@ class PersonalizedRecommendRequest(BaseModel):
     use_location: bool = Field(default=True)
     radius_km: int = Field(default=20)
     context: Optional[ContextData] = None
+    # Ngân sách thời gian (ms) - header X-Budget-Ms cũng được; hết budget -> kết quả degraded
+    budget_ms: Optional[int] = Field(default=None, ge=1, le=60000)
     
     model_config = ConfigDict(populate_by_name=True)
     
@@ -167,12 +187,35 @@ class RecommendationsResult(BaseModel):
 model: Optional[RecommendationModel] = None
 redis_client: Optional[redis.Redis] = None
 chat_assistant: Optional[RentalChatAssistant] = None
+shared_model: Optional[SharedModel] = None  # MODEL_SHARED=1: model memory-map dùng chung giữa worker
+warmup: Optional[WarmUp] = None  # app/warmup.py - /ready trả 200 khi warm-up xong
 # ==================== LIFESPAN EVENT HANDLERS ====================
 
+async def _watch_shared_model():
+    """Handshake version: có version mới (artifact được save lại) -> attach snapshot mới, đổi global model"""
+    global model
+    while True:
+        await asyncio.sleep(shared_model.check_interval)
+        try:
+            new_model = await asyncio.to_thread(shared_model.refresh)
+        except Exception as e:
+            log.warning(f"Shared model refresh failed: {e}")
+            continue
+        if new_model is not None:
+            # Version mới: page-in array memory-map trước khi nhận request
+            try:
+                await asyncio.to_thread(warm_model, new_model)
+            except Exception as e:
+                log.warning(f"Shared model warm-up failed: {e}")
+            model = new_model
+            if chat_assistant is not None:
+                chat_assistant.model = new_model
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan context manager for startup and shutdown events."""
-    global model, redis_client, chat_assistant
+    global model, redis_client, chat_assistant, shared_model, warmup
     
     # ============ STARTUP ============
     print("\n" + "="*70)
@@ -181,9 +224,28 @@ async def lifespan(app: FastAPI):
     
     # Load ML model
     model_path = os.getenv('MODEL_PATH', './models/recommendation_model.pkl')
+    # MODEL_LAZY=1: matrix / similarity chỉ đọc vào RAM khi request đầu tiên cần
+    # MODEL_PRELOAD=user_item_matrix,user_similarity (hoặc 'all'): load sẵn lúc startup
+    # (vd. worker chỉ phục vụ personalized/popular không bao giờ load item_similarity)
+    # MODEL_SHARED=1: mọi worker map read-only cùng 1 snapshot (training/shared_model.py),
+    # MODEL_SHARED_CHECK_SECONDS: chu kỳ kiểm tra version mới
+    # MODEL_TRACE_MEMORY=1: đo peak tracemalloc lúc load (/model/info -> memory.peaks.load; load chậm hơn nhiều)
+    model_lazy = os.getenv('MODEL_LAZY', '0').lower() in ('1', 'true', 'yes')
+    model_shared = os.getenv('MODEL_SHARED', '0').lower() in ('1', 'true', 'yes')
+    model_trace_memory = os.getenv('MODEL_TRACE_MEMORY', '0').lower() in ('1', 'true', 'yes')
+    model_preload = os.getenv('MODEL_PRELOAD', '').strip()
+    if model_preload != 'all':
+        model_preload = [name.strip() for name in model_preload.split(',') if name.strip()]
     
     try:
-        model = RecommendationModel.load(model_path)
+        if model_shared:
+            shared_model = SharedModel(
+                model_path, check_interval=float(os.getenv('MODEL_SHARED_CHECK_SECONDS', DEFAULT_CHECK_INTERVAL))
+            )
+            model = shared_model.attach()
+        else:
+            model = RecommendationModel.load(model_path, lazy=model_lazy, preload=model_preload,
+                                             trace_memory=model_trace_memory)
         print("✅ ML Model loaded successfully")
     except Exception as e:
         print(f"⚠️ ML Model not available: {e}")
@@ -209,13 +271,25 @@ async def lifespan(app: FastAPI):
         print("   Make sure GROQ_API_KEY is set in .env\n")
         chat_assistant = None
     
+    # 🔥 WARM-UP: chạy nền sau startup (/health trả ngay, /ready = 503 cho đến khi xong)
+    warmup = WarmUp.from_env()
+    if warmup.prefetch_users and redis_client is None:
+        print("⚠️ WARMUP_PREFETCH_USERS set but Redis not available: prefetched rankings are not kept\n")
+    warmup_task = asyncio.create_task(warmup.run(app, model)) if model is not None else None
+    
     print("="*70)
-    print("✅ SERVICE READY")
+    print("✅ SERVICE STARTED" + (" (warming up, see /ready)" if warmup_task is not None and warmup.enabled else ""))
     print("="*70 + "\n")
     
+    watcher = asyncio.create_task(_watch_shared_model()) if shared_model is not None and model is not None else None
+    
     yield  # Application runs here
     
     # ============ SHUTDOWN ============
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    if watcher is not None:
+        watcher.cancel()
     if redis_client:
         redis_client.close()
         print("✅ Redis connection closed")
@@ -282,10 +356,95 @@ app.add_middleware(
     allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-    allow_headers=["Content-Type", "Authorization"],
+    allow_headers=["Content-Type", "Authorization", "X-Request-Id"],
+    expose_headers=["X-Request-Id", "Server-Timing", "X-Profile-Id", "Retry-After"],
     max_age=600,
 )
 
+# ==================== REQUEST METRICS ====================
+
+def _route_template(request: Request) -> str:
+    """Path template (/user-preferences/{userId}) để label không bị nổ cardinality"""
+    route = request.scope.get('route')
+    if route is not None:
+        return route.path
+    
+    for route in app.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    
+    return 'unmatched'
+
+_REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._:-]{1,128}$')
+
+def _resolve_request_id(request: Request) -> str:
+    """Echo X-Request-Id từ Node nếu hợp lệ, không thì tự sinh"""
+    incoming = request.headers.get('x-request-id')
+    if incoming and _REQUEST_ID_PATTERN.match(incoming):
+        return incoming
+    return uuid.uuid4().hex
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """
+    Histogram latency theo endpoint cho /metrics + header cho caller:
+    - X-Request-Id: correlate log Node <-> ML service
+    - Server-Timing: thời gian từng stage (redis, cf, geo, serialization, ...)
+    Request warm-up (X-Warmup: 1, app/warmup.py) không tính vào histogram / profiling.
+    """
+    started = time.perf_counter()
+    request_id = _resolve_request_id(request)
+    timings = begin_request(request_id)
+    status = 500
+    warmup_request = request.headers.get(WARMUP_HEADER) == '1'
+    
+    # 🔬 On-demand (X-Profile + X-Admin-Token) hoặc rolling 1/N profiling
+    profile_session = None
+    profile_request = None if warmup_request else PROFILER.requested_mode(
+        request.url.path, request.headers, request.query_params
+    )
+    if profile_request:
+        mode, trigger = profile_request
+        profile_session = PROFILER.begin(mode, trigger, request.method, request.url.path, request_id)
+    if profile_session is not None:
+        run_inline()  # profiler chỉ đọc event-loop thread -> không đẩy việc nặng sang thread
+    
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        
+        response.headers['X-Request-Id'] = request_id
+        if SERVER_TIMING_ENABLED:
+            response.headers['Server-Timing'] = timings.server_timing(time.perf_counter() - started)
+        if profile_session is not None and profile_session.trigger == 'on_demand':
+            response.headers['X-Profile-Id'] = profile_session.id
+        return response
+    finally:
+        if profile_session is not None:
+            PROFILER.finish(profile_session, status)
+        
+        if not warmup_request:
+            REQUEST_DURATION.observe(
+                time.perf_counter() - started,
+                endpoint=_route_template(request),
+                method=request.method,
+                status=status
+            )
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected(request: Request, exc: AdmissionRejected):
+    """Request bị shed (app/admission.py): 429 / 503 + Retry-After để caller fallback ngay thay vì chờ timeout"""
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={
+            "detail": f"ML service overloaded ({exc.reason}), retry after {exc.retry_after}s",
+            "lane": exc.lane,
+            "reason": exc.reason,
+        },
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 # ==================== HELPER FUNCTIONS ====================
 
 def get_cache_key(prefix: str, identifier: str) -> str:
@@ -298,11 +457,15 @@ def get_from_cache(key: str) -> Optional[dict]:
         return None
     
     try:
-        data = redis_client.get(key)
+        with span('redis'):
+            data = redis_client.get(key)
         if data:
+            CACHE_REQUESTS.inc(result='hit')
             return json.loads(data)
+        CACHE_REQUESTS.inc(result='miss')
     except Exception as e:
-        print(f"Cache read error: {e}")
+        CACHE_REQUESTS.inc(result='error')
+        log.warning(f"Cache read error: {e}")
     
     return None
 
@@ -312,9 +475,11 @@ def set_to_cache(key: str, data: dict, ttl: int = 3600):
         return
     
     try:
-        redis_client.setex(key, ttl, json.dumps(data))
+        payload = json.dumps(data)
+        with span('redis'):
+            redis_client.setex(key, ttl, payload)
     except Exception as e:
-        print(f"Cache write error: {e}")
+        log.warning(f"Cache write error: {e}")
 
 def _convert_to_response(recommendations: List[dict]) -> List[RecommendationResponse]:
     """Convert model recommendations to API responses"""
@@ -412,8 +577,11 @@ async def chat_with_ai(request: ChatRequest):
             detail="Chat service not available. Check GROQ_API_KEY in environment."
         )
     
-    print(f"\n🤖 [CHAT] User: {request.userId}")
-    print(f"   Message: {request.message[:100]}...")
+    log.debug("\n🤖 [CHAT] User: %s", request.userId)
+    log.debug("   Message: %s...", request.message[:100])
+    
+    # 🚦 Lane chat: giới hạn số lượt gọi Groq cùng lúc, không chiếm slot CPU của recommend
+    ticket = await ADMISSION.acquire('chat')
     
     try:
         # Convert Pydantic models to dicts
@@ -423,14 +591,15 @@ async def chat_with_ai(request: ChatRequest):
         ] if request.conversationHistory else []
         
         # Chat with AI
-        chat_result = chat_assistant.chat(
+        chat_result = await run_blocking(
+            chat_assistant.chat,
             user_message=request.message,
             conversation_history=conversation_history,
             user_context=request.userContext
         )
         
-        print(f"   Intent: {chat_result['intent']}")
-        print(f"   Should recommend: {chat_result['should_recommend']}")
+        log.debug("   Intent: %s", chat_result['intent'])
+        log.debug("   Should recommend: %s", chat_result['should_recommend'])
         
         # Get recommendations if needed
         recommendations = None
@@ -440,9 +609,10 @@ async def chat_with_ai(request: ChatRequest):
             chat_result['should_recommend'] and 
             chat_result['extracted_preferences']):
             
-            print(f"   🎯 Getting recommendations...")
+            log.debug("   🎯 Getting recommendations...")
             
-            rec_result = chat_assistant.get_rental_recommendations_with_chat(
+            rec_result = await run_blocking(
+                chat_assistant.get_rental_recommendations_with_chat,
                 user_id=request.userId,
                 preferences=chat_result['extracted_preferences'],
                 conversation_context=request.message,
@@ -471,7 +641,7 @@ async def chat_with_ai(request: ChatRequest):
                 
                 explanation = rec_result.get('explanation')
                 
-                print(f"   ✅ Added {len(recommendations)} recommendations")
+                log.debug("   ✅ Added %s recommendations", len(recommendations))
         
         return ChatResponse(
             success=True,
@@ -485,11 +655,11 @@ async def chat_with_ai(request: ChatRequest):
         )
         
     except Exception as e:
-        print(f"❌ Error in chat: {e}")
-        import traceback
-        traceback.print_exc()
+        log.error(f"❌ Error in chat: {e}", exc_info=True)
         
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        ADMISSION.release(ticket)
 
 
 @app.post("/chat/explain-rental")
@@ -514,7 +684,9 @@ async def explain_rental_with_ai(request: RentalExplanationRequest):
             detail="Chat service not available"
         )
     
-    print(f"\n🤔 [EXPLAIN] Rental: {request.rentalId} for User: {request.userId}")
+    log.debug("\n🤔 [EXPLAIN] Rental: %s for User: %s", request.rentalId, request.userId)
+    
+    ticket = await ADMISSION.acquire('chat')
     
     try:
         # Get user preferences
@@ -523,13 +695,14 @@ async def explain_rental_with_ai(request: RentalExplanationRequest):
             user_prefs = model.get_user_preferences(request.userId)
         
         # Generate explanation
-        explanation = chat_assistant.explain_rental_detail(
+        explanation = await run_blocking(
+            chat_assistant.explain_rental_detail,
             rental_id=request.rentalId,
             user_preferences=user_prefs,
             conversation_context=request.conversationContext
         )
         
-        print(f"   ✅ Explanation generated")
+        log.debug("   ✅ Explanation generated")
         
         return {
             'success': True,
@@ -539,8 +712,10 @@ async def explain_rental_with_ai(request: RentalExplanationRequest):
         }
         
     except Exception as e:
-        print(f"❌ Error: {e}")
+        log.error(f"❌ Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        ADMISSION.release(ticket)
 
 
 @app.get("/chat/conversation/{userId}")
@@ -556,6 +731,8 @@ async def get_conversation_suggestions(userId: str):
     if chat_assistant is None:
         raise HTTPException(status_code=503, detail="Chat service not available")
     
+    ticket = await ADMISSION.acquire('chat')
+    
     try:
         # Get user preferences to determine what to ask next
         user_prefs = model.get_user_preferences(userId) if model else None
@@ -571,15 +748,17 @@ Format: JSON array of strings
 
 CHỈ trả về JSON array."""
 
-        response = chat_assistant.client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "Bạn là tư vấn viên bất động sản. Chỉ trả về JSON."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=200
-        )
+        with span('groq'):
+            response = await run_blocking(
+                chat_assistant.client.chat.completions.create,
+                model="gpt-3.5-turbo",
+                messages=[
+                    {"role": "system", "content": "Bạn là tư vấn viên bất động sản. Chỉ trả về JSON."},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.7,
+                max_tokens=200
+            )
         
         suggestions_text = response.choices[0].message.content.strip()
         
@@ -599,7 +778,7 @@ CHỈ trả về JSON array."""
         }
         
     except Exception as e:
-        print(f"❌ Error: {e}")
+        log.error(f"❌ Error: {e}")
         # Fallback suggestions
         return {
             'success': True,
@@ -612,6 +791,8 @@ CHỈ trả về JSON array."""
             ],
             'fallback': True
         }
+    finally:
+        ADMISSION.release(ticket)
 
 
 # ==================== USAGE STATS ====================
@@ -630,6 +811,53 @@ async def get_chat_stats():
         'status': 'active'
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """📈 Prometheus metrics: latency theo endpoint, strategy và từng stage"""
+    return PlainTextResponse(
+        REGISTRY.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+# ==================== 🔬 ADMIN: PROFILES ====================
+
+def _require_admin(request: Request):
+    if not PROFILER.is_admin(request.headers.get('x-admin-token')):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@app.get("/admin/profiles")
+async def list_profiles(request: Request):
+    """Danh sách profile trong ring buffer (mới nhất trước)"""
+    _require_admin(request)
+    return {
+        "success": True,
+        "rolling_every_n": PROFILER.every_n,
+        "rolling_mode": PROFILER.rolling_mode,
+        "capacity": PROFILER.profiles.maxlen,
+        "profiles": PROFILER.list()
+    }
+
+@app.get("/admin/profiles/{profile_id}")
+async def get_profile(profile_id: str, request: Request):
+    """Chi tiết 1 profile (collapsed stacks hoặc bảng pstats)"""
+    _require_admin(request)
+    profile = PROFILER.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return {"success": True, "profile": profile.to_dict()}
+
+@app.get("/admin/profiles/{profile_id}/collapsed", response_class=PlainTextResponse)
+async def get_profile_collapsed(profile_id: str, request: Request):
+    """
+    Collapsed stacks cho flamegraph:
+        curl -H "X-Admin-Token: ..." .../collapsed | flamegraph.pl > profile.svg
+    """
+    _require_admin(request)
+    profile = PROFILER.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(profile.collapsed or profile.stats_text)
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -637,9 +865,40 @@ async def health_check():
         "status": "healthy",
         "model_loaded": model is not None,
         "redis_connected": redis_client is not None,
+        "admission": ADMISSION.status(),
         "timestamp": datetime.now().isoformat()
     }
 
+@app.get("/ready")
+async def readiness_check():
+    """
+    Readiness (load balancer / readinessProbe) - khác /health (liveness):
+    503 cho đến khi model load xong và warm-up (app/warmup.py) chạy xong
+    """
+    ready = model is not None and warmup is not None and warmup.ready
+    body = {
+        "ready": ready,
+        "model_loaded": model is not None,
+        "warmup": warmup.status() if warmup is not None else None,
+        "timestamp": datetime.now().isoformat()
+    }
+    if not ready:
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+def _request_budget_ms(body_budget: Optional[int], http_request: Request) -> Optional[float]:
+    """Budget của request: body budget_ms > header X-Budget-Ms > env RECOMMEND_BUDGET_MS (0 / không set = không giới hạn)"""
+    if body_budget:
+        return float(body_budget)
+    for raw in (http_request.headers.get('x-budget-ms'), os.getenv('RECOMMEND_BUDGET_MS')):
+        try:
+            value = float(raw) if raw else 0.0
+        except ValueError:
+            continue
+        if value > 0:
+            return value
+    return None
+
 def cache_response(ttl: int = 3600):
     """Decorator để cache API responses"""
     def decorator(func):
@@ -651,7 +910,7 @@ def cache_response(ttl: int = 3600):
             # Check cache
             cached = get_from_cache(cache_key)
             if cached:
-                print(f"✅ Cache HIT: {cache_key}")
+                log.debug("✅ Cache HIT: %s", cache_key)
                 return cached
             
             # Execute function
@@ -682,10 +941,17 @@ async def batch_recommendations(requests: List[PersonalizedRecommendRequest]):
 @cache_response(ttl=1800)
 
 @app.post("/recommend/personalized", response_model=PersonalizedResultResponse)
-async def get_personalized_recommendations(request: PersonalizedRecommendRequest):
+async def get_personalized_recommendations(request: PersonalizedRecommendRequest, http_request: Request):
     """
     🎯 Gợi ý cá nhân hóa với Explainable AI
+    
+    Budget (ms, tính từ lúc nhận request): body budget_ms > header X-Budget-Ms > env RECOMMEND_BUDGET_MS.
+    Hết budget -> recommend_for_user trả blend / popular / nearby, personalization_info.degraded = true,
+    personalization_info.fallback = 'blend' | 'popular' | 'nearby' (kết quả degraded không ghi vào Redis cache).
+    Cache miss qua admission control (app/admission.py): lane map khi n_recommendations > ADMISSION_MAP_MIN_N,
+    thời gian xếp hàng tính vào budget.
     """
+    request_started = time.perf_counter()
     
     if model is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
@@ -695,18 +961,18 @@ async def get_personalized_recommendations(request: PersonalizedRecommendRequest
     if not user_id:
         raise HTTPException(status_code=400, detail="user_id or userId is required")
     
-    print(f"🎯 Personalized recommendation request:")
-    print(f"   userId: {user_id}")
-    print(f"   radius: {request.radius_km}km")
-    print(f"   use_location: {request.use_location}")
-    print(f"   context: {bool(request.context)}")
+    log.debug("🎯 Personalized recommendation request:")
+    log.debug("   userId: %s", user_id)
+    log.debug("   radius: %skm", request.radius_km)
+    log.debug("   use_location: %s", request.use_location)
+    log.debug("   context: %s", bool(request.context))
     
     # Check cache
     cache_key = get_cache_key("personalized", user_id)
     cached_data = get_from_cache(cache_key)
     
     if cached_data:
-        print(f"✅ Cache HIT for user {user_id}")
+        log.debug("✅ Cache HIT for user %s", user_id)
         return PersonalizedResultResponse(
             success=True,
             userId=user_id,
@@ -717,25 +983,40 @@ async def get_personalized_recommendations(request: PersonalizedRecommendRequest
             user_preferences=cached_data.get('user_preferences')
         )
     
-    print(f"🎯 Generating PERSONALIZED recommendations for user {user_id}...")
+    log.debug("🎯 Generating PERSONALIZED recommendations for user %s...", user_id)
+    
+    # 🚦 Admission: full-catalog (map / with-poi) xếp sau explain / similar; shed -> 429 / 503 + Retry-After
+    ticket = await ADMISSION.acquire(ADMISSION.personalized_lane(request.n_recommendations))
     
     try:
         # Convert context to dict
         context = request.context.dict() if request.context else {}
         
+        # Budget còn lại sau phần đã tiêu (cache lookup, parse, queue wait) - None = không giới hạn
+        budget_ms = _request_budget_ms(request.budget_ms, http_request)
+        remaining_ms = None
+        if budget_ms is not None:
+            remaining_ms = max(budget_ms - (time.perf_counter() - request_started) * 1000, 1.0)
+        
         # Call model
-        recommendations = model.recommend_for_user(
+        recommend_info = {}
+        recommendations = await run_blocking(
+            model.recommend_for_user,
             user_id=user_id,
             n_recommendations=request.n_recommendations,
             exclude_items=request.exclude_items,
             use_location=request.use_location,
             radius_km=request.radius_km,
-            context=context
+            context=context,
+            budget_ms=remaining_ms,
+            info=recommend_info
         )
+        degraded = recommend_info.get('degraded', False)
         
-        print(f"✅ Generated {len(recommendations)} recommendations")
+        log.debug("✅ Generated %s recommendations", len(recommendations))
         
         # 🔥 FIX: Convert coordinates properly
+        serialization_started = time.perf_counter()
         response_recs = []
         for i, rec in enumerate(recommendations, 1):
             rec_dict = rec.copy()
@@ -768,12 +1049,15 @@ async def get_personalized_recommendations(request: PersonalizedRecommendRequest
             try:
                 response_recs.append(PersonalizedRecommendationResponse(**rec_dict))
             except Exception as e:
-                print(f"❌ Error creating response for {rec_dict['rentalId']}: {e}")
-                print(f"   rec_dict: {rec_dict}")
+                log.error(f"❌ Error creating response for {rec_dict['rentalId']}: {e}")
+                log.debug("   rec_dict: %s", rec_dict)
                 continue
         
+        record_stage('serialization', time.perf_counter() - serialization_started)
+        
         # Get user preferences
-        user_prefs = model.get_user_preferences(user_id)
+        with span('preference_lookup'):
+            user_prefs = model.get_user_preferences(user_id)
         user_prefs_response = None
         
         if user_prefs:
@@ -792,7 +1076,8 @@ async def get_personalized_recommendations(request: PersonalizedRecommendRequest
             'generated_at': datetime.now().isoformat(),
             'user_preferences': user_prefs_response.dict() if user_prefs_response else None
         }
-        set_to_cache(cache_key, result, ttl=3600)
+        if not degraded:
+            set_to_cache(cache_key, result, ttl=3600)
         
         return PersonalizedResultResponse(
             success=True,
@@ -807,14 +1092,18 @@ async def get_personalized_recommendations(request: PersonalizedRecommendRequest
                 'context_applied': bool(context),
                 'radius_km': request.radius_km,
                 'user_location_known': user_id in model.user_locations,
+                'degraded': degraded,
+                'budget_ms': budget_ms,
+                'completed_stages': recommend_info.get('completed_stages'),
+                'fallback': recommend_info.get('fallback'),
             }
         )
         
     except Exception as e:
-        print(f"❌ Error: {e}")
-        import traceback
-        traceback.print_exc()
+        log.error(f"❌ Error: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        ADMISSION.release(ticket)
 
 # ==================== API ENDPOINT: User Preferences ====================
 @app.get("/user-preferences/{userId}")
@@ -877,15 +1166,17 @@ async def explain_recommendation(
     if model is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
     
+    # 1. Generate recommendations (with caching)
+    cache_key = f"explain:{userId}:{rentalId}"
+    cached = get_from_cache(cache_key)
+    
+    if cached:
+        return cached
+    
+    ticket = await ADMISSION.acquire('interactive')
+    
     try:
-        # 1. Generate recommendations (with caching)
-        cache_key = f"explain:{userId}:{rentalId}"
-        cached = get_from_cache(cache_key)
-        
-        if cached:
-            return cached
-        
-        recs = model.recommend_for_user(userId, n_recommendations=100)
+        recs = await run_blocking(model.recommend_for_user, userId, n_recommendations=100)
         
         # 2. Find the rental
         matched_rec = next((r for r in recs if r['rentalId'] == rentalId), None)
@@ -990,8 +1281,10 @@ async def explain_recommendation(
         }
     
     except Exception as e:
-        print(f"❌ Error in explain_recommendation: {e}")
+        log.error(f"❌ Error in explain_recommendation: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        ADMISSION.release(ticket)
 
 # ==================== HELPER FUNCTIONS ====================
 
@@ -1419,7 +1712,7 @@ def _generate_fallback_explanation(userId: str, rentalId: str) -> dict:
         }
     
     except Exception as e:
-        print(f"❌ Fallback explanation error: {e}")
+        log.error(f"❌ Fallback explanation error: {e}")
         raise HTTPException(
             status_code=404,
             detail=f'Không thể tạo giải thích cho bài đăng {rentalId}'
@@ -1467,7 +1760,7 @@ async def get_similar_items(request: SimilarItemsRequest):
     cached_data = get_from_cache(cache_key)
     
     if cached_data:
-        print(f"✅ Cache HIT for rental {request.rentalId}")
+        log.debug("✅ Cache HIT for rental %s", request.rentalId)
         return RecommendationsResult(
             success=True,
             recommendations=[RecommendationResponse(**r) for r in cached_data['recommendations']],
@@ -1476,40 +1769,44 @@ async def get_similar_items(request: SimilarItemsRequest):
             generated_at=cached_data['generated_at']
         )
     
-    print(f"🔍 Finding similar items for rental {request.rentalId}...")
-    print(f"   Use location proximity: {request.use_location}")
+    log.debug("🔍 Finding similar items for rental %s...", request.rentalId)
+    log.debug("   Use location proximity: %s", request.use_location)
+    
+    ticket = await ADMISSION.acquire('interactive')
     
     try:
         fetch_count = request.n_recommendations * 3 if request.property_type else request.n_recommendations
         # Get recommendations from model
-        recommendations = model.recommend_similar_items(
+        recommendations = await run_blocking(
+            model.recommend_similar_items,
             item_id=request.rentalId,
             n_recommendations=fetch_count, 
             use_location=request.use_location
         )
         
-        print(f"✅ Model returned {len(recommendations)} recommendations")
+        log.debug("✅ Model returned %s recommendations", len(recommendations))
 
         if request.property_type:
             recommendations = [
                 r for r in recommendations
                 if model.item_features.get(r['rentalId'], {}).get('propertyType', '') == request.property_type
             ]
-            print(f"   After filter '{request.property_type}': {len(recommendations)} items")
+            log.debug("   After filter '%s': %s items", request.property_type, len(recommendations))
 
         recommendations = recommendations[:request.n_recommendations]
         # 🔥 DEBUG: Log sample before conversion
         if recommendations:
             sample = recommendations[0]
-            print(f"   Sample recommendation:")
-            print(f"     rentalId: {sample.get('rentalId')}")
-            print(f"     coordinates: {sample.get('coordinates')}")
-            print(f"     distance_km: {sample.get('distance_km')}")
+            log.debug("   Sample recommendation:")
+            log.debug("     rentalId: %s", sample.get('rentalId'))
+            log.debug("     coordinates: %s", sample.get('coordinates'))
+            log.debug("     distance_km: %s", sample.get('distance_km'))
         
         # 🔥 FIX: Convert with proper error handling
-        response_recs = _convert_to_response(recommendations)
+        with span('serialization'):
+            response_recs = _convert_to_response(recommendations)
         
-        print(f"✅ Converted to {len(response_recs)} response objects")
+        log.debug("✅ Converted to %s response objects", len(response_recs))
         
         # Cache the result
         result = {
@@ -1527,10 +1824,10 @@ async def get_similar_items(request: SimilarItemsRequest):
         )
         
     except Exception as e:
-        print(f"❌ Error finding similar items: {e}")
-        import traceback
-        traceback.print_exc()
+        log.error(f"❌ Error finding similar items: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        ADMISSION.release(ticket)
 
 @app.post("/recommend/popular", response_model=RecommendationsResult)
 async def get_popular_items(request: PopularItemsRequest):
@@ -1550,7 +1847,7 @@ async def get_popular_items(request: PopularItemsRequest):
     cached_data = get_from_cache(cache_key)
     
     if cached_data:
-        print(f"✅ Cache HIT for popular items")
+        log.debug("✅ Cache HIT for popular items")
         return RecommendationsResult(
             success=True,
             recommendations=[RecommendationResponse(**r) for r in cached_data['recommendations']],
@@ -1559,7 +1856,7 @@ async def get_popular_items(request: PopularItemsRequest):
             generated_at=cached_data['generated_at']
         )
     
-    print(f"🔍 Getting popular items...")
+    log.debug("🔍 Getting popular items...")
     
     try:
         recommendations = model.get_popular_items(
@@ -1567,7 +1864,8 @@ async def get_popular_items(request: PopularItemsRequest):
             exclude_items=request.exclude_items
         )
         
-        response_recs = _convert_to_response(recommendations)
+        with span('serialization'):
+            response_recs = _convert_to_response(recommendations)
         
         result = {
             'recommendations': [r.dict() for r in response_recs],
@@ -1584,7 +1882,7 @@ async def get_popular_items(request: PopularItemsRequest):
         )
         
     except Exception as e:
-        print(f"❌ Error getting popular items: {e}")
+        log.error(f"❌ Error getting popular items: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/cache/clear")
@@ -1607,6 +1905,21 @@ async def clear_cache(pattern: str = "ml:recommend:*"):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# memory_report() đi hết catalog / dict (deep_sizeof) -> chỉ tính 1 lần cho mỗi model;
+# tính lại khi model đổi (shared model refresh) hoặc có component lazy vừa load vào RAM
+_memory_report_cache = {'model': None, 'lazy_state': None, 'report': None}
+
+
+def cached_memory_report(current_model):
+    lazy_state = tuple(sorted((name, info['loaded']) for name, info in current_model.lazy_components.items()))
+    cached = _memory_report_cache
+    cached_model = cached['model']() if cached['model'] is not None else None
+    if cached_model is not current_model or cached['lazy_state'] != lazy_state:
+        cached.update(model=weakref.ref(current_model), lazy_state=lazy_state,
+                      report=current_model.memory_report())
+    return cached['report']
+
+
 @app.get("/model/info")
 async def get_model_info():
     """Get information about the loaded model - including geographic data"""
@@ -1614,19 +1927,29 @@ async def get_model_info():
     if model is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
     
+    # Số user/item/interaction của matrix - model lazy chưa load matrix thì lấy từ manifest / catalog
+    # (không kéo cả user_item_matrix vào RAM chỉ vì 1 lần gọi monitoring)
+    stats = model.matrix_stats()
+    n_users, n_items, nnz = stats['n_users'], stats['n_items'], stats['n_interactions']
+    sparsity = model.matrix_sparsity if nnz is None else 100 * (1 - nnz / max(n_users * n_items, 1))
+    
     return {
         "success": True,
         "info": {
-            "n_users": len(model.user_encoder.classes_),
-            "n_items": len(model.item_encoder.classes_),
-            "n_interactions": model.user_item_matrix.nnz if model.user_item_matrix else 0,
-            "matrix_sparsity": f"{100 * (1 - model.user_item_matrix.nnz / (len(model.user_encoder.classes_) * len(model.item_encoder.classes_))):.2f}%" if model.user_item_matrix else "N/A",
+            "n_users": n_users,
+            "n_items": n_items,
+            "n_interactions": nnz,
+            "matrix_sparsity": f"{sparsity:.2f}%",
+            "matrix_stats_source": stats['source'],
             "n_popular_items": len(model.popularity_scores),
             "geographic_features": {
                 "rental_coordinates_stored": len(model.rental_coordinates),
                 "user_locations_calculated": len(model.user_locations),
                 "geographic_recommendations_enabled": True
-            }
+            },
+            # Dung lượng từng component trong RAM + size artifact + peak tracemalloc (cache theo model)
+            "memory": cached_memory_report(model),
+            "shared_model": shared_model.info() if shared_model is not None else None
         }
     }
 
@@ -1637,21 +1960,23 @@ async def get_coordinates_stats():
     if model is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
     
-    # Count valid coordinates
-    valid_rental_coords = len([
-        (k, v) for k, v in model.rental_coordinates.items()
-        if v[0] != 0 and v[1] != 0
-    ])
+    # Count valid coordinates (vectorized trên item catalog)
+    valid_rental_coords = model.item_catalog.valid_coordinates_count()
+    # matrix_stats(): không load user_item_matrix khi đang lazy (MODEL_LAZY=1)
+    n_items = model.matrix_stats()['n_items']
+    # Coverage: tử số và mẫu số cùng đếm trên item catalog (catalog có cả rental chưa có interaction)
+    n_catalog = len(model.item_catalog)
     
     return {
         "success": True,
         "stats": {
-            "total_rentals": len(model.item_encoder.classes_),
+            "total_rentals": n_items,
+            "catalog_rentals": n_catalog,
             "rentals_with_coordinates": len(model.rental_coordinates),
             "rentals_with_valid_coordinates": valid_rental_coords,
-            "coverage_percentage": f"{100 * valid_rental_coords / len(model.item_encoder.classes_):.2f}%",
+            "coverage_percentage": f"{100 * valid_rental_coords / max(n_catalog, 1):.2f}%",
             "users_with_location_calculated": len(model.user_locations),
-            "geographic_features_ready": valid_rental_coords > len(model.item_encoder.classes_) * 0.8
+            "geographic_features_ready": valid_rental_coords > n_catalog * 0.8
         }
     }
 
@@ -1661,6 +1986,8 @@ if __name__ == "__main__":
     import uvicorn
     
     port = int(os.getenv('PORT', 8001))
+    # WORKERS > 1: chạy kèm MODEL_SHARED=1 để các worker dùng chung 1 bản model (reload tắt khi nhiều worker)
+    workers = int(os.getenv('WORKERS', 1))
     
     print("\n" + "="*70)
     print("🚀 STARTING FASTAPI SERVER WITH GEOGRAPHIC FEATURES")
@@ -1674,6 +2001,7 @@ if __name__ == "__main__":
         "main:app",
         host="0.0.0.0",
         port=port,
-        reload=True,
+        reload=workers == 1,
+        workers=workers,
         log_level="info"
     )
\ No newline at end of file
@@ -1,13 +1,21 @@
 import os
+import sys
 import json
+import logging
 from typing import List, Dict, Any, Optional
-from groq import Groq
 from datetime import datetime
 from dotenv import load_dotenv
 import re
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from instrumentation import span, get_logger
+
 load_dotenv()
 
+log = get_logger('chat')
+
+# groq import khi chat lần đầu (RentalChatAssistant.client): không nằm trong import / startup của API
+
 class RentalChatAssistant:
     """
     🤖 Enhanced AI Chat Assistant với Groq - ANTI-HALLUCINATION
@@ -17,17 +25,14 @@ class RentalChatAssistant:
     """
     
     def __init__(self, model: Any = None):
-        """Initialize Groq client"""
+        """Initialize assistant (Groq client tạo lazy ở lần chat đầu tiên)"""
         api_key = os.getenv('GROQ_API_KEY')
         
         if not api_key:
             raise ValueError("❌ GROQ_API_KEY not found in .env file!")
         
-        try:
-            self.client = Groq(api_key=api_key)
-            print(f"✅ Groq client initialized successfully")
-        except Exception as e:
-            raise ValueError(f"Groq client initialization failed: {e}")
+        self._api_key = api_key
+        self._client = None
         
         self.model = model
         self.chat_model = os.getenv('GROQ_MODEL', 'llama-3.3-70b-versatile')
@@ -38,6 +43,23 @@ class RentalChatAssistant:
         print(f"   Model: {self.chat_model}")
         print(f"   ML Model loaded: {self.model is not None}")
     
+    @property
+    def client(self):
+        """Groq client - import groq + tạo client khi được dùng lần đầu"""
+        if self._client is None:
+            try:
+                from groq import Groq
+                self._client = Groq(api_key=self._api_key)
+                print(f"✅ Groq client initialized successfully")
+            except Exception as e:
+                raise ValueError(f"Groq client initialization failed: {e}")
+        return self._client
+    
+    @client.setter
+    def client(self, client):
+        # benchmarks/load_test.py thay bằng FakeGroq
+        self._client = client
+    
     def _get_system_prompt(self) -> str:
         """Enhanced system prompt - ANTI-HALLUCINATION"""
         return """Bạn là trợ lý AI chuyên nghiệp về bất động sản cho thuê tại Việt Nam.
@@ -129,29 +151,31 @@ LÀM ĐÚNG THẾ NÀY!"""
             
             messages.append({"role": "user", "content": user_message})
             
-            print(f"\n🤖 [GROQ] Processing chat...")
-            print(f"   User: {user_message[:100]}...")
+            log.debug("\n🤖 [GROQ] Processing chat...")
+            log.debug("   User: %s...", user_message[:100])
             
             # Call Groq API với temperature THẤP
-            response = self.client.chat.completions.create(
-                model=self.chat_model,
-                messages=messages,
-                temperature=self.temperature,  # 0.3 để ổn định
-                max_tokens=self.max_tokens,
-                top_p=0.9,  # 🔥 Giảm randomness
-            )
+            with span('groq'):
+                response = self.client.chat.completions.create(
+                    model=self.chat_model,
+                    messages=messages,
+                    temperature=self.temperature,  # 0.3 để ổn định
+                    max_tokens=self.max_tokens,
+                    top_p=0.9,  # 🔥 Giảm randomness
+                )
             
             ai_message = response.choices[0].message.content
             
             # 🔥 POST-PROCESSING: Kiểm tra hallucination
             ai_message = self._prevent_hallucination(ai_message, user_message)
             
-            print(f"   AI: {ai_message[:100]}...")
+            log.debug("   AI: %s...", ai_message[:100])
             
             # Extract preferences
-            preferences = self._extract_preferences_enhanced(user_message, ai_message)
-            intent = self._classify_intent(user_message)
-            should_recommend = self._should_recommend(user_message, ai_message, preferences)
+            with span('preference_extraction'):
+                preferences = self._extract_preferences_enhanced(user_message, ai_message)
+                intent = self._classify_intent(user_message)
+                should_recommend = self._should_recommend(user_message, ai_message, preferences)
             
             return {
                 'message': ai_message,
@@ -166,9 +190,7 @@ LÀM ĐÚNG THẾ NÀY!"""
             }
             
         except Exception as e:
-            print(f"❌ Error in chat: {e}")
-            import traceback
-            traceback.print_exc()
+            log.error(f"❌ Error in chat: {e}", exc_info=True)
             return {
                 'message': "Xin lỗi, tôi gặp chút vấn đề. Bạn có thể thử lại không?",
                 'intent': 'error',
@@ -197,7 +219,7 @@ LÀM ĐÚNG THẾ NÀY!"""
         )
         
         if is_hallucinating:
-            print("⚠️ DETECTED HALLUCINATION! Replacing with safe response...")
+            log.info("⚠️ DETECTED HALLUCINATION! Replacing with safe response...")
             
             # Extract preferences từ user message
             prefs = self._extract_preferences_enhanced(user_message, "")
@@ -282,7 +304,7 @@ LÀM ĐÚNG THẾ NÀY!"""
                 max_price = float(m.group(2)) * unit
                 preferences['price_range'] = {'min': int(min_price), 'max': int(max_price)}
                 price_found = True
-                print(f"   💰 Range price: {min_price/1e6:.1f}M - {max_price/1e6:.1f}M")
+                log.debug("   💰 Range price: %.1fM - %.1fM", min_price/1e6, max_price/1e6)
                 break
 
         # --- Dạng giới hạn: dưới/trên/khoảng ---
@@ -330,7 +352,7 @@ LÀM ĐÚNG THẾ NÀY!"""
                     
                     preferences['price_range'] = {'min': int(min_p), 'max': int(max_p)}
                     price_found = True
-                    print(f"   💰 {price_type} price ({value/1e6:.1f}M): {min_p/1e6:.1f}M - {max_p/1e6:.1f}M")
+                    log.debug("   💰 %s price (%.1fM): %.1fM - %.1fM", price_type, value/1e6, min_p/1e6, max_p/1e6)
                     break
         
         # ===== 2. LOCATION EXTRACTION =====
@@ -349,14 +371,14 @@ LÀM ĐÚNG THẾ NÀY!"""
         for city in cities:
             if city in msg_lower:
                 preferences['location'] = city.title()
-                print(f"   📍 Extracted location: {city.title()}")
+                log.debug("   📍 Extracted location: %s", city.title())
                 break
         
         if 'location' not in preferences:
             for district in districts:
                 if district in msg_lower:
                     preferences['location'] = district.title()
-                    print(f"   📍 Extracted district: {district.title()}")
+                    log.debug("   📍 Extracted district: %s", district.title())
                     break
         
         # ===== 3. PROPERTY TYPE EXTRACTION - EXPANDED =====
@@ -373,7 +395,7 @@ LÀM ĐÚNG THẾ NÀY!"""
         for ptype, keywords in property_types.items():
             if any(kw in msg_lower for kw in keywords):
                 preferences['property_type'] = ptype
-                print(f"   🏠 Extracted property type: {ptype}")
+                log.debug("   🏠 Extracted property type: %s", ptype)
                 break
         
         # ===== 4. AREA EXTRACTION =====
@@ -387,7 +409,7 @@ LÀM ĐÚNG THẾ NÀY!"""
             if match:
                 area = int(match.group(1))
                 preferences['area'] = area
-                print(f"   📐 Extracted area: {area}m²")
+                log.debug("   📐 Extracted area: %sm²", area)
                 break
         
         # ===== 5. ROOMS EXTRACTION =====
@@ -401,7 +423,7 @@ LÀM ĐÚNG THẾ NÀY!"""
             if match:
                 bedrooms = int(match.group(1))
                 preferences['bedrooms'] = bedrooms
-                print(f"   🛏️ Extracted bedrooms: {bedrooms}")
+                log.debug("   🛏️ Extracted bedrooms: %s", bedrooms)
                 break
         
         # ===== 6. AMENITIES EXTRACTION =====
@@ -422,7 +444,7 @@ LÀM ĐÚNG THẾ NÀY!"""
         
         if detected_amenities:
             preferences['amenities'] = detected_amenities
-            print(f"   ✨ Extracted amenities: {', '.join(detected_amenities)}")
+            log.debug("   ✨ Extracted amenities: %s", ', '.join(detected_amenities))
         
         # ===== 7. SEARCH RADIUS =====
         if 'location' in preferences:
@@ -436,14 +458,14 @@ LÀM ĐÚNG THẾ NÀY!"""
         if location_intent['wants_nearby']:
             preferences['wants_nearby_location'] = True
             preferences['needs_user_location'] = location_intent['needs_user_location']
-            print(f"   📍 Location intent detected: nearby search")
+            log.debug("   📍 Location intent detected: nearby search")
         
         # ===== 10. POI INTENT - NEW =====
         poi_intent = self._extract_poi_from_message(user_msg)
         if poi_intent['has_poi_intent']:
             preferences['poi_categories'] = poi_intent['categories']
             preferences['wants_poi_filter'] = True
-            print(f"   🏢 POI categories detected: {', '.join(poi_intent['categories'])}")
+            log.debug("   🏢 POI categories detected: %s", ', '.join(poi_intent['categories']))
         
         # Validate price range
         if 'price_range' in preferences:
@@ -451,7 +473,7 @@ LÀM ĐÚNG THẾ NÀY!"""
             if pr['max'] > 0 and pr['min'] >= pr['max']:
                 pr['min'] = 0
             # Log để debug
-            print(f"   ✅ Final price_range: {pr['min']/1e6:.1f}M - {pr['max']/1e6:.1f}M")
+            log.debug("   ✅ Final price_range: %.1fM - %.1fM", pr['min']/1e6, pr['max']/1e6)
 
         return preferences
     
@@ -520,8 +542,9 @@ LÀM ĐÚNG THẾ NÀY!"""
                     'total': 0
                 }
             
-            print(f"\n🎯 Getting recommendations with preferences:")
-            print(f"   {json.dumps(preferences, indent=2, ensure_ascii=False)}")
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("\n🎯 Getting recommendations with preferences:")
+                log.debug("   %s", json.dumps(preferences, indent=2, ensure_ascii=False))
             
             # Call ML model
             ml_recommendations = self.model.recommend_for_user(
@@ -547,7 +570,7 @@ LÀM ĐÚNG THẾ NÀY!"""
             }
             
         except Exception as e:
-            print(f"❌ Error: {e}")
+            log.error(f"❌ Error: {e}")
             return {
                 'recommendations': [],
                 'explanation': str(e),
@@ -569,7 +592,7 @@ LÀM ĐÚNG THẾ NÀY!"""
                 r for r in filtered 
                 if pr['min'] <= self.model.item_features.get(r['rentalId'], {}).get('price', 0) <= pr['max']
             ]
-            print(f"   💰 Price filter: {len(filtered)} rentals remain")
+            log.debug("   💰 Price filter: %s rentals remain", len(filtered))
         
         # Property type filter
         if preferences.get('property_type') and self.model:
@@ -578,7 +601,7 @@ LÀM ĐÚNG THẾ NÀY!"""
                 r for r in filtered
                 if ptype in self.model.item_features.get(r['rentalId'], {}).get('propertyType', '').lower()
             ]
-            print(f"   🏠 Property type filter: {len(filtered)} rentals remain")
+            log.debug("   🏠 Property type filter: %s rentals remain", len(filtered))
         
         # Area filter
         if preferences.get('area') and self.model:
@@ -588,7 +611,7 @@ LÀM ĐÚNG THẾ NÀY!"""
                 r for r in filtered
                 if min_area <= self.model.item_features.get(r['rentalId'], {}).get('area', 0) <= max_area
             ]
-            print(f"   📐 Area filter: {len(filtered)} rentals remain")
+            log.debug("   📐 Area filter: %s rentals remain", len(filtered))
         
         return filtered
 
@@ -0,0 +1,249 @@
+"""
+🔬 ON-DEMAND PROFILING - Profile request thật trên production
+
+Cách bật (admin-only, cần ML_ADMIN_TOKEN):
+    curl -H "X-Admin-Token: $ML_ADMIN_TOKEN" -H "X-Profile: sampling" \\
+         -X POST http://localhost:8001/recommend/personalized -d '{...}'
+    # hoặc query: ?profile=cprofile  (vẫn cần header X-Admin-Token)
+
+- sampling: thread phụ đọc stack của event-loop thread mỗi ML_PROFILE_INTERVAL_MS,
+  xuất collapsed stacks (flamegraph.pl / speedscope đọc trực tiếp)
+- cprofile: deterministic, xuất bảng pstats (top theo cumulative time)
+- Rolling: ML_PROFILE_EVERY_N=N -> tự profile 1/N request (ML_PROFILE_ROLLING_MODE)
+
+Kết quả lưu trong ring buffer (ML_PROFILE_BUFFER), đọc qua /admin/profiles.
+Mỗi lúc chỉ 1 request được profile (cProfile/setprofile là per-thread và
+mọi endpoint async chạy chung event-loop thread).
+"""
+import os
+import io
+import sys
+import hmac
+import time
+import uuid
+import pstats
+import cProfile
+import threading
+from collections import deque, Counter as StackCounter
+from datetime import datetime
+from typing import Optional, Dict, Any
+
+PROFILE_MODES = ('sampling', 'cprofile')
+
+# Chỉ profile endpoint "nặng" - không profile /metrics, /health, /admin
+PROFILED_PREFIXES = ('/recommend', '/chat', '/user-preferences')
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+# ==================== SAMPLING PROFILER ====================
+
+class SamplingProfiler:
+    """Sample stack của 1 thread bằng sys._current_frames() -> collapsed stacks"""
+
+    def __init__(self, thread_id: int, interval: float = 0.002, max_depth: int = 128):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = StackCounter()
+        self.n_samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _frame_label(frame) -> str:
+        code = frame.f_code
+        filename = os.path.basename(code.co_filename)
+        return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+    def _sample_once(self):
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+
+        labels = []
+        while frame is not None and len(labels) < self.max_depth:
+            labels.append(self._frame_label(frame))
+            frame = frame.f_back
+
+        # Root trước, leaf sau (định dạng collapsed của flamegraph)
+        self.stacks[';'.join(reversed(labels))] += 1
+        self.n_samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample_once()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='ml-sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def collapsed(self) -> str:
+        return '\n'.join(f'{stack} {count}' for stack, count in self.stacks.most_common())
+
+
+# ==================== PROFILE SESSION ====================
+
+class ProfileSession:
+    """1 lần profile cho 1 request"""
+
+    def __init__(self, mode: str, trigger: str, method: str, path: str, request_id: Optional[str],
+                 interval: float):
+        self.id = uuid.uuid4().hex[:12]
+        self.mode = mode
+        self.trigger = trigger  # on_demand | rolling
+        self.method = method
+        self.path = path
+        self.request_id = request_id
+        self.interval = interval
+        self.started_at = datetime.now()
+        self._started = None
+        self._sampler: Optional[SamplingProfiler] = None
+        self._cprofile: Optional[cProfile.Profile] = None
+        self.duration_ms = 0.0
+        self.status = None
+        self.collapsed = ''
+        self.stats_text = ''
+        self.n_samples = 0
+
+    def start(self):
+        self._started = time.perf_counter()
+        if self.mode == 'cprofile':
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        else:
+            self._sampler = SamplingProfiler(threading.get_ident(), interval=self.interval)
+            self._sampler.start()
+
+    def stop(self, status: Optional[int]):
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        if self._sampler is not None:
+            self._sampler.stop()
+
+        self.duration_ms = (time.perf_counter() - self._started) * 1000
+        self.status = status
+
+        if self._cprofile is not None:
+            buffer = io.StringIO()
+            stats = pstats.Stats(self._cprofile, stream=buffer)
+            stats.sort_stats('cumulative').print_stats(40)
+            self.stats_text = buffer.getvalue()
+            self._cprofile = None
+
+        if self._sampler is not None:
+            self.collapsed = self._sampler.collapsed()
+            self.n_samples = self._sampler.n_samples
+            self._sampler = None
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'mode': self.mode,
+            'trigger': self.trigger,
+            'method': self.method,
+            'path': self.path,
+            'request_id': self.request_id,
+            'status': self.status,
+            'started_at': self.started_at.isoformat(),
+            'duration_ms': round(self.duration_ms, 2),
+            'n_samples': self.n_samples,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = self.summary()
+        data['collapsed'] = self.collapsed
+        data['stats'] = self.stats_text
+        return data
+
+
+# ==================== REQUEST PROFILER ====================
+
+class RequestProfiler:
+    """Quyết định request nào được profile + giữ ring buffer kết quả"""
+
+    def __init__(self):
+        self.admin_token = os.getenv('ML_ADMIN_TOKEN', '')
+        self.every_n = max(_env_int('ML_PROFILE_EVERY_N', 0), 0)
+        self.rolling_mode = os.getenv('ML_PROFILE_ROLLING_MODE', 'sampling').lower()
+        if self.rolling_mode not in PROFILE_MODES:
+            self.rolling_mode = 'sampling'
+        self.interval = max(_env_int('ML_PROFILE_INTERVAL_MS', 2), 1) / 1000.0
+
+        self.profiles = deque(maxlen=max(_env_int('ML_PROFILE_BUFFER', 50), 1))
+        self._busy = threading.Lock()
+        self._counter = 0
+        self._counter_lock = threading.Lock()
+
+    def is_admin(self, token: Optional[str]) -> bool:
+        """So sánh constant-time; không có ML_ADMIN_TOKEN thì tắt hẳn on-demand"""
+        if not self.admin_token or not token:
+            return False
+        return hmac.compare_digest(token.encode(), self.admin_token.encode())
+
+    def _rolling_due(self) -> bool:
+        if self.every_n <= 0:
+            return False
+        with self._counter_lock:
+            self._counter += 1
+            return self._counter % self.every_n == 0
+
+    def requested_mode(self, path: str, headers, query_params) -> Optional[tuple]:
+        """(mode, trigger) nếu request này cần profile, ngược lại None"""
+        if not path.startswith(PROFILED_PREFIXES):
+            return None
+
+        requested = (headers.get('x-profile') or query_params.get('profile') or '').lower()
+        if requested:
+            if requested in ('1', 'true', 'yes'):
+                requested = 'sampling'
+            if requested in PROFILE_MODES and self.is_admin(headers.get('x-admin-token')):
+                return requested, 'on_demand'
+
+        if self._rolling_due():
+            return self.rolling_mode, 'rolling'
+
+        return None
+
+    def begin(self, mode: str, trigger: str, method: str, path: str,
+              request_id: Optional[str]) -> Optional[ProfileSession]:
+        """Bắt đầu profile; None nếu đang có request khác được profile"""
+        if not self._busy.acquire(blocking=False):
+            return None
+
+        try:
+            session = ProfileSession(mode, trigger, method, path, request_id, self.interval)
+            session.start()
+        except Exception:
+            self._busy.release()
+            raise
+        return session
+
+    def finish(self, session: ProfileSession, status: Optional[int]):
+        try:
+            session.stop(status)
+            self.profiles.append(session)
+        finally:
+            self._busy.release()
+
+    def list(self):
+        return [p.summary() for p in reversed(self.profiles)]
+
+    def get(self, profile_id: str) -> Optional[ProfileSession]:
+        for profile in self.profiles:
+            if profile.id == profile_id:
+                return profile
+        return None
+
+
+PROFILER = RequestProfiler()
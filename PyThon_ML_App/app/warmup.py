@@ -0,0 +1,342 @@
+"""
+🔥 WARM-UP - Trả trước chi phí lazy của request đầu tiên, chạy xong mới báo /ready
+
+Sau khi lifespan load model, request đầu tiên vẫn phải trả: page fault lần đầu trên array memory-map
+(MODEL_SHARED / MODEL_LAZY), copy component lazy vào RAM, build OpenAPI / JSON schema của Pydantic model,
+mở connection Redis, code path chưa chạy lần nào. Warm-up chạy nền ngay sau startup
+(event loop vẫn trả /health), gồm các stage:
+
+1. touch:     đọc 1 byte mỗi page của mọi array memory-map (matrix, similarity, catalog, id table)
+2. popular:   popularity_order của catalog (đã sort sẵn lúc load) + get_popular_items
+3. openapi:   app.openapi() - build schema của mọi request / response model
+4. requests:  WARMUP_ROUNDS lượt request giả qua ASGI (không qua network) tới từng endpoint recommend
+5. prefetch:  WARMUP_PREFETCH_USERS=N -> /recommend/personalized cho N user nhiều interaction nhất
+              (ranking nằm sẵn trong Redis cache, dùng chung cho mọi worker)
+
+Model lazy (MODEL_LAZY=1): request giả tới endpoint nào thì load component lazy của endpoint đó
+(personalized / explain: user_item_matrix + user_similarity, similar: user_item_matrix + item_similarity).
+Mặc định (WARMUP_ENDPOINTS=auto) chỉ warm endpoint có mọi component đã load (MODEL_PRELOAD) -> worker
+tách theo loại traffic giữ được cold start / RAM của lazy load; đổi lại request đầu tiên của endpoint
+bị bỏ qua vẫn trả chi phí load. Stage touch cũng bỏ qua component chưa load.
+WARMUP_ENDPOINTS=personalized,similar,... -> warm đúng các endpoint đó (chấp nhận load component).
+Prefetch luôn cần user_item_matrix + user_similarity.
+
+Request warm-up gắn header X-Warmup: 1 -> không tính vào ml_request_duration_seconds / profiling.
+Warm-up lỗi không chặn readiness (state 'failed', lỗi nằm trong /ready).
+
+Env:
+    WARMUP=0                    tắt (ready ngay khi model load xong)
+    WARMUP_TOUCH=0              bỏ stage touch
+    WARMUP_ROUNDS=2             số lượt request giả mỗi endpoint (0 = bỏ stage requests)
+    WARMUP_PREFETCH_USERS=0     số user prefetch ranking
+    WARMUP_ENDPOINTS=auto       auto | danh sách trong personalized,similar,popular,explain,user-preferences
+"""
+import os
+import sys
+import json
+import mmap
+import time
+import types
+import asyncio
+from datetime import datetime
+from urllib.parse import urlencode
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from training.preaggregate import ANONYMOUS_USER_IDS
+
+WARMUP_HEADER = 'x-warmup'
+
+# Component lazy (LAZY_COMPONENTS của training/train_model.py) mà request giả của mỗi endpoint đọc
+ENDPOINT_COMPONENTS = {
+    'personalized': ('user_item_matrix', 'user_similarity'),
+    'similar': ('user_item_matrix', 'item_similarity'),
+    'popular': (),
+    'explain': ('user_item_matrix', 'user_similarity'),
+    'user-preferences': (),
+}
+
+_OPAQUE = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType)
+
+
+def _env_flag(name: str, default: bool) -> bool:
+    return os.getenv(name, '1' if default else '0').lower() in ('1', 'true', 'yes')
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_endpoints(name: str):
+    raw = os.getenv(name, 'auto').strip().lower()
+    if raw in ('', 'auto'):
+        return 'auto'
+    endpoints = [part.strip() for part in raw.split(',') if part.strip()]
+    unknown = set(endpoints) - set(ENDPOINT_COMPONENTS)
+    if unknown:
+        print(f"⚠️ {name}: unknown endpoints {sorted(unknown)} (chọn trong {', '.join(ENDPOINT_COMPONENTS)})")
+    return endpoints
+
+
+# ==================== RAW ASGI CLIENT ====================
+
+async def asgi_request(app, method, path, query=None, body=None, headers=None):
+    """1 HTTP request qua ASGI interface -> (status, headers, body_bytes)"""
+    payload = json.dumps(body).encode() if body is not None else b''
+    raw_headers = [(b'host', b'localhost'), (b'content-length', str(len(payload)).encode())]
+    if body is not None:
+        raw_headers.append((b'content-type', b'application/json'))
+    for key, value in (headers or {}).items():
+        raw_headers.append((key.lower().encode(), value.encode()))
+
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': urlencode(query or {}).encode(),
+        'root_path': '',
+        'headers': raw_headers,
+        'client': ('127.0.0.1', 50000),
+        'server': ('localhost', 80),
+    }
+
+    request_sent = False
+    response = {'status': 0, 'headers': [], 'body': bytearray()}
+    done = asyncio.Event()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {'type': 'http.request', 'body': payload, 'more_body': False}
+        await done.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+            response['headers'] = message.get('headers', [])
+        elif message['type'] == 'http.response.body':
+            response['body'].extend(message.get('body', b''))
+            if not message.get('more_body', False):
+                done.set()
+
+    await app(scope, receive, send)
+    return response['status'], response['headers'], bytes(response['body'])
+
+
+# ==================== MODEL ====================
+
+def _is_memory_mapped(array):
+    base = array
+    while isinstance(base, np.ndarray):
+        if isinstance(base, np.memmap):
+            return True
+        base = base.base
+    return isinstance(base, mmap.mmap)
+
+
+def _collect_mapped(obj, found, seen):
+    """Mọi ndarray memory-map mà obj giữ (dict, list, sparse, catalog, IdTable, QuantizedCSR, ...)"""
+    if id(obj) in seen or obj is None or isinstance(obj, _OPAQUE):
+        return
+    seen.add(id(obj))
+    if isinstance(obj, np.ndarray):
+        if _is_memory_mapped(obj):
+            found.append(obj)
+        return
+    if hasattr(obj, 'memory_usage') and hasattr(obj, 'columns'):
+        return  # pandas DataFrame: không bao giờ memory-map
+    if isinstance(obj, dict):
+        for value in obj.values():
+            _collect_mapped(value, found, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for value in obj:
+            _collect_mapped(value, found, seen)
+    elif hasattr(obj, '__dict__'):
+        _collect_mapped(vars(obj), found, seen)
+
+
+def touch_memory_mapped(model):
+    """Đọc 1 byte mỗi page của array memory-map -> page nằm sẵn trong page cache -> {'arrays', 'bytes'}"""
+    arrays = []
+    # Component lazy chưa load (_pending_components) không touch: đó là phần worker chọn không dùng
+    state = {key: value for key, value in vars(model).items() if key != '_pending_components'}
+    _collect_mapped(state, arrays, set())
+    touched = 0
+    for array in arrays:
+        flat = array.reshape(-1)
+        if flat.size == 0:
+            continue
+        if not flat.flags.c_contiguous:
+            flat = np.ascontiguousarray(flat)  # copy = đã đọc hết
+        int(flat.view(np.uint8)[::mmap.PAGESIZE].sum())
+        touched += flat.nbytes
+    return {'arrays': len(arrays), 'bytes': int(touched)}
+
+
+def warm_popular(model, n_recommendations=50):
+    """popularity_order (thứ tự sort sẵn trong ItemCatalog) + 1 lượt get_popular_items"""
+    order = model.item_catalog.popularity_order
+    int(np.asarray(order).sum())
+    return {'items': int(len(order)), 'returned': len(model.get_popular_items(n_recommendations))}
+
+
+def component_loaded(model, name):
+    """Component đã nằm trong RAM (model load thường / đã load lazy / MODEL_PRELOAD)"""
+    return model.lazy_components.get(name, {}).get('loaded', True)
+
+
+def warm_endpoints(model, requested='auto'):
+    """(endpoint được warm, endpoint bỏ qua vì cần component lazy chưa load); requested = danh sách -> giữ nguyên"""
+    if requested != 'auto':
+        return [name for name in ENDPOINT_COMPONENTS if name in requested], []
+    warmed, skipped = [], []
+    for name, components in ENDPOINT_COMPONENTS.items():
+        (warmed if all(component_loaded(model, c) for c in components) else skipped).append(name)
+    return warmed, skipped
+
+
+def most_active_users(model, n):
+    """N userId nhiều interaction nhất (nnz hàng của user_item_matrix), bỏ user anonymous"""
+    matrix = model.user_item_matrix
+    if n <= 0 or matrix is None or matrix.shape[0] == 0:
+        return []
+    counts = np.diff(matrix.indptr)
+    rows = np.argsort(-counts, kind='stable')[:n + len(ANONYMOUS_USER_IDS)]
+    users = [u for u in model.user_catalog.user_ids.ids_at(rows) if u not in ANONYMOUS_USER_IDS]
+    return users[:n]
+
+
+def warm_model(model):
+    """Stage không cần app (touch + popular) - dùng cả khi đổi sang shared model version mới"""
+    stages = {}
+    for name, run in (('touch', touch_memory_mapped), ('popular', warm_popular)):
+        started = time.perf_counter()
+        stages[name] = run(model)
+        stages[name]['seconds'] = round(time.perf_counter() - started, 4)
+    return stages
+
+
+# ==================== WARM-UP STATE ====================
+
+class WarmUp:
+    """State warm-up của process: pending -> running -> done | failed (hoặc disabled)"""
+
+    def __init__(self, enabled=True, touch=True, rounds=2, prefetch_users=0, endpoints='auto'):
+        self.enabled = enabled
+        self.touch = touch
+        self.rounds = max(rounds, 0)
+        self.prefetch_users = max(prefetch_users, 0)
+        self.endpoints = endpoints  # 'auto' hoặc list tên trong ENDPOINT_COMPONENTS
+        self.state = 'pending' if enabled else 'disabled'
+        self.stages = {}
+        self.error = None
+        self.started_at = None
+        self.seconds = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            enabled=_env_flag('WARMUP', True),
+            touch=_env_flag('WARMUP_TOUCH', True),
+            rounds=_env_int('WARMUP_ROUNDS', 2),
+            prefetch_users=_env_int('WARMUP_PREFETCH_USERS', 0),
+            endpoints=_env_endpoints('WARMUP_ENDPOINTS'),
+        )
+
+    @property
+    def ready(self):
+        return self.state in ('done', 'failed', 'disabled')
+
+    def status(self):
+        return {
+            'state': self.state,
+            'started_at': self.started_at,
+            'seconds': self.seconds,
+            'stages': self.stages,
+            'error': self.error,
+        }
+
+    async def _stage(self, name, run):
+        started = time.perf_counter()
+        result = await run()
+        self.stages[name] = dict(result or {}, seconds=round(time.perf_counter() - started, 4))
+        print(f"   🔥 warm-up {name:<9} {self.stages[name]['seconds']:.3f}s")
+
+    async def run(self, app, model):
+        """Chạy mọi stage (model CPU-bound trong thread, request qua ASGI trên event loop)"""
+        if not self.enabled:
+            return
+        self.state = 'running'
+        self.started_at = datetime.now().isoformat()
+        started = time.perf_counter()
+        try:
+            if self.touch:
+                await self._stage('touch', lambda: asyncio.to_thread(touch_memory_mapped, model))
+            await self._stage('popular', lambda: asyncio.to_thread(warm_popular, model))
+            await self._stage('openapi', lambda: asyncio.to_thread(lambda: {'paths': len(app.openapi()['paths'])}))
+            if self.rounds:
+                await self._stage('requests', lambda: self._synthetic_requests(app, model))
+            if self.prefetch_users:
+                await self._stage('prefetch', lambda: self._prefetch(app, model))
+            self.state = 'done'
+        except Exception as e:
+            self.state = 'failed'
+            self.error = str(e)
+            print(f"⚠️ Warm-up failed: {e}")
+        finally:
+            self.seconds = round(time.perf_counter() - started, 4)
+        print(f"✅ Warm-up {self.state} in {self.seconds:.2f}s")
+
+    async def _synthetic_requests(self, app, model):
+        """WARMUP_ROUNDS lượt qua từng endpoint được warm với user / rental có thật trong model"""
+        warmed, skipped = warm_endpoints(model, self.endpoints)
+        if skipped:
+            print(f"   🔥 warm-up skips {', '.join(skipped)} (lazy components not loaded, see WARMUP_ENDPOINTS)")
+        # most_active_users đọc user_item_matrix -> model lazy chưa load matrix thì lấy user đầu catalog
+        if component_loaded(model, 'user_item_matrix'):
+            users = most_active_users(model, 1)
+        else:
+            users = [u for u in model.user_catalog.user_ids.ids_at(range(min(len(model.user_catalog.user_ids), 2)))
+                     if u not in ANONYMOUS_USER_IDS]
+        users = users or ['warmup-cold-start-user']
+        catalog = model.item_catalog
+        rental_id = catalog.id_at(int(catalog.popularity_order[0])) if len(catalog.popularity_order) \
+            else (catalog.rental_ids.id_at(0) if len(catalog) else 'warmup-unknown-rental')
+        requests = {
+            'personalized': ('POST', '/recommend/personalized', None, {'userId': users[0]}),
+            'similar': ('POST', '/recommend/similar', None, {'rentalId': rental_id}),
+            'popular': ('POST', '/recommend/popular', None, {}),
+            'explain': ('POST', '/recommend/explain', {'userId': users[0], 'rentalId': rental_id}, None),
+            'user-preferences': ('GET', f'/user-preferences/{users[0]}', None, None),
+        }
+        requests = [requests[name] for name in warmed]
+        statuses = {}
+        for _ in range(self.rounds):
+            for method, path, query, body in requests:
+                status, _, _ = await asgi_request(app, method, path, query, body, {WARMUP_HEADER: '1'})
+                endpoint = path if not path.startswith('/user-preferences') else '/user-preferences/{userId}'
+                statuses.setdefault(endpoint, []).append(status)
+        failed = {endpoint: codes for endpoint, codes in statuses.items() if any(code >= 500 for code in codes)}
+        if failed:
+            print(f"⚠️ Warm-up requests failed: {failed}")
+        return {'requests': sum(len(codes) for codes in statuses.values()), 'statuses': statuses, 'skipped': skipped}
+
+    async def _prefetch(self, app, model):
+        """/recommend/personalized cho top-N user active -> ranking vào Redis cache (key theo userId)"""
+        users = await asyncio.to_thread(most_active_users, model, self.prefetch_users)
+        ok = 0
+        for user_id in users:
+            status, _, _ = await asgi_request(app, 'POST', '/recommend/personalized', None,
+                                              {'userId': user_id}, {WARMUP_HEADER: '1'})
+            ok += status == 200
+        return {'users': len(users), 'ok': ok}
@@ -0,0 +1,297 @@
+"""
+⏱️ BENCHMARK - Training & serving RecommendationModel ở nhiều quy mô
+
+Mỗi scale chạy trong 1 process riêng (peak RSS không bị lẫn giữa các scale):
+1. Sinh dữ liệu synthetic (benchmarks/synthetic_data.py)
+2. RecommendationModel.train  -> wall time, peak RSS (+ tracemalloc nếu bật)
+3. save / load                 -> artifact size, load time
+4. Trên model vừa load (giống production):
+   recommend_for_user / recommend_similar_items / get_popular_items -> p50/p90/p99
+
+Usage (chạy từ PyThon_ML_App/):
+    python benchmarks/bench_model.py                       # 10k, 100k
+    python benchmarks/bench_model.py --scales 10k 100k 1m
+    python benchmarks/bench_model.py --compare benchmarks/results/bench_old.json
+"""
+import os
+import sys
+import io
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import resource
+import subprocess
+import tracemalloc
+import multiprocessing
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.append(ROOT_DIR)
+sys.path.append(BENCH_DIR)
+
+from synthetic_data import SCALES, generate_scale
+
+DEFAULT_SCALES = ['10k', '100k']
+
+
+def _max_rss_mb() -> float:
+    # Linux: KB, macOS: bytes
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def percentiles(samples_ms):
+    if not samples_ms:
+        return {'n': 0}
+    ordered = sorted(samples_ms)
+
+    def pct(p):
+        idx = min(len(ordered) - 1, max(0, int(round(p / 100 * (len(ordered) - 1)))))
+        return round(ordered[idx], 3)
+
+    return {
+        'n': len(ordered),
+        'mean_ms': round(sum(ordered) / len(ordered), 3),
+        'p50_ms': pct(50),
+        'p90_ms': pct(90),
+        'p99_ms': pct(99),
+        'max_ms': round(ordered[-1], 3),
+    }
+
+
+def _measure(fn, args_list, max_queries, max_seconds, warmup=3):
+    """Gọi fn(*args) lần lượt, dừng khi đủ max_queries hoặc hết max_seconds"""
+    for args in args_list[:warmup]:
+        fn(*args)
+
+    samples = []
+    budget_end = time.perf_counter() + max_seconds
+    for i in range(max_queries):
+        args = args_list[i % len(args_list)]
+        started = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - started) * 1000)
+        if time.perf_counter() > budget_end:
+            break
+
+    result = percentiles(samples)
+    result['truncated_by_time_budget'] = len(samples) < max_queries
+    return result
+
+
+def run_scale(scale, seed=42, queries=200, max_seconds=60.0, trace_memory=False, n_recommendations=10):
+    """Chạy trong worker process - trả về dict kết quả của 1 scale"""
+    from training.train_model import RecommendationModel
+
+    result = {'scale': scale}
+    n_rows, n_users, n_rentals = SCALES[scale]
+    result['dataset'] = {'interactions': n_rows, 'users': n_users, 'rentals': n_rentals, 'seed': seed}
+
+    # ==================== DATA ====================
+    started = time.perf_counter()
+    interactions_df, rentals_df = generate_scale(scale, seed=seed)
+    result['dataset']['generate_seconds'] = round(time.perf_counter() - started, 3)
+    result['dataset']['anonymous_rows'] = int((interactions_df['userId'] == 'anonymous').sum())
+    rss_before_train = _max_rss_mb()
+
+    # ==================== TRAIN ====================
+    with redirect_stdout(io.StringIO()):
+        model = RecommendationModel()
+        if trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        model.train(interactions_df, rentals_df)
+        train_seconds = time.perf_counter() - started
+        traced_peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        if trace_memory:
+            tracemalloc.stop()
+
+    result['train'] = {
+        'wall_seconds': round(train_seconds, 3),
+        'peak_rss_mb': round(_max_rss_mb(), 1),
+        'rss_before_train_mb': round(rss_before_train, 1),
+        'n_users': int(len(model.user_encoder.classes_)),
+        'n_items': int(len(model.item_encoder.classes_)),
+        'nnz': int(model.user_item_matrix.nnz),
+        'user_similarity_nnz': int(model.user_similarity.nnz),
+        'item_similarity_nnz': int(model.item_similarity.nnz),
+    }
+    if traced_peak is not None:
+        result['train']['tracemalloc_peak_mb'] = round(traced_peak / (1024 * 1024), 1)
+
+    # ==================== SAVE / LOAD ====================
+    tmp_dir = tempfile.mkdtemp(prefix='ml-bench-')
+    try:
+        artifact_path = os.path.join(tmp_dir, 'recommendation_model.pkl')
+        with redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            model.save(artifact_path)
+            save_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            loaded = RecommendationModel.load(artifact_path)
+            load_seconds = time.perf_counter() - started
+
+        result['artifact'] = {
+            'size_mb': round(os.path.getsize(artifact_path) / (1024 * 1024), 3),
+            'save_seconds': round(save_seconds, 3),
+            'load_seconds': round(load_seconds, 3),
+        }
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    del model
+
+    # ==================== SERVING LATENCY ====================
+    rng = random.Random(seed)
+    users = [u for u in loaded.user_encoder.classes_ if u != 'anonymous']
+    user_args = [(u, n_recommendations) for u in rng.sample(users, min(len(users), queries))]
+    user_args.append(('cold-start-user', n_recommendations))
+    items = list(loaded.item_encoder.classes_)
+    item_args = [(i, n_recommendations) for i in rng.sample(items, min(len(items), queries))]
+
+    result['latency'] = {
+        'recommend_for_user': _measure(
+            lambda u, n: loaded.recommend_for_user(u, n_recommendations=n),
+            user_args, queries, max_seconds
+        ),
+        'recommend_similar_items': _measure(
+            lambda i, n: loaded.recommend_similar_items(i, n_recommendations=n),
+            item_args, queries, max_seconds
+        ),
+        'get_popular_items': _measure(
+            lambda n: loaded.get_popular_items(n_recommendations=n),
+            [(n_recommendations,)], queries, max_seconds
+        ),
+    }
+    result['peak_rss_mb'] = round(_max_rss_mb(), 1)
+    return result
+
+
+def _run_isolated(scale, **kwargs):
+    """1 process / scale (spawn để RSS sạch); lỗi (MemoryError, ...) được ghi lại"""
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+        future = pool.submit(run_scale, scale, **kwargs)
+        try:
+            return future.result()
+        except Exception as e:
+            return {'scale': scale, 'error': f'{type(e).__name__}: {e}'}
+
+
+def _environment():
+    import numpy, pandas, scipy, sklearn
+
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        commit = None
+
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': numpy.__version__,
+        'pandas': pandas.__version__,
+        'scipy': scipy.__version__,
+        'sklearn': sklearn.__version__,
+    }
+
+
+def _print_result(result):
+    scale = result['scale']
+    if 'error' in result:
+        print(f"   ❌ {scale}: {result['error']}")
+        return
+
+    train = result['train']
+    artifact = result['artifact']
+    print(f"   📦 {scale}: train {train['wall_seconds']:.2f}s, peak RSS {train['peak_rss_mb']:.0f} MB, "
+          f"artifact {artifact['size_mb']:.2f} MB, load {artifact['load_seconds']:.3f}s")
+    for name, stats in result['latency'].items():
+        if stats.get('n'):
+            print(f"      {name:<26} p50={stats['p50_ms']:>9.2f}ms  p99={stats['p99_ms']:>9.2f}ms  (n={stats['n']})")
+
+
+def compare(current, baseline):
+    """In tỉ lệ current/baseline cho các số liệu chính"""
+    print("\n📊 COMPARE (current / baseline):")
+    base_by_scale = {r['scale']: r for r in baseline.get('results', [])}
+
+    for result in current.get('results', []):
+        base = base_by_scale.get(result['scale'])
+        if not base or 'error' in base or 'error' in result:
+            continue
+
+        def ratio(new, old):
+            return f"{new / old:.2f}x" if old else 'n/a'
+
+        print(f"   {result['scale']}:")
+        print(f"      train wall      {ratio(result['train']['wall_seconds'], base['train']['wall_seconds'])}")
+        print(f"      train peak RSS  {ratio(result['train']['peak_rss_mb'], base['train']['peak_rss_mb'])}")
+        print(f"      artifact size   {ratio(result['artifact']['size_mb'], base['artifact']['size_mb'])}")
+        print(f"      load time       {ratio(result['artifact']['load_seconds'], base['artifact']['load_seconds'])}")
+        for name, stats in result['latency'].items():
+            base_stats = base['latency'].get(name, {})
+            if stats.get('n') and base_stats.get('n'):
+                print(f"      {name:<26} p50 {ratio(stats['p50_ms'], base_stats['p50_ms'])}, "
+                      f"p99 {ratio(stats['p99_ms'], base_stats['p99_ms'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark RecommendationModel training & serving')
+    parser.add_argument('--scales', nargs='+', choices=list(SCALES), default=DEFAULT_SCALES)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--queries', type=int, default=200, help='Số query mỗi hàm serving')
+    parser.add_argument('--max-seconds', type=float, default=60.0,
+                        help='Time budget mỗi hàm serving (query chậm ở scale lớn)')
+    parser.add_argument('--tracemalloc', action='store_true', help='Đo thêm peak Python heap (chậm hơn)')
+    parser.add_argument('--output', default=None, help='File JSON (mặc định benchmarks/results/bench_<time>.json)')
+    parser.add_argument('--compare', default=None, help='JSON baseline để so sánh')
+    args = parser.parse_args()
+
+    print("\n" + "=" * 70)
+    print("⏱️ RECOMMENDATION MODEL BENCHMARK")
+    print("=" * 70 + "\n")
+
+    report = {'run': _environment(), 'results': []}
+    for scale in args.scales:
+        print(f"🔄 Running {scale} ({SCALES[scale][0]:,} interactions)...")
+        result = _run_isolated(
+            scale,
+            seed=args.seed,
+            queries=args.queries,
+            max_seconds=args.max_seconds,
+            trace_memory=args.tracemalloc,
+        )
+        report['results'].append(result)
+        _print_result(result)
+
+    output = args.output or os.path.join(
+        BENCH_DIR, 'results', f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\n✅ Results saved: {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(report, json.load(f))
+
+    return 0 if all('error' not in r for r in report['results']) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,189 @@
+"""
+⏱️ BENCHMARK - Data preparation: iterrows (cũ) vs columnar (hiện tại)
+
+So sánh 3 stage trên cùng dataset synthetic:
+- rental_coordinates / rental_owners   (prepare_data)
+- user location centroids              (_calculate_user_locations)
+- item_features                        (train bước 5)
+
+Bản cũ được giữ nguyên văn ở đây làm mốc so sánh + kiểm tra kết quả giống nhau.
+
+Usage (chạy từ PyThon_ML_App/):
+    python benchmarks/bench_prepare.py --scale 1m
+    python benchmarks/bench_prepare.py --scale 100k --skip-legacy
+"""
+import os
+import sys
+import io
+import json
+import math
+import time
+import argparse
+from contextlib import redirect_stdout
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.append(ROOT_DIR)
+sys.path.append(BENCH_DIR)
+
+from synthetic_data import SCALES, generate_scale
+from training.train_model import RecommendationModel
+
+
+# ==================== LEGACY (iterrows) ====================
+
+def legacy_rental_maps(rentals_df):
+    rental_coordinates, rental_owners = {}, {}
+    for _, row in rentals_df.iterrows():
+        rental_id = str(row['_id'])
+        lon = float(row.get('longitude', 0))
+        lat = float(row.get('latitude', 0))
+        rental_coordinates[rental_id] = (lon, lat)
+        if 'userId' in row and pd.notna(row['userId']):
+            rental_owners[rental_id] = str(row['userId'])
+    return rental_coordinates, rental_owners
+
+
+def legacy_user_locations(interactions_df, rental_coordinates):
+    user_locations = {}
+    for user_id in interactions_df['userId'].unique():
+        user_interactions = interactions_df[interactions_df['userId'] == user_id]
+        valid_coords = []
+        for _, row in user_interactions.iterrows():
+            rental_id = str(row['rentalId'])
+            if rental_id in rental_coordinates:
+                coords = rental_coordinates[rental_id]
+                if coords[0] != 0 and coords[1] != 0:
+                    valid_coords.append(coords)
+        if valid_coords:
+            user_locations[user_id] = (np.mean([c[0] for c in valid_coords]), np.mean([c[1] for c in valid_coords]))
+    return user_locations
+
+
+def legacy_item_features(rentals_df):
+    item_features = {}
+    for idx, row in rentals_df.iterrows():
+        try:
+            rental_id = str(row['_id'])
+            item_features[rental_id] = {
+                'price': float(row['price']) if pd.notna(row['price']) else 0,
+                'propertyType': str(row['propertyType']) if pd.notna(row['propertyType']) else 'unknown',
+                'location_text': str(row.get('location_short', 'unknown')) if 'location_short' in row and pd.notna(row.get('location_short')) else 'unknown',
+                'area_total': float(row.get('area_total', 0)) if 'area_total' in row and pd.notna(row.get('area_total')) else 0,
+                'amenities_count': int(row.get('amenities_count', 0)) if 'amenities_count' in row else 0,
+                'longitude': float(row.get('longitude', 0)) if 'longitude' in row else 0,
+                'latitude': float(row.get('latitude', 0)) if 'latitude' in row else 0,
+            }
+        except Exception:
+            continue
+    return item_features
+
+
+# ==================== CURRENT (columnar) ====================
+
+def current_stages(interactions_df, rentals_df):
+    """Chạy đúng các method của RecommendationModel, đo từng stage"""
+    with redirect_stdout(io.StringIO()):
+        model = RecommendationModel()
+
+    timings = {}
+    started = time.perf_counter()
+    model._load_rental_maps(rentals_df)
+    timings['rental_maps'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        model._calculate_user_locations(interactions_df)
+    timings['user_locations'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    item_features = model._extract_item_features(rentals_df)
+    timings['item_features'] = time.perf_counter() - started
+
+    return timings, (model.rental_coordinates, model.rental_owners), model.user_locations, item_features
+
+
+def _close(a, b):
+    if isinstance(a, (tuple, list)):
+        return len(a) == len(b) and all(_close(x, y) for x, y in zip(a, b))
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(_close(a[k], b[k]) for k in a)
+    if isinstance(a, float) or isinstance(b, float):
+        return math.isclose(float(a), float(b), rel_tol=1e-9, abs_tol=1e-9)
+    return a == b
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark iterrows vs columnar data preparation')
+    parser.add_argument('--scale', choices=list(SCALES), default='1m')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--skip-legacy', action='store_true', help='Chỉ đo bản columnar')
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    print(f"\n🔄 Generating {args.scale} synthetic dataset...")
+    interactions_df, rentals_df = generate_scale(args.scale, seed=args.seed)
+    print(f"   {len(interactions_df):,} interactions, {len(rentals_df):,} rentals, "
+          f"{interactions_df['userId'].nunique():,} users")
+
+    print("\n⚡ Columnar (current)...")
+    current_timings, rental_maps, user_locations, item_features = current_stages(interactions_df, rentals_df)
+    for stage, seconds in current_timings.items():
+        print(f"   {stage:<16} {seconds:>9.3f}s")
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'scale': args.scale,
+        'current_seconds': {k: round(v, 4) for k, v in current_timings.items()},
+    }
+
+    if not args.skip_legacy:
+        print("\n🐢 iterrows (legacy)...")
+        legacy_timings = {}
+
+        started = time.perf_counter()
+        legacy_maps = legacy_rental_maps(rentals_df)
+        legacy_timings['rental_maps'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        legacy_locations = legacy_user_locations(interactions_df, legacy_maps[0])
+        legacy_timings['user_locations'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        legacy_features = legacy_item_features(rentals_df)
+        legacy_timings['item_features'] = time.perf_counter() - started
+
+        for stage, seconds in legacy_timings.items():
+            speedup = seconds / max(current_timings[stage], 1e-9)
+            print(f"   {stage:<16} {seconds:>9.3f}s   ({speedup:,.0f}x slower)")
+
+        identical = {
+            'rental_maps': _close(legacy_maps[0], rental_maps[0]) and legacy_maps[1] == rental_maps[1],
+            'user_locations': _close(legacy_locations, user_locations),
+            'item_features': _close(legacy_features, item_features),
+        }
+        print(f"\n   Outputs identical: {identical}")
+
+        report['legacy_seconds'] = {k: round(v, 4) for k, v in legacy_timings.items()}
+        report['speedup'] = {
+            k: round(legacy_timings[k] / max(current_timings[k], 1e-9), 1) for k in legacy_timings
+        }
+        report['identical'] = identical
+
+    output = args.output or os.path.join(
+        BENCH_DIR, 'results', f"prepare_{args.scale}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Results saved: {output}")
+
+    return 0 if all(report.get('identical', {}).values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
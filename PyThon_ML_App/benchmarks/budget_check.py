@@ -0,0 +1,169 @@
+"""
+⏱️ BUDGET CHECK - recommend_for_user(budget_ms) có degrade đúng nhánh khi hết budget không
+
+Trên máy nhanh / dữ liệu nhỏ 1 request xong trước cả budget 1ms nên không đo được nhánh degraded.
+Script train 1 model synthetic nhỏ, thay time.perf_counter của training.train_model bằng clock giả
+và cho 1 stage "chậm" bằng cách tăng clock mỗi khi stage đó chạy -> kết quả không phụ thuộc tốc độ máy:
+
+    scenario           stage chậm                                    mong đợi
+    no_budget          -                                             không degraded
+    within_budget      mọi stage (budget đủ lớn)                     không degraded, cùng kết quả no_budget
+    slow_preferences   get_user_preferences                          fallback popular/nearby, chưa xong stage nào
+    slow_content       _calculate_content_score (mỗi candidate)      fallback popular/nearby (hết trong stage 1)
+    slow_similarity    _user_similarity_row                          blend, stage content xong, cf_scored = 0
+    slow_cf            _calculate_cf_score (mỗi candidate)           blend, cf_scored > 0, cf_pending > 0
+
+Exit code 1 khi có scenario sai -> dùng được làm gate như benchmarks/import_budget.py.
+
+Usage (chạy từ PyThon_ML_App/):
+    python benchmarks/budget_check.py
+    python benchmarks/budget_check.py --json
+"""
+import os
+import sys
+import io
+import json
+import time
+import argparse
+from types import SimpleNamespace
+from contextlib import redirect_stdout
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.append(ROOT_DIR)
+sys.path.append(BENCH_DIR)
+
+from synthetic_data import generate_dataset
+import training.train_model as train_model
+from training.train_model import RecommendationModel
+from training.preaggregate import preaggregate_interactions
+
+N_RECOMMENDATIONS = 10
+STATUS_KEYS = ('degraded', 'fallback', 'completed_stages', 'cf_scored', 'cf_skipped', 'cf_pending')
+
+
+class FakeClock:
+    """perf_counter() giả: chỉ tiến khi advance() (stage chậm) được gọi"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def perf_counter(self):
+        return self.now
+
+    def advance(self, ms):
+        self.now += ms / 1000.0
+
+
+# (scenario, stage chậm, ms mỗi lần stage chạy, budget_ms, kiểm tra status + kết quả)
+SCENARIOS = [
+    ('no_budget', None, 0, None,
+     lambda status, recs: not status['degraded'] and status['fallback'] is None),
+    ('within_budget', '_calculate_content_score', 0.01, 10_000,
+     lambda status, recs: not status['degraded'] and 'cf' in status['completed_stages']),
+    ('slow_preferences', 'get_user_preferences', 50, 20,
+     lambda status, recs: status['degraded'] and status['fallback'] in ('popular', 'nearby')
+     and status['completed_stages'] == [] and recs[0]['method'].startswith('fallback_')),
+    ('slow_content', '_calculate_content_score', 1, 100,
+     lambda status, recs: status['degraded'] and status['fallback'] in ('popular', 'nearby')
+     and status['completed_stages'] == []),
+    ('slow_similarity', '_user_similarity_row', 50, 20,
+     lambda status, recs: status['degraded'] and status['fallback'] == 'blend'
+     and status['completed_stages'] == ['content'] and status['cf_scored'] == 0 and status['cf_pending'] > 0),
+    ('slow_cf', '_calculate_cf_score', 5, 20,
+     lambda status, recs: status['degraded'] and status['fallback'] == 'blend'
+     and status['cf_scored'] > 0 and status['cf_pending'] > 0),
+]
+
+
+def build_model(seed=42):
+    """Model nhỏ nhưng > 256 candidate (stage 1 kiểm tra deadline mỗi 256 candidate), train như production"""
+    interactions_df, rentals_df = generate_dataset(20_000, 300, 800, seed=seed)
+    model = RecommendationModel()
+    model.trace_memory = False
+    with redirect_stdout(io.StringIO()):
+        cf_df, popularity_only_df, _ = preaggregate_interactions(interactions_df)
+        model.train(cf_df, rentals_df, popularity_only_df=popularity_only_df)
+    counts = np.diff(model.user_item_matrix.indptr)
+    user_id = model.user_catalog.user_ids.id_at(int(np.argmax(counts)))
+    return model, user_id
+
+
+def run_scenario(model, user_id, clock, slow_stage, slow_ms, budget_ms):
+    if slow_stage is not None:
+        original = getattr(model, slow_stage)
+
+        def slow(*args, **kwargs):
+            clock.advance(slow_ms)
+            return original(*args, **kwargs)
+
+        setattr(model, slow_stage, slow)
+    info = {}
+    try:
+        recs = model.recommend_for_user(user_id, n_recommendations=N_RECOMMENDATIONS,
+                                        budget_ms=budget_ms, info=info)
+    finally:
+        if slow_stage is not None:
+            delattr(model, slow_stage)
+    return info, recs
+
+
+def run(seed=42):
+    model, user_id = build_model(seed)
+    clock = FakeClock()
+    real_time = train_model.time
+    train_model.time = SimpleNamespace(**{name: getattr(time, name) for name in dir(time) if not name.startswith('_')})
+    train_model.time.perf_counter = clock.perf_counter
+
+    results = []
+    baseline = None
+    try:
+        for name, slow_stage, slow_ms, budget_ms, check in SCENARIOS:
+            info, recs = run_scenario(model, user_id, clock, slow_stage, slow_ms, budget_ms)
+            ids = [rec['rentalId'] for rec in recs]
+            if baseline is None:
+                baseline = ids
+            ok = bool(check(info, recs)) and len(recs) == N_RECOMMENDATIONS
+            if name == 'within_budget':
+                ok = ok and ids == baseline
+            results.append({
+                'scenario': name,
+                'slow_stage': slow_stage,
+                'budget_ms': budget_ms,
+                'ok': ok,
+                'n_recommendations': len(recs),
+                'method': recs[0]['method'] if recs else None,
+                **{key: info.get(key) for key in STATUS_KEYS},
+            })
+    finally:
+        train_model.time = real_time
+    return {'user_id': user_id, 'results': results, 'ok': all(r['ok'] for r in results)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Kiểm tra nhánh degraded của recommend_for_user(budget_ms)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    report = run(args.seed)
+    if args.json:
+        print(json.dumps(report, indent=2, default=str))
+    else:
+        print(f"\n⏱️ BUDGET CHECK (user {report['user_id']}, fake clock)\n")
+        print(f"   {'Scenario':<18} {'Budget':>7} {'Degraded':<9} {'Fallback':<9} {'Stages':<16} "
+              f"{'CF scored/pending':>18}  {'Method':<22} OK")
+        for r in report['results']:
+            budget = '-' if r['budget_ms'] is None else f"{r['budget_ms']}ms"
+            stages = ','.join(r['completed_stages'] or []) or '-'
+            cf = f"{r['cf_scored']}/{r['cf_pending']}"
+            print(f"   {r['scenario']:<18} {budget:>7} {str(r['degraded']):<9} {str(r['fallback']):<9} "
+                  f"{stages:<16} {cf:>18}  {str(r['method']):<22} {'✅' if r['ok'] else '❌'}")
+        print(f"\n{'✅ All budget scenarios degrade as expected' if report['ok'] else '❌ Budget check failed'}")
+    return 0 if report['ok'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+🧩 LOCAL STAND-INS cho load test - không cần Redis server, không gọi Groq
+
+- FakeRedis: in-memory, đủ các lệnh app/main.py dùng (get/setex/keys/delete/ping/close), có TTL
+- FakeGroq: giả lập client.chat.completions.create() với latency cấu hình được,
+  trả về câu trả lời soạn sẵn (có giá/khu vực để _extract_preferences_enhanced chạy thật)
+
+Groq SDK là sync client nên FakeGroq cũng sleep blocking - giống hệt cách request
+thật chặn event loop hiện nay.
+"""
+import time
+import random
+import fnmatch
+import threading
+from types import SimpleNamespace
+
+
+# ==================== REDIS ====================
+
+class FakeRedis:
+    """In-memory Redis (decode_responses=True semantics: value là str)"""
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency = latency_ms / 1000.0
+        self._data = {}  # key -> (value, expires_at | None)
+        self._lock = threading.Lock()
+
+    def _sleep(self):
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def _alive(self, key, now):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= now:
+            del self._data[key]
+            return None
+        return value
+
+    def ping(self):
+        self._sleep()
+        return True
+
+    def get(self, key):
+        self._sleep()
+        with self._lock:
+            return self._alive(key, time.monotonic())
+
+    def set(self, key, value, ex=None):
+        self._sleep()
+        with self._lock:
+            expires_at = time.monotonic() + ex if ex else None
+            self._data[key] = (str(value), expires_at)
+        return True
+
+    def setex(self, key, ttl, value):
+        return self.set(key, value, ex=int(ttl))
+
+    def keys(self, pattern='*'):
+        self._sleep()
+        now = time.monotonic()
+        with self._lock:
+            return [k for k in list(self._data) if fnmatch.fnmatchcase(k, pattern) and self._alive(k, now) is not None]
+
+    def delete(self, *keys):
+        self._sleep()
+        with self._lock:
+            return sum(1 for k in keys if self._data.pop(k, None) is not None)
+
+    def flushall(self):
+        with self._lock:
+            self._data.clear()
+
+    def close(self):
+        pass
+
+
+# ==================== GROQ ====================
+
+CANNED_COMPLETIONS = [
+    "Mình đã hiểu! Bạn cần tìm phòng trọ khoảng 3 triệu ở Ninh Kiều. Để mình gợi ý vài bài phù hợp nhé.",
+    "Với ngân sách dưới 5 triệu, khu vực Bình Thủy và Cái Răng có nhiều nhà riêng phù hợp cho bạn.",
+    "Bạn muốn thuê căn hộ chung cư từ 6-8 triệu gần trung tâm Cần Thơ phải không? Mình sẽ tìm giúp.",
+    "Hiện tại mình chưa có đủ thông tin. Bạn có thể cho biết khu vực và mức giá mong muốn không?",
+    "Mặt bằng kinh doanh khoảng 15 triệu trên đường 30 Tháng 4 khá đắt khách, mình gợi ý thử nhé.",
+]
+
+
+class _FakeCompletions:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def create(self, model=None, messages=None, **kwargs):
+        owner = self._owner
+        delay = max(0.0, owner.latency + random.uniform(-owner.jitter, owner.jitter))
+        time.sleep(delay)
+
+        with owner._lock:
+            owner.calls += 1
+
+        if owner.error_rate and random.random() < owner.error_rate:
+            raise RuntimeError("FakeGroq: simulated upstream error")
+
+        content = random.choice(CANNED_COMPLETIONS)
+        prompt_tokens = sum(len(str(m.get('content', ''))) for m in (messages or [])) // 4
+        completion_tokens = len(content) // 4
+
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens,
+            ),
+        )
+
+
+class FakeGroq:
+    """Drop-in cho groq.Groq: fake.chat.completions.create(...)"""
+
+    def __init__(self, latency_ms: float = 800.0, jitter_ms: float = 200.0, error_rate: float = 0.0):
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.error_rate = error_rate
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=_FakeCompletions(self))
@@ -0,0 +1,131 @@
+"""
+📦 IMPORT BUDGET - Thời gian import của API (app/main.py) + thư viện chỉ dùng khi train
+
+Cold start của container (autoscaling) chủ yếu là thời gian import. Script chạy `import main`
+trong process mới (python -X importtime) và:
+1. Đo wall time import, in các module import lâu nhất (cumulative)
+2. Kiểm tra thư viện training-only (sklearn, pandas, groq, matplotlib, ...) không bị import
+3. --model: load model + gọi recommend_* như API rồi kiểm tra lại (import trong hàm không lọt vào serving path)
+
+Exit code 1 khi vượt --budget-ms hoặc có module cấm -> dùng được làm gate trong CI / trước khi build image.
+
+Usage (chạy từ PyThon_ML_App/):
+    python benchmarks/import_budget.py
+    python benchmarks/import_budget.py --budget-ms 1000 --top 15
+    python benchmarks/import_budget.py --model ./models/recommendation_model.pkl --json
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+
+DEFAULT_BUDGET_MS = 1500.0
+# Thư viện của training / report / chat: không được nằm trong import graph của API
+FORBIDDEN_MODULES = ('sklearn', 'pandas', 'groq', 'matplotlib', 'seaborn', 'scipy.stats', 'tabulate')
+
+RESULT_MARKER = '@@IMPORT_BUDGET@@'
+
+# Chạy trong process con (import sạch, không có module nào được cache sẵn)
+_CHILD_CODE = r'''
+import io, os, sys, json, time
+from contextlib import redirect_stdout
+sys.path.insert(0, os.path.join({root!r}, 'app'))
+sys.path.insert(0, {root!r})
+forbidden = {forbidden!r}
+started = time.perf_counter()
+with redirect_stdout(io.StringIO()):
+    import main
+import_ms = (time.perf_counter() - started) * 1000
+result = {{'import_ms': import_ms, 'after_import': [m for m in forbidden if m in sys.modules]}}
+model_path = {model!r}
+if model_path:
+    with redirect_stdout(io.StringIO()):
+        model = main.RecommendationModel.load(model_path)
+        # Id lấy từ IdTable của catalog như API (user_encoder / item_encoder cần sklearn)
+        users, items = model.user_catalog.user_ids, model.item_catalog.rental_ids
+        for user_id in users.ids_at(range(min(3, len(users)))):
+            model.recommend_for_user(user_id, n_recommendations=10)
+        for item_id in items.ids_at(range(min(3, len(items)))):
+            model.recommend_similar_items(item_id, n_recommendations=10)
+        model.get_popular_items(n_recommendations=10)
+    result['after_serving'] = [m for m in forbidden if m in sys.modules]
+print({marker!r} + json.dumps(result))
+'''
+
+
+def parse_importtime(stderr):
+    """stderr của -X importtime -> [(module, self_us, cumulative_us)]"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def measure(model_path=None):
+    """1 lần import main trong process mới -> dict kết quả"""
+    code = _CHILD_CODE.format(root=ROOT_DIR, forbidden=FORBIDDEN_MODULES, model=model_path, marker=RESULT_MARKER)
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                          cwd=ROOT_DIR, capture_output=True, text=True)
+    lines = [line for line in proc.stdout.splitlines() if line.startswith(RESULT_MARKER)]
+    if proc.returncode != 0 or not lines:
+        raise RuntimeError(f"Import failed (exit {proc.returncode}):\n{proc.stderr[-2000:]}")
+    result = json.loads(lines[-1][len(RESULT_MARKER):])
+    result['modules'] = parse_importtime(proc.stderr)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check import time / import graph of the API process')
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS,
+                        help='Ngưỡng wall time của import main (ms)')
+    parser.add_argument('--repeat', type=int, default=3, help='Số lần đo (lấy min - bỏ nhiễu disk cache)')
+    parser.add_argument('--top', type=int, default=10, help='Số module import lâu nhất được in')
+    parser.add_argument('--model', default=None,
+                        help='Load model + gọi recommend_* rồi kiểm tra module cấm lần nữa')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    runs = [measure(args.model if i == 0 else None) for i in range(max(args.repeat, 1))]
+    best = min(runs, key=lambda r: r['import_ms'])
+    forbidden = sorted(set(runs[0]['after_import']) | set(runs[0].get('after_serving', [])))
+
+    # Module tốn nhiều nhất (cumulative gồm cả module con, bỏ qua chính main)
+    top = sorted(((name, cum) for name, _, cum in best['modules'] if name != 'main'),
+                 key=lambda x: x[1], reverse=True)
+    report = {
+        'import_ms': round(best['import_ms'], 1),
+        'runs_ms': [round(r['import_ms'], 1) for r in runs],
+        'budget_ms': args.budget_ms,
+        'forbidden_after_import': runs[0]['after_import'],
+        'forbidden_after_serving': runs[0].get('after_serving'),
+        'top_modules': [{'module': name, 'cumulative_ms': round(cum / 1000, 1)} for name, cum in top[:args.top]],
+    }
+    ok = report['import_ms'] <= args.budget_ms and not forbidden
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print("=" * 70)
+        print("📦 API IMPORT BUDGET (import main)")
+        print("=" * 70)
+        print(f"   Import time: {report['import_ms']:.1f} ms (budget {args.budget_ms:.0f} ms, "
+              f"runs: {', '.join(f'{ms:.0f}' for ms in report['runs_ms'])})")
+        print(f"\n   {'Module':<40} {'Cumulative':>12}")
+        for row in report['top_modules']:
+            print(f"   {row['module']:<40} {row['cumulative_ms']:>9.1f} ms")
+        print(f"\n   Training-only modules after import:  {report['forbidden_after_import'] or 'none'}")
+        if args.model:
+            print(f"   Training-only modules after serving: {report['forbidden_after_serving'] or 'none'}")
+        print(f"\n{'✅ Within budget' if ok else '❌ Import budget exceeded'}")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
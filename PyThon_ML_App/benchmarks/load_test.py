@@ -0,0 +1,293 @@
+"""
+🔥 LOAD TEST - Drive FastAPI app ở concurrency cố định, không cần network
+
+- Gọi app qua ASGI trực tiếp (không uvicorn, không socket) -> số đo là của app
+- Redis = FakeRedis, Groq = FakeGroq (latency cấu hình được)
+- Endpoint: /recommend/personalized, /recommend/similar, /recommend/popular,
+  /recommend/explain, /chat (trộn theo --mix); map = personalized full-catalog + map_center
+  như route with-poi của Node (lane map của admission control)
+
+Báo cáo: throughput, p50/p90/p99, error rate theo endpoint + cache hit ratio
+(lấy từ counter ml_cache_requests_total), request bị shed (429 / 503 của app/admission.py)
+và queue wait theo lane, ghi JSON như bench_model.py.
+
+Usage (chạy từ PyThon_ML_App/):
+    python benchmarks/load_test.py --concurrency 16 --duration 30
+    python benchmarks/load_test.py --mix personalized=5,popular=1 --groq-latency-ms 1500
+    python benchmarks/load_test.py --mix map=4,explain=1,similar=1 --concurrency 32
+    WARMUP=1 python benchmarks/load_test.py      # chạy warm-up (app/warmup.py) trước khi đo
+"""
+import os
+import sys
+import io
+import json
+import time
+import random
+import asyncio
+import argparse
+from contextlib import redirect_stdout
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.append(BENCH_DIR)
+sys.path.append(os.path.join(ROOT_DIR, 'app'))
+
+from fakes import FakeRedis, FakeGroq
+from warmup import asgi_request
+from bench_model import percentiles
+
+DEFAULT_MIX = 'personalized=6,similar=2,popular=2,explain=1,chat=1'
+
+CHAT_MESSAGES = [
+    "Tôi cần tìm phòng trọ khoảng 3 triệu gần Đại học Cần Thơ",
+    "Có nhà riêng nào dưới 5 triệu ở Bình Thủy không?",
+    "Tìm căn hộ chung cư từ 6-8 triệu ở Ninh Kiều",
+    "Xin chào, bạn giúp gì được cho tôi?",
+]
+
+
+# ==================== SCENARIO ====================
+
+def parse_mix(mix: str):
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        weights[name.strip()] = float(weight or 1)
+    unknown = set(weights) - {'personalized', 'map', 'similar', 'popular', 'explain', 'chat'}
+    if unknown:
+        raise ValueError(f"Unknown endpoints in --mix: {sorted(unknown)}")
+    return weights
+
+
+class Scenario:
+    """Sinh request ngẫu nhiên (deterministic theo seed) từ user/item của model"""
+
+    def __init__(self, model, mix, user_pool, seed, n_recommendations):
+        self.rng = random.Random(seed)
+        users = [u for u in model.user_encoder.classes_ if u != 'anonymous']
+        self.rng.shuffle(users)
+        self.users = users[:user_pool] if user_pool else users
+        self.items = list(model.item_encoder.classes_)
+        self.names = list(mix)
+        self.weights = [mix[n] for n in self.names]
+        self.n = n_recommendations
+
+    def next(self):
+        name = self.rng.choices(self.names, weights=self.weights)[0]
+        user = self.rng.choice(self.users) if self.users else 'cold-start-user'
+        item = self.rng.choice(self.items)
+
+        if name == 'personalized':
+            return name, 'POST', '/recommend/personalized', None, {'userId': user, 'n_recommendations': self.n}
+        if name == 'map':
+            return name, 'POST', '/recommend/personalized', None, {
+                'userId': user,
+                'n_recommendations': len(self.items),
+                'context': {'map_center': [105.77, 10.03], 'zoom_level': 15},
+            }
+        if name == 'similar':
+            return name, 'POST', '/recommend/similar', None, {'rentalId': item, 'n_recommendations': self.n}
+        if name == 'popular':
+            return name, 'POST', '/recommend/popular', None, {'n_recommendations': self.n}
+        if name == 'explain':
+            return name, 'POST', '/recommend/explain', {'userId': user, 'rentalId': item}, None
+        return name, 'POST', '/chat', None, {
+            'userId': user,
+            'message': self.rng.choice(CHAT_MESSAGES),
+            'conversationHistory': [],
+            'includeRecommendations': True,
+        }
+
+
+# ==================== RUNNER ====================
+
+async def run_load(app, scenario, concurrency, duration, max_requests):
+    samples = {}  # endpoint -> list[(latency_ms, status)]
+    issued = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal issued
+        while time.perf_counter() < deadline and (not max_requests or issued < max_requests):
+            issued += 1
+            name, method, path, query, body = scenario.next()
+            started = time.perf_counter()
+            try:
+                status, _, _ = await asgi_request(app, method, path, query=query, body=body)
+            except Exception:
+                status = 599
+            samples.setdefault(name, []).append(((time.perf_counter() - started) * 1000, status))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples, time.perf_counter() - started
+
+
+def summarize(samples, elapsed):
+    endpoints = {}
+    all_latencies = []
+    total_errors = 0
+
+    for name, rows in sorted(samples.items()):
+        latencies = [r[0] for r in rows]
+        errors = sum(1 for r in rows if r[1] >= 500)
+        client_errors = sum(1 for r in rows if 400 <= r[1] < 500)
+        shed = sum(1 for r in rows if r[1] in (429, 503))
+        stats = percentiles(latencies)
+        stats.update({
+            'throughput_rps': round(len(rows) / elapsed, 2),
+            'errors_5xx': errors,
+            'errors_4xx': client_errors,
+            'shed': shed,
+            'error_rate': round(errors / len(rows), 4),
+        })
+        endpoints[name] = stats
+        all_latencies.extend(latencies)
+        total_errors += errors
+
+    overall = percentiles(all_latencies)
+    overall.update({
+        'throughput_rps': round(len(all_latencies) / elapsed, 2),
+        'error_rate': round(total_errors / max(len(all_latencies), 1), 4),
+        'elapsed_seconds': round(elapsed, 2),
+    })
+    return {'overall': overall, 'endpoints': endpoints}
+
+
+async def main_async(args):
+    # Fake Groq key để RentalChatAssistant khởi tạo được; client thật bị thay ngay sau startup
+    os.environ.setdefault('GROQ_API_KEY', 'loadtest-fake-key')
+    os.environ['REDIS_URL'] = 'redis://127.0.0.1:1'
+    # Warm-up (app/warmup.py) mặc định tắt: đo app lúc cold start; WARMUP=1 -> chờ /ready rồi mới chạy tải
+    os.environ.setdefault('WARMUP', '0')
+    if args.model:
+        os.environ['MODEL_PATH'] = args.model
+
+    with redirect_stdout(io.StringIO()):
+        import main as api
+        from instrumentation import CACHE_REQUESTS, ADMISSION_QUEUE_WAIT, ADMISSION_REJECTED
+
+    async with api.app.router.lifespan_context(api.app):
+        if api.model is None:
+            print("❌ Model not loaded - train first or pass --model")
+            return 1
+
+        while api.warmup is not None and not api.warmup.ready:
+            await asyncio.sleep(0.05)
+
+        api.redis_client = FakeRedis(latency_ms=args.redis_latency_ms)
+        fake_groq = FakeGroq(args.groq_latency_ms, args.groq_jitter_ms, args.groq_error_rate)
+        if api.chat_assistant is not None:
+            api.chat_assistant.client = fake_groq
+
+        scenario = Scenario(api.model, parse_mix(args.mix), args.user_pool, args.seed, args.n_recommendations)
+
+        cache_before = {r: CACHE_REQUESTS.value(result=r) for r in ('hit', 'miss', 'error')}
+        samples, elapsed = await run_load(api.app, scenario, args.concurrency, args.duration, args.max_requests)
+        cache = {r: CACHE_REQUESTS.value(result=r) - cache_before[r] for r in cache_before}
+        admission = _admission_report(api.ADMISSION, ADMISSION_QUEUE_WAIT, ADMISSION_REJECTED)
+
+    report = summarize(samples, elapsed)
+    lookups = cache['hit'] + cache['miss']
+    report['cache'] = {
+        'hits': int(cache['hit']),
+        'misses': int(cache['miss']),
+        'errors': int(cache['error']),
+        'hit_ratio': round(cache['hit'] / lookups, 4) if lookups else None,
+    }
+    report['admission'] = admission
+    report['groq_calls'] = fake_groq.calls
+    report['config'] = {
+        'timestamp': datetime.now().isoformat(),
+        'concurrency': args.concurrency,
+        'duration': args.duration,
+        'max_requests': args.max_requests,
+        'mix': args.mix,
+        'user_pool': args.user_pool,
+        'n_recommendations': args.n_recommendations,
+        'groq_latency_ms': args.groq_latency_ms,
+        'groq_jitter_ms': args.groq_jitter_ms,
+        'groq_error_rate': args.groq_error_rate,
+        'redis_latency_ms': args.redis_latency_ms,
+        'seed': args.seed,
+    }
+
+    _print_report(report)
+
+    output = args.output or os.path.join(
+        BENCH_DIR, 'results', f"load_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\n✅ Results saved: {output}")
+    return 0
+
+
+def _admission_report(controller, queue_wait, rejected):
+    """Queue wait trung bình + số request bị shed theo lane (cả phần warm-up nếu WARMUP=1)"""
+    lanes = {}
+    for name in controller.lanes:
+        count, total = queue_wait.snapshot(lane=name)
+        shed = {reason: int(rejected.value(lane=name, reason=reason))
+                for reason in ('queue_full', 'overloaded', 'timeout')}
+        if count or any(shed.values()):
+            lanes[name] = {
+                'admitted': count,
+                'avg_queue_wait_ms': round(total / count * 1000, 2) if count else None,
+                'shed': shed,
+            }
+    return {'enabled': controller.enabled, 'capacity': controller.capacity, 'lanes': lanes}
+
+
+def _print_report(report):
+    overall = report['overall']
+    print("\n" + "=" * 70)
+    print("🔥 LOAD TEST RESULTS")
+    print("=" * 70)
+    print(f"   Requests: {overall['n']}  in {overall['elapsed_seconds']}s  "
+          f"-> {overall['throughput_rps']} req/s, error rate {overall['error_rate']:.2%}")
+    if overall['n']:
+        print(f"   Latency: p50={overall['p50_ms']}ms  p90={overall['p90_ms']}ms  p99={overall['p99_ms']}ms")
+
+    for name, stats in report['endpoints'].items():
+        print(f"   {name:<13} n={stats['n']:<6} {stats['throughput_rps']:>7} req/s  "
+              f"p50={stats['p50_ms']:>9}ms  p99={stats['p99_ms']:>9}ms  5xx={stats['errors_5xx']}  4xx={stats['errors_4xx']}  "
+              f"shed={stats['shed']}")
+
+    admission = report['admission']
+    print(f"   Admission: {'on' if admission['enabled'] else 'off'} (capacity {admission['capacity']})")
+    for lane, stats in admission['lanes'].items():
+        wait = f"{stats['avg_queue_wait_ms']}ms" if stats['avg_queue_wait_ms'] is not None else 'n/a'
+        shed = ', '.join(f"{reason}={n}" for reason, n in stats['shed'].items() if n) or 'none'
+        print(f"      {lane:<13} admitted={stats['admitted']:<6} avg queue wait={wait:<10} shed: {shed}")
+
+    cache = report['cache']
+    ratio = f"{cache['hit_ratio']:.1%}" if cache['hit_ratio'] is not None else 'n/a'
+    print(f"   Cache: {cache['hits']} hits / {cache['misses']} misses (hit ratio {ratio})")
+    print(f"   Groq calls: {report['groq_calls']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test FastAPI ML service with local fakes')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=20.0, help='Seconds')
+    parser.add_argument('--max-requests', type=int, default=0, help='0 = chỉ giới hạn theo duration')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='endpoint=weight,...')
+    parser.add_argument('--user-pool', type=int, default=50, help='Số user khác nhau (ảnh hưởng cache hit)')
+    parser.add_argument('--n-recommendations', type=int, default=20)
+    parser.add_argument('--groq-latency-ms', type=float, default=800.0)
+    parser.add_argument('--groq-jitter-ms', type=float, default=200.0)
+    parser.add_argument('--groq-error-rate', type=float, default=0.0)
+    parser.add_argument('--redis-latency-ms', type=float, default=0.2)
+    parser.add_argument('--model', default=None, help='Model path (mặc định MODEL_PATH / ./models/...)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    return asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,233 @@
+"""
+🧪 SYNTHETIC DATASET - interactions.csv / rentals.csv giả lập cho benchmark
+
+Cùng schema với data/export_dataset.py:
+- Toạ độ tập trung quanh Ninh Kiều (Cần Thơ), vài % ở tỉnh khác, vài % = 0 (thiếu toạ độ)
+- Loại tương tác lệch về 'view' như dữ liệu thật, score theo interaction_score_map
+- Độ phổ biến bài đăng + độ hoạt động user theo phân phối Zipf
+- 1 phần interactions là user 'anonymous'
+
+Usage:
+    python benchmarks/synthetic_data.py --scale 100k --output-dir ./benchmarks/data
+"""
+import os
+import argparse
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+# Giống export_dataset.py
+INTERACTION_SCORE_MAP = {
+    'view': 1,
+    'scroll': 2,
+    'filter_apply': 1.5,
+    'detail_open': 3,
+    'click': 2,
+    'favorite': 5,
+    'unfavorite': -3,
+    'share': 4,
+    'contact': 8,
+    'call': 10,
+}
+
+# View-heavy như production (99% view trong data/interactions.csv)
+INTERACTION_TYPE_MIX = {
+    'view': 0.86,
+    'scroll': 0.03,
+    'detail_open': 0.03,
+    'click': 0.03,
+    'filter_apply': 0.01,
+    'favorite': 0.02,
+    'unfavorite': 0.006,
+    'share': 0.004,
+    'contact': 0.008,
+    'call': 0.002,
+}
+
+PROPERTY_TYPES = {
+    # type: (tỉ lệ, giá trung vị VND)
+    'Đất nền': (0.30, 1_200_000_000),
+    'Nhà riêng': (0.22, 6_000_000),
+    'Nhà trọ/Phòng trọ': (0.20, 2_500_000),
+    'Biệt thự': (0.07, 1_500_000_000),
+    'Căn hộ chung cư': (0.08, 8_000_000),
+    'Văn phòng': (0.05, 15_000_000),
+    'Mặt bằng kinh doanh': (0.04, 20_000_000),
+    'Khác': (0.04, 5_000_000),
+}
+
+DISTRICTS = ['Ninh Kiều', 'Bình Thủy', 'Cái Răng', 'Ô Môn', 'Thốt Nốt', 'Phong Điền']
+STREETS = ['Lê Hồng Phong', 'Võ Văn Kiệt', '30 Tháng 4', 'Nguyễn Văn Cừ', 'Mậu Thân', '3 Tháng 2', 'Trần Hưng Đạo']
+
+# Tâm Ninh Kiều + vài tỉnh khác (outlier như dữ liệu thật: max lat ~15.9)
+CAN_THO_CENTER = (105.7680, 10.0341)
+OTHER_PROVINCES = [(105.9790, 9.6025), (106.6297, 10.8231), (108.2022, 16.0544), (105.4350, 10.3860)]
+
+# Quy mô: rows -> (n_users, n_rentals)
+SCALES = {
+    '10k': (10_000, 400, 150),
+    '100k': (100_000, 3_000, 800),
+    '1m': (1_000_000, 12_000, 3_000),
+}
+
+
+def _object_ids(rng, n):
+    """24-hex giống MongoDB ObjectId"""
+    raw = rng.integers(0, 2**63 - 1, size=(n, 2), dtype=np.int64)
+    return [f'{a:016x}{b:016x}'[:24] for a, b in raw]
+
+
+def _firebase_uids(rng, n):
+    """28 ký tự giống Firebase uid"""
+    alphabet = np.array(list('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789'))
+    chars = rng.choice(alphabet, size=(n, 28))
+    return [''.join(row) for row in chars]
+
+
+def _zipf_weights(n, exponent):
+    weights = 1.0 / np.power(np.arange(1, n + 1), exponent)
+    return weights / weights.sum()
+
+
+def generate_rentals(n_rentals, owner_pool, rng, now=None):
+    """DataFrame rentals với đúng cột của export_rentals()"""
+    now = now or datetime.now()
+
+    types = list(PROPERTY_TYPES)
+    type_probs = np.array([PROPERTY_TYPES[t][0] for t in types])
+    property_type = rng.choice(types, size=n_rentals, p=type_probs / type_probs.sum())
+    median_price = np.array([PROPERTY_TYPES[t][1] for t in property_type], dtype=float)
+    price = np.round(median_price * rng.lognormal(0, 0.5, n_rentals), -5)
+
+    # 🌍 Toạ độ: 90% Cần Thơ, 6% tỉnh khác, 4% thiếu toạ độ
+    region = rng.choice(3, size=n_rentals, p=[0.90, 0.06, 0.04])
+    lon = CAN_THO_CENTER[0] + rng.normal(0, 0.03, n_rentals)
+    lat = CAN_THO_CENTER[1] + rng.normal(0, 0.025, n_rentals)
+    far = np.where(region == 1)[0]
+    if len(far):
+        picks = rng.integers(0, len(OTHER_PROVINCES), len(far))
+        lon[far] = np.array([OTHER_PROVINCES[p][0] for p in picks]) + rng.normal(0, 0.02, len(far))
+        lat[far] = np.array([OTHER_PROVINCES[p][1] for p in picks]) + rng.normal(0, 0.02, len(far))
+    missing = region == 2
+    lon[missing] = 0
+    lat[missing] = 0
+
+    district = rng.choice(DISTRICTS, size=n_rentals)
+    street = rng.choice(STREETS, size=n_rentals)
+    number = rng.integers(1, 300, n_rentals)
+    location_short = [f'{n} {s}, {d}' for n, s, d in zip(number, street, district)]
+    location_full = [f'{short}, Thành phố Cần Thơ, Việt Nam' for short in location_short]
+
+    created = [now - timedelta(days=int(d)) for d in rng.integers(0, 365, n_rentals)]
+
+    return pd.DataFrame({
+        '_id': _object_ids(rng, n_rentals),
+        'userId': rng.choice(owner_pool, size=n_rentals),
+        'title': [f'Cho thuê {t.lower()} {d}' for t, d in zip(property_type, district)],
+        'price': price,
+        'propertyType': property_type,
+        'status': 'available',
+        'location_short': location_short,
+        'location_full': location_full,
+        'longitude': np.round(lon, 6),
+        'latitude': np.round(lat, 6),
+        'area_total': np.round(rng.lognormal(np.log(80), 0.5, n_rentals), 1),
+        'area_bedrooms': rng.integers(0, 6, n_rentals),
+        'area_bathrooms': rng.integers(0, 4, n_rentals),
+        'amenities_count': rng.integers(0, 10, n_rentals),
+        'furniture_count': rng.integers(0, 6, n_rentals),
+        'images_count': rng.integers(0, 12, n_rentals),
+        'videos_count': rng.integers(0, 2, n_rentals),
+        'createdAt': created,
+    })
+
+
+def generate_interactions(n_rows, user_ids, rentals_df, rng, anonymous_share=0.3, now=None):
+    """DataFrame interactions với đúng cột của export_interactions()"""
+    now = now or datetime.now()
+    n_rentals = len(rentals_df)
+
+    # Zipf: vài bài rất hot, vài user rất active
+    item_idx = rng.choice(n_rentals, size=n_rows, p=_zipf_weights(n_rentals, 0.9))
+    user_idx = rng.choice(len(user_ids), size=n_rows, p=_zipf_weights(len(user_ids), 0.7))
+    user_col = np.asarray(user_ids, dtype=object)[user_idx]
+    user_col[rng.random(n_rows) < anonymous_share] = 'anonymous'
+
+    types = list(INTERACTION_TYPE_MIX)
+    type_probs = np.array(list(INTERACTION_TYPE_MIX.values()))
+    interaction_type = rng.choice(types, size=n_rows, p=type_probs / type_probs.sum())
+    type_scores = np.array([INTERACTION_SCORE_MAP[t] for t in types])
+    score = type_scores[pd.Categorical(interaction_type, categories=types).codes]
+
+    seconds_ago = rng.integers(0, 180 * 24 * 3600, n_rows)
+    timestamp = pd.Timestamp(now) - pd.to_timedelta(seconds_ago, unit='s')
+    hours = timestamp.hour
+    time_of_day = np.select(
+        [(hours >= 5) & (hours < 12), (hours >= 12) & (hours < 17), (hours >= 17) & (hours < 21)],
+        ['morning', 'afternoon', 'evening'],
+        default='night'
+    )
+
+    rentals = rentals_df.iloc[item_idx]
+
+    return pd.DataFrame({
+        'userId': user_col,
+        'rentalId': rentals['_id'].to_numpy(),
+        'interactionType': interaction_type,
+        'interactionScore': score,
+        'price': rentals['price'].to_numpy(),
+        'propertyType': rentals['propertyType'].to_numpy(),
+        'location_text': rentals['location_short'].to_numpy(),
+        'area': rentals['area_total'].to_numpy(),
+        'timestamp': timestamp,
+        'longitude': rentals['longitude'].to_numpy(),
+        'latitude': rentals['latitude'].to_numpy(),
+        'duration': np.where(interaction_type == 'view', 0, rng.integers(0, 300, n_rows)),
+        'scrollDepth': np.where(interaction_type == 'scroll', np.round(rng.random(n_rows), 2), 0),
+        'deviceType': rng.choice(['desktop', 'mobile'], size=n_rows, p=[0.75, 0.25]),
+        'timeOfDay': time_of_day,
+        'searchRadius': rng.choice([5, 10, 20], size=n_rows, p=[0.2, 0.6, 0.2]),
+    })
+
+
+def generate_dataset(n_rows, n_users, n_rentals, seed=42, anonymous_share=0.3):
+    """(interactions_df, rentals_df) - deterministic theo seed"""
+    rng = np.random.default_rng(seed)
+    now = datetime(2026, 1, 1)
+
+    user_ids = _firebase_uids(rng, n_users)
+    # 1 phần chủ nhà cũng là user có interactions -> test exclude own rentals
+    owner_pool = user_ids[: max(1, n_users // 10)] + _firebase_uids(rng, max(1, n_rentals // 5))
+
+    rentals_df = generate_rentals(n_rentals, owner_pool, rng, now=now)
+    interactions_df = generate_interactions(n_rows, user_ids, rentals_df, rng, anonymous_share, now=now)
+    return interactions_df, rentals_df
+
+
+def generate_scale(scale, seed=42, anonymous_share=0.3):
+    n_rows, n_users, n_rentals = SCALES[scale]
+    return generate_dataset(n_rows, n_users, n_rentals, seed=seed, anonymous_share=anonymous_share)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic interactions.csv / rentals.csv')
+    parser.add_argument('--scale', choices=list(SCALES), default='10k')
+    parser.add_argument('--output-dir', default='./benchmarks/data')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--anonymous-share', type=float, default=0.3)
+    args = parser.parse_args()
+
+    interactions_df, rentals_df = generate_scale(args.scale, args.seed, args.anonymous_share)
+
+    output_dir = os.path.join(args.output_dir, args.scale)
+    os.makedirs(output_dir, exist_ok=True)
+    interactions_df.to_csv(os.path.join(output_dir, 'interactions.csv'), index=False)
+    rentals_df.to_csv(os.path.join(output_dir, 'rentals.csv'), index=False)
+
+    print(f"✅ Generated {len(interactions_df):,} interactions, {len(rentals_df):,} rentals -> {output_dir}")
+    print(f"   Types: {interactions_df['interactionType'].value_counts().to_dict()}")
+
+
+if __name__ == '__main__':
+    main()
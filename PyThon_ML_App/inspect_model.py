@@ -1,294 +1,241 @@
-import pickle
+"""
+📊 MODEL INSPECTOR
+
+Mặc định chỉ đọc manifest JSON ghi lúc save() (recommendation_model.pkl.manifest.json):
+shape, nnz, sparsity, số lượng, dung lượng từng component trong RAM, size artifact, peak lúc train, trained_at
+-> vài ms với artifact nhiều GB.
+--deep: load artifact với mmap_mode='r' (array của matrix/similarity không copy vào RAM)
+        rồi tính thống kê phân bố, popularity, geographic bounds.
+
+Usage (chạy từ PyThon_ML_App/):
+    python inspect_model.py
+    python inspect_model.py --deep
+    python inspect_model.py --model ./models/recommendation_model.pkl --json
+    python inspect_model.py --write-manifest      # tạo manifest cho artifact cũ (trước khi có manifest)
+"""
 import os
+import sys
 import json
-from tabulate import tabulate  # pip install tabulate
-
-# Load model
-model_path = "./models/recommendation_model.pkl"
-
-if not os.path.exists(model_path):
-    print(f"❌ Model not found: {model_path}")
-    print("   Train the model first: python training/train_model.py")
-    exit(1)
-
-print("=" * 80)
-print("📊 MODEL INSPECTION - WITH GEOGRAPHIC FEATURES")
-print("=" * 80 + "\n")
-
-# Load pickle file
-with open(model_path, 'rb') as f:
-    model = pickle.load(f)
-
-print(f"✅ Model loaded successfully!")
-print(f"   File size: {os.path.getsize(model_path) / (1024*1024):.2f} MB")
-print(f"   Type: {type(model).__name__}\n")
-
-# ==================== BASIC MODEL INFO ====================
-
-print("=" * 80)
-print("📋 MODEL STRUCTURE")
-print("=" * 80 + "\n")
-
-print("✅ Core Attributes:")
-core_attrs = {
-    'user_item_matrix': 'User-Item Interaction Matrix',
-    'user_similarity': 'User-User Similarity Matrix',
-    'item_similarity': 'Item-Item Similarity Matrix',
-    'popularity_scores': 'Popularity Scores Dict',
-    'user_encoder': 'User ID Encoder',
-    'item_encoder': 'Rental ID Encoder',
-}
-
-for attr, desc in core_attrs.items():
-    if hasattr(model, attr):
-        value = getattr(model, attr)
-        value_type = type(value).__name__
-        
-        if attr == 'user_item_matrix':
-            print(f"   ✓ {attr} ({desc})")
-            print(f"     - Shape: {value.shape}")
-            print(f"     - Non-zero elements: {value.nnz}")
-            print(f"     - Sparsity: {100 * (1 - value.nnz / (value.shape[0] * value.shape[1])):.2f}%")
-        
-        elif attr == 'popularity_scores':
-            print(f"   ✓ {attr} ({desc})")
-            print(f"     - Items: {len(value)}")
-            print(f"     - Max score: {max(value.values()) if value else 0:.2f}")
-            print(f"     - Min score: {min(value.values()) if value else 0:.2f}")
-        
-        elif attr in ['user_encoder', 'item_encoder']:
-            print(f"   ✓ {attr}")
-            classes = getattr(value, 'classes_', [])
-            print(f"     - Classes: {len(classes)}")
-        
+import time
+import argparse
+
+from training.model_manifest import build_manifest, write_manifest, read_manifest, is_stale, manifest_path
+
+DEFAULT_MODEL_PATH = "./models/recommendation_model.pkl"
+
+
+def _format_bytes(n):
+    if n is None:
+        return '-'
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if n < 1024 or unit == 'GB':
+            return f"{n:.1f} {unit}" if unit != 'B' else f"{n} B"
+        n /= 1024
+
+
+def _load_artifact(model_path):
+    """Artifact dict với array mmap (read-only) - chỉ dùng cho --deep / artifact chưa có manifest"""
+    import joblib
+    model_data = joblib.load(model_path, mmap_mode='r')
+    if not isinstance(model_data, dict):
+        # Artifact rất cũ: pickle cả object RecommendationModel
+        model_data = dict(vars(model_data))
+    return model_data
+
+
+# ==================== MANIFEST (FAST) ====================
+
+def print_manifest(manifest, model_path):
+    print("=" * 80)
+    print("📋 MODEL MANIFEST")
+    print("=" * 80 + "\n")
+
+    artifact = manifest.get('artifact', {})
+    print(f"   File:        {model_path} ({_format_bytes(artifact.get('size_bytes'))})")
+    print(f"   Manifest:    {manifest_path(model_path)}")
+    print(f"   Trained at:  {manifest.get('trained_at', 'unknown')}")
+    print(f"   Saved at:    {manifest.get('saved_at', 'unknown')}")
+    if manifest.get('config', {}).get('similarity_top_k') is not None:
+        print(f"   Similarity top-K: {manifest['config']['similarity_top_k']}")
+    if manifest.get('config', {}).get('matrix_storage') is not None:
+        print(f"   Matrix storage: {manifest['config']['matrix_storage']}")
+
+    matrix = manifest['matrix']
+    counts = manifest['counts']
+    print(f"\n✅ User-Item Matrix:")
+    print(f"   Dimensions: {matrix['shape'][0]:,} users × {matrix['shape'][1]:,} items ({matrix['dtype']})")
+    print(f"   Non-zero entries: {matrix['nnz']:,}")
+    print(f"   Sparsity: {matrix['sparsity']:.2f}%   Density: {matrix['density']:.2f}%")
+    if matrix['shape'][0] and matrix['shape'][1]:
+        print(f"   Average interactions per user: {matrix['nnz'] / matrix['shape'][0]:.2f}")
+        print(f"   Average interactions per item: {matrix['nnz'] / matrix['shape'][1]:.2f}")
+
+    print(f"\n✅ Components:")
+    print(f"   {'Name':<22} {'Type':<14} {'Shape / Len':<18} {'NNZ':>12} {'Memory':>12}")
+    print(f"   {'-' * 22} {'-' * 14} {'-' * 18} {'-' * 12} {'-' * 12}")
+    total = 0
+    for name, info in manifest['components'].items():
+        if 'shape' in info:
+            extent = ' × '.join(f"{d:,}" for d in info['shape'])
+        elif 'len' in info:
+            extent = f"{info['len']:,}"
         else:
-            print(f"   ✓ {attr}")
-            print(f"     - Type: {value_type}")
-
-# ==================== 🔥 GEOGRAPHIC FEATURES ====================
-
-print("\n" + "=" * 80)
-print("🌍 GEOGRAPHIC FEATURES")
-print("=" * 80 + "\n")
-
-# Rental coordinates
-if hasattr(model, 'rental_coordinates'):
-    rental_coords = model.rental_coordinates
-    print(f"✅ Rental Coordinates:")
-    print(f"   Total rentals with coords: {len(rental_coords)}")
-    
-    if len(rental_coords) > 0:
-        # Filter valid coordinates
-        valid_coords = {k: v for k, v in rental_coords.items() if v[0] != 0 and v[1] != 0}
-        print(f"   Valid coordinates: {len(valid_coords)} ({100*len(valid_coords)/len(rental_coords):.2f}%)")
-        
-        if valid_coords:
-            # Get bounds
-            lons = [v[0] for v in valid_coords.values()]
-            lats = [v[1] for v in valid_coords.values()]
-            
-            print(f"   Geographic bounds:")
-            print(f"     - Longitude: {min(lons):.4f} to {max(lons):.4f}")
-            print(f"     - Latitude: {min(lats):.4f} to {max(lats):.4f}")
-            
-            # Sample rentals with coordinates
-            print(f"\n   Sample rentals (first 5):")
-            sample_data = []
-            for i, (rental_id, (lon, lat)) in enumerate(list(valid_coords.items())[:5]):
-                sample_data.append([
-                    i+1,
-                    rental_id[:16] + "...",
-                    f"{lon:.4f}",
-                    f"{lat:.4f}"
-                ])
-            
-            print(tabulate(
-                sample_data,
-                headers=['#', 'Rental ID', 'Longitude', 'Latitude'],
-                tablefmt='grid'
-            ))
-else:
-    print("⚠️ rental_coordinates not found in model")
-
-# User locations
-print("\n✅ User Locations (Calculated Centroids):")
-
-if hasattr(model, 'user_locations'):
-    user_locs = model.user_locations
-    print(f"   Users with calculated locations: {len(user_locs)}")
-    
-    if len(user_locs) > 0:
-        # Get bounds
-        lons = [v[0] for v in user_locs.values()]
-        lats = [v[1] for v in user_locs.values()]
-        
-        print(f"   Geographic bounds:")
-        print(f"     - Longitude: {min(lons):.4f} to {max(lons):.4f}")
-        print(f"     - Latitude: {min(lats):.4f} to {max(lats):.4f}")
-        
-        # Sample users with locations
-        print(f"\n   Sample user centroids (first 5):")
-        sample_data = []
-        for i, (user_id, (lon, lat)) in enumerate(list(user_locs.items())[:5]):
-            sample_data.append([
-                i+1,
-                user_id[:16] + "...",
-                f"{lon:.4f}",
-                f"{lat:.4f}"
-            ])
-        
-        print(tabulate(
-            sample_data,
-            headers=['#', 'User ID', 'Avg Longitude', 'Avg Latitude'],
-            tablefmt='grid'
-        ))
-else:
-    print("⚠️ user_locations not found in model")
-
-# ==================== MATRIX STATS ====================
-
-print("\n" + "=" * 80)
-print("📊 MATRIX STATISTICS")
-print("=" * 80 + "\n")
-
-if hasattr(model, 'user_item_matrix'):
-    matrix = model.user_item_matrix
-    
-    print(f"✅ User-Item Matrix:")
-    print(f"   Dimensions: {matrix.shape[0]} users × {matrix.shape[1]} items")
-    print(f"   Non-zero entries: {matrix.nnz}")
-    print(f"   Sparsity: {100 * (1 - matrix.nnz / (matrix.shape[0] * matrix.shape[1])):.2f}%")
-    print(f"   Average interactions per user: {matrix.nnz / matrix.shape[0]:.2f}")
-    print(f"   Average interactions per item: {matrix.nnz / matrix.shape[1]:.2f}")
-
-if hasattr(model, 'user_similarity'):
-    sim = model.user_similarity
-    print(f"\n✅ User Similarity Matrix:")
-    print(f"   Shape: {sim.shape}")
-    print(f"   Type: {type(sim).__name__}")
-
-if hasattr(model, 'item_similarity'):
-    sim = model.item_similarity
-    print(f"\n✅ Item Similarity Matrix:")
-    print(f"   Shape: {sim.shape}")
-    print(f"   Type: {type(sim).__name__}")
-
-# ==================== POPULARITY STATS ====================
-
-print("\n" + "=" * 80)
-print("⭐ POPULARITY STATISTICS")
-print("=" * 80 + "\n")
-
-if hasattr(model, 'popularity_scores'):
-    pop = model.popularity_scores
+            extent = '-'
+        nnz = f"{info['nnz']:,}" if 'nnz' in info else '-'
+        total += info.get('bytes') or 0
+        print(f"   {name:<22} {info['type']:<14} {extent:<18} {nnz:>12} "
+              f"{_format_bytes(info.get('bytes')):>12}")
+    print(f"   {'total':<22} {'':<14} {'':<18} {'':>12} {_format_bytes(total):>12}")
+    print(f"   {'artifact (disk)':<22} {'':<14} {'':<18} {'':>12} "
+          f"{_format_bytes(manifest.get('artifact', {}).get('size_bytes')):>12}")
     
+    for stage, peak in (manifest.get('memory_peaks') or {}).items():
+        print(f"\n🧮 Peak Python heap ({stage}, tracemalloc): {_format_bytes(peak['peak_bytes'])}, "
+              f"retained {_format_bytes(peak['retained_bytes'])}, {peak['seconds']:.2f}s")
+
+    print("\n" + "=" * 80)
+    print("📈 GEOGRAPHIC COVERAGE SUMMARY")
+    print("=" * 80 + "\n")
+    n_items = max(counts['items'], 1)
+    n_users = max(counts['users'], 1)
+    print(f"   Rentals with valid coordinates:  {counts['valid_rental_coordinates']}/{counts['items']} "
+          f"({100 * counts['valid_rental_coordinates'] / n_items:.2f}%)")
+    print(f"   Users with calculated locations: {counts['user_locations']}/{counts['users']} "
+          f"({100 * counts['user_locations'] / n_users:.2f}%)")
+    print(f"   Popularity items:                {counts['popularity_items']}")
+    print(f"   Rentals with anonymous traffic:  {counts['anonymous_rentals']}")
+
+    geo_ready = counts['rental_coordinates'] > 0 and 'user_locations' in manifest['components']
+    print(f"\n✅ Geographic Recommendations Ready: {geo_ready}")
+
+
+# ==================== DEEP (MMAP) ====================
+
+def print_deep(model_data):
+    import numpy as np
+    from tabulate import tabulate  # pip install tabulate
+    from training.id_table import IdTable
+    from training.item_catalog import artifact_item_maps
+    from training.user_catalog import artifact_user_locations
+
+    item_maps = artifact_item_maps(model_data)
+
+    print("\n" + "=" * 80)
+    print("🔬 DEEP STATISTICS (mmap)")
+    print("=" * 80 + "\n")
+
+    matrix = model_data.get('user_item_matrix')
+    if matrix is not None and matrix.nnz:
+        matrix = matrix.tocsr()
+        per_user = np.diff(matrix.indptr)
+        per_item = np.bincount(matrix.indices, minlength=matrix.shape[1])
+        print(f"✅ User-Item Matrix scores:")
+        print(f"   Min / mean / max: {matrix.data.min():.2f} / {matrix.data.mean():.2f} / {matrix.data.max():.2f}")
+        print(f"   Items per user:  median {np.median(per_user):.0f}, p95 {np.percentile(per_user, 95):.0f}, max {per_user.max()}")
+        print(f"   Users per item:  median {np.median(per_item):.0f}, p95 {np.percentile(per_item, 95):.0f}, max {per_item.max()}")
+        print(f"   Cold items (no interactions): {int((per_item == 0).sum())}")
+
+    for name in ('user_similarity', 'item_similarity'):
+        sim = model_data.get(name)
+        if sim is None or not hasattr(sim, 'nnz'):
+            continue
+        storage = f"{type(sim).__name__}, {sim.dtype}"
+        sim = sim.tocsr()
+        neighbors = np.diff(sim.indptr)
+        print(f"\n✅ {name}:")
+        print(f"   Shape: {sim.shape}, nnz: {sim.nnz:,} ({storage})")
+        if sim.nnz:
+            print(f"   Values: min {sim.data.min():.3f}, mean {sim.data.mean():.3f}, max {sim.data.max():.3f}")
+            print(f"   Neighbors per row: median {np.median(neighbors):.0f}, max {neighbors.max()}")
+
+    pop = item_maps['popularity_scores']
     if pop:
-        scores = list(pop.values())
-        
-        print(f"✅ Popularity Scores:")
+        scores = np.fromiter(pop.values(), dtype=float, count=len(pop))
+        print(f"\n✅ Popularity Scores:")
         print(f"   Total items: {len(pop)}")
-        print(f"   Max score: {max(scores):.2f}")
-        print(f"   Min score: {min(scores):.2f}")
-        print(f"   Average score: {sum(scores) / len(scores):.2f}")
-        print(f"   Median score: {sorted(scores)[len(scores)//2]:.2f}")
-        
-        # Top 5 popular items
+        print(f"   Max / average / median / min: {scores.max():.2f} / {scores.mean():.2f} / "
+              f"{np.median(scores):.2f} / {scores.min():.2f}")
+
+        coordinates = item_maps['rental_coordinates']
+        rows = []
+        for i, (rental_id, score) in enumerate(sorted(pop.items(), key=lambda x: x[1], reverse=True)[:10]):
+            lon, lat = coordinates.get(rental_id, (0, 0))
+            rows.append([i + 1, str(rental_id)[:16] + "...", f"{score:.2f}",
+                         f"({lon:.3f}, {lat:.3f})" if lon != 0 and lat != 0 else ""])
         print(f"\n   Top 10 Most Popular Rentals:")
-        top_items = sorted(pop.items(), key=lambda x: x[1], reverse=True)[:10]
-        
-        sample_data = []
-        for i, (rental_id, score) in enumerate(top_items):
-            # Try to get coordinates if available
-            coords = ""
-            if hasattr(model, 'rental_coordinates') and rental_id in model.rental_coordinates:
-                lon, lat = model.rental_coordinates[rental_id]
-                if lon != 0 and lat != 0:
-                    coords = f"({lon:.3f}, {lat:.3f})"
-            
-            sample_data.append([
-                i+1,
-                rental_id[:16] + "...",
-                f"{score:.2f}",
-                coords
-            ])
-        
-        print(tabulate(
-            sample_data,
-            headers=['Rank', 'Rental ID', 'Popularity', 'Coordinates'],
-            tablefmt='grid'
-        ))
-
-# ==================== ENCODERS INFO ====================
-
-print("\n" + "=" * 80)
-print("🔤 ENCODERS INFORMATION")
-print("=" * 80 + "\n")
-
-if hasattr(model, 'user_encoder'):
-    encoder = model.user_encoder
-    print(f"✅ User Encoder:")
-    print(f"   Total users: {len(encoder.classes_)}")
-    print(f"   Sample users (first 5): {list(encoder.classes_[:5])}")
-
-if hasattr(model, 'item_encoder'):
-    encoder = model.item_encoder
-    print(f"\n✅ Item (Rental) Encoder:")
-    print(f"   Total rentals: {len(encoder.classes_)}")
-    print(f"   Sample rentals (first 5): {[str(x)[:12] + '...' for x in encoder.classes_[:5]]}")
-
-# ==================== SUMMARY ====================
-
-print("\n" + "=" * 80)
-print("📈 GEOGRAPHIC COVERAGE SUMMARY")
-print("=" * 80 + "\n")
-
-coverage = {
-    'Metric': [],
-    'Value': [],
-    'Percentage': []
-}
-
-total_rentals = len(model.item_encoder.classes_) if hasattr(model, 'item_encoder') else 0
-total_users = len(model.user_encoder.classes_) if hasattr(model, 'user_encoder') else 0
-
-if hasattr(model, 'rental_coordinates'):
-    valid_rental_coords = len({k: v for k, v in model.rental_coordinates.items() if v[0] != 0 and v[1] != 0})
-    coverage['Metric'].append('Rentals with valid coordinates')
-    coverage['Value'].append(f"{valid_rental_coords}/{total_rentals}")
-    coverage['Percentage'].append(f"{100*valid_rental_coords/max(total_rentals, 1):.2f}%")
-
-if hasattr(model, 'user_locations'):
-    coverage['Metric'].append('Users with calculated locations')
-    coverage['Value'].append(f"{len(model.user_locations)}/{total_users}")
-    coverage['Percentage'].append(f"{100*len(model.user_locations)/max(total_users, 1):.2f}%")
-
-if len(coverage['Metric']) > 0:
-    print(tabulate(
-        [{
-            'Metric': coverage['Metric'][i],
-            'Value': coverage['Value'][i],
-            'Percentage': coverage['Percentage'][i]
-        } for i in range(len(coverage['Metric']))],
-        headers='keys',
-        tablefmt='grid'
-    ))
-
-# Ready for geographic recommendations
-geo_ready = (
-    hasattr(model, 'rental_coordinates') and 
-    len(model.rental_coordinates) > 0 and
-    hasattr(model, 'user_locations')
-)
-
-print(f"\n✅ Geographic Recommendations Ready: {geo_ready}")
-
-print("\n" + "=" * 80)
-print("✅ MODEL INSPECTION COMPLETE")
-print("=" * 80 + "\n")
-
-print("Next steps:")
-print("1. Start API server: python app/main.py")
-print("2. Test API: curl http://localhost:8001/health")
-print("3. Get geo recommendations: POST /recommend/personalized")
-print("4. View coordinates stats: GET /coordinates/stats")
-print()
\ No newline at end of file
+        print(tabulate(rows, headers=['Rank', 'Rental ID', 'Popularity', 'Coordinates'], tablefmt='grid'))
+
+    for label, mapping in (('Rental coordinates', item_maps['rental_coordinates']),
+                           ('User centroids', artifact_user_locations(model_data))):
+        coords = [v for v in mapping.values() if v[0] != 0 and v[1] != 0]
+        if coords:
+            lons, lats = np.array(coords, dtype=float).T
+            print(f"\n✅ {label}: {len(coords)} valid")
+            print(f"   Longitude: {lons.min():.4f} to {lons.max():.4f}")
+            print(f"   Latitude:  {lats.min():.4f} to {lats.max():.4f}")
+
+    for name, label in (('user_encoder', 'User'), ('item_encoder', 'Item (Rental)')):
+        encoder = model_data.get(name)
+        if encoder is not None:
+            print(f"\n✅ {label} Encoder: {len(encoder.classes_)} classes, "
+                  f"sample: {[str(x)[:12] for x in encoder.classes_[:5]]}")
+
+    # Artifact mới: id interned trong IdTable của catalog
+    for catalog, key, label in (('user_catalog', 'user_ids', 'User'), ('item_catalog', 'rental_ids', 'Item (Rental)')):
+        state = model_data.get(catalog)
+        if state is not None and key in state:
+            table = IdTable.from_state(state[key])
+            encoding = 'ObjectId 12 bytes' if table.binary else f'UTF-8 {table.keys.dtype}'
+            print(f"\n✅ {label} ids: {len(table)} interned ({encoding}, {_format_bytes(table.nbytes)}), "
+                  f"sample: {[x[:12] for x in table.ids_at(range(min(5, len(table))))]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect a saved recommendation model')
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    parser.add_argument('--deep', action='store_true', help='Load artifact (mmap) để tính thống kê chi tiết')
+    parser.add_argument('--json', action='store_true', help='In manifest dạng JSON')
+    parser.add_argument('--write-manifest', action='store_true',
+                        help='Tạo lại manifest từ artifact (artifact cũ / manifest lỗi thời)')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        print(f"❌ Model not found: {args.model}")
+        print("   Train the model first: python training/train_model.py")
+        return 1
+
+    started = time.perf_counter()
+    model_data = None
+    manifest = None if args.write_manifest else read_manifest(args.model)
+
+    if manifest is not None and is_stale(manifest, args.model):
+        print(f"⚠️ Manifest does not match {args.model} (artifact rewritten without manifest), "
+              f"loading artifact (slow; run with --write-manifest once)")
+        manifest = None
+    elif manifest is None and not args.write_manifest:
+        print(f"⚠️ No manifest for {args.model}, loading artifact (slow; run with --write-manifest once)")
+
+    if manifest is None:
+        model_data = _load_artifact(args.model)
+        if args.write_manifest:
+            manifest = write_manifest(model_data, args.model)
+            print(f"✅ Manifest written: {manifest_path(args.model)}")
+        else:
+            manifest = build_manifest(model_data, args.model)
+
+    if args.json:
+        print(json.dumps(manifest, indent=2, ensure_ascii=False))
+    else:
+        print_manifest(manifest, args.model)
+
+    if args.deep:
+        if model_data is None:
+            model_data = _load_artifact(args.model)
+        print_deep(model_data)
+
+    print(f"\n⏱️ Inspected in {(time.perf_counter() - started) * 1000:.1f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,405 @@
+"""
+📈 INSTRUMENTATION - Per-stage latency histograms + Prometheus /metrics
+
+Dùng chung cho API (app/main.py, openai_chat_service.py) và model
+(training/train_model.py) nên đặt ở thư mục gốc, import bằng `instrumentation`.
+
+- span('cf') / record_stage('cf', seconds): đo thời gian từng stage
+- REQUEST_DURATION / RECOMMEND_DURATION: histogram theo endpoint / strategy
+- ADMISSION_*: queue wait / shed / in-flight của admission control (app/admission.py)
+- REGISTRY.render(): text format cho Prometheus
+- get_logger(): logging có level, thay cho print() ở hot path
+- RequestTimings: gom stage của 1 request -> header Server-Timing
+"""
+import os
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+from typing import Optional
+
+METRICS_ENABLED = os.getenv('ML_METRICS_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+SERVER_TIMING_ENABLED = os.getenv('ML_SERVER_TIMING', 'true').lower() not in ('0', 'false', 'no')
+
+# Seconds - từ 0.5ms (dict lookup) tới 10s (Groq / Node axios timeout)
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+# ==================== LOGGING ====================
+
+def configure_logging():
+    """Cấu hình root logger 'ml' theo ML_LOG_LEVEL (mặc định INFO)"""
+    level_name = os.getenv('ML_LOG_LEVEL', 'INFO').upper()
+    root = logging.getLogger('ml')
+    root.setLevel(getattr(logging, level_name, logging.INFO))
+
+    if not root.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        root.addHandler(handler)
+        root.propagate = False
+
+    return root
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Logger con của 'ml'. Dùng %-style để chuỗi chỉ được format khi DEBUG bật:
+
+        log.debug("Generated %s recommendations", len(recommendations))
+
+    Chỉ bọc `if log.isEnabledFor(logging.DEBUG):` khi bản thân tham số tốn kém
+    (json.dumps, vòng lặp / dict build riêng cho log).
+    """
+    configure_logging()
+    return logging.getLogger(f'ml.{name}')
+
+
+# ==================== METRIC TYPES ====================
+
+def _format_labels(label_names, label_values, extra=None):
+    pairs = list(zip(label_names, label_values))
+    if extra:
+        pairs.extend(extra)
+    if not pairs:
+        return ''
+
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in pairs) + '}'
+
+
+class Counter:
+    """Monotonic counter với labels"""
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = tuple(str(labels.get(n, '')) for n in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels):
+        key = tuple(str(labels.get(n, '')) for n in self.label_names)
+        return self._values.get(key, 0.0)
+
+    def render(self):
+        lines = [
+            f'# HELP {self.name} {self.help_text}',
+            f'# TYPE {self.name} counter',
+        ]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f'{self.name}{_format_labels(self.label_names, key)} {value}')
+        return lines
+
+
+class Gauge:
+    """Giá trị hiện tại (set / inc / dec) với labels - vd. số request đang chạy / đang xếp hàng"""
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = tuple(str(labels.get(n, '')) for n in self.label_names)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount=1.0, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = tuple(str(labels.get(n, '')) for n in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount=1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        key = tuple(str(labels.get(n, '')) for n in self.label_names)
+        return self._values.get(key, 0.0)
+
+    def render(self):
+        lines = [
+            f'# HELP {self.name} {self.help_text}',
+            f'# TYPE {self.name} gauge',
+        ]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f'{self.name}{_format_labels(self.label_names, key)} {value}')
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus semantics) với labels"""
+
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # key -> [bucket_counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = tuple(str(labels.get(n, '')) for n in self.label_names)
+
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = [[0] * len(self.buckets), 0.0, 0]
+                self._series[key] = series
+
+            bucket_counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    bucket_counts[i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self, **labels):
+        """(count, sum) của 1 series - dùng cho báo cáo nội bộ"""
+        key = tuple(str(labels.get(n, '')) for n in self.label_names)
+        series = self._series.get(key)
+        if series is None:
+            return 0, 0.0
+        return series[2], series[1]
+
+    def render(self):
+        lines = [
+            f'# HELP {self.name} {self.help_text}',
+            f'# TYPE {self.name} histogram',
+        ]
+        with self._lock:
+            items = sorted((k, [list(s[0]), s[1], s[2]]) for k, s in self._series.items())
+
+        for key, (bucket_counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names, key, [('le', repr(float(bound)))])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.label_names, key, [('le', '+Inf')])
+            lines.append(f'{self.name}_bucket{labels} {count}')
+            lines.append(f'{self.name}_sum{_format_labels(self.label_names, key)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(self.label_names, key)} {count}')
+        return lines
+
+
+class MetricsRegistry:
+    """Registry đơn giản - mỗi process 1 registry (mỗi uvicorn worker tự expose)"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help_text, label_names, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, help_text, label_names, **kwargs)
+                self._metrics[name] = metric
+            return metric
+
+    def counter(self, name, help_text, label_names=()):
+        return self._get_or_create(Counter, name, help_text, label_names)
+
+    def gauge(self, name, help_text, label_names=()):
+        return self._get_or_create(Gauge, name, help_text, label_names)
+
+    def histogram(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help_text, label_names, buckets=buckets)
+
+    def render(self) -> str:
+        """Prometheus text exposition format 0.0.4"""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_DURATION = REGISTRY.histogram(
+    'ml_stage_duration_seconds',
+    'Latency of internal pipeline stages (preference lookup, cf, geo, redis, groq, ...)',
+    ('stage',),
+)
+
+REQUEST_DURATION = REGISTRY.histogram(
+    'ml_request_duration_seconds',
+    'HTTP request latency per endpoint',
+    ('endpoint', 'method', 'status'),
+)
+
+RECOMMEND_DURATION = REGISTRY.histogram(
+    'ml_recommend_duration_seconds',
+    'recommend_for_user latency per hybrid strategy',
+    ('strategy',),
+)
+
+RECOMMEND_DEGRADED = REGISTRY.counter(
+    'ml_recommend_degraded_total',
+    'recommend_for_user results cut short by the request budget (blend = partial CF, popular/nearby = fallback)',
+    ('mode',),
+)
+
+ADMISSION_QUEUE_WAIT = REGISTRY.histogram(
+    'ml_admission_queue_wait_seconds',
+    'Time admitted requests spent queued for a concurrency slot, per admission lane',
+    ('lane',),
+)
+
+ADMISSION_REJECTED = REGISTRY.counter(
+    'ml_admission_rejected_total',
+    'Requests shed by admission control (queue_full = 429, overloaded / timeout = 503)',
+    ('lane', 'reason'),
+)
+
+ADMISSION_IN_FLIGHT = REGISTRY.gauge(
+    'ml_admission_in_flight',
+    'Requests currently holding a concurrency slot, per admission lane',
+    ('lane',),
+)
+
+ADMISSION_QUEUED = REGISTRY.gauge(
+    'ml_admission_queue_depth',
+    'Requests currently waiting for a concurrency slot, per admission lane',
+    ('lane',),
+)
+
+CACHE_REQUESTS = REGISTRY.counter(
+    'ml_cache_requests_total',
+    'Redis cache lookups by result (hit/miss/error)',
+    ('result',),
+)
+
+
+# ==================== PER-REQUEST TIMINGS ====================
+
+class RequestTimings:
+    """
+    Stage timings của 1 HTTP request (middleware tạo, record_stage ghi vào).
+
+    Object mutable nên dù sync endpoint chạy trong threadpool (context được
+    copy) thì vẫn ghi vào cùng 1 instance.
+    """
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.stages = {}  # stage -> [seconds, count]
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            entry = self.stages.get(stage)
+            if entry is None:
+                self.stages[stage] = [seconds, 1]
+            else:
+                entry[0] += seconds
+                entry[1] += 1
+
+    def server_timing(self, total_seconds: Optional[float] = None) -> str:
+        """
+        Header value theo W3C Server-Timing, ví dụ:
+            redis;dur=0.41, cf;dur=3.2, serialization;dur=0.8, total;dur=5.1
+        Stage lặp lại nhiều lần (redis get + set) được cộng dồn, desc = số lần.
+        """
+        with self._lock:
+            items = list(self.stages.items())
+
+        parts = []
+        for stage, (seconds, count) in items:
+            metric = f'{stage};dur={seconds * 1000:.2f}'
+            if count > 1:
+                metric += f';desc="x{count}"'
+            parts.append(metric)
+        if total_seconds is not None:
+            parts.append(f'total;dur={total_seconds * 1000:.2f}')
+        return ', '.join(parts)
+
+
+_current_timings: contextvars.ContextVar = contextvars.ContextVar('ml_request_timings', default=None)
+
+
+def begin_request(request_id: str) -> 'RequestTimings':
+    """Gắn RequestTimings vào context hiện tại (gọi ở đầu middleware)"""
+    timings = RequestTimings(request_id)
+    _current_timings.set(timings)
+    return timings
+
+
+def current_timings() -> Optional['RequestTimings']:
+    return _current_timings.get()
+
+
+def current_request_id() -> Optional[str]:
+    timings = _current_timings.get()
+    return timings.request_id if timings is not None else None
+
+
+# ==================== SPANS ====================
+
+def record_stage(stage: str, seconds: float):
+    """Ghi nhận thời gian 1 stage (dùng khi tự đo, ví dụ cộng dồn trong vòng lặp)"""
+    STAGE_DURATION.observe(seconds, stage=stage)
+
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+@contextmanager
+def span(stage: str):
+    """
+    Đo thời gian 1 block code:
+
+        with span('preference_lookup'):
+            prefs = self.get_user_preferences(user_id)
+    """
+    if not METRICS_ENABLED and _current_timings.get() is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def timed(stage: str):
+    """Decorator version của span() cho sync functions"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,221 @@
+"""
+🎨 REPORT GENERATION - Tạo biểu đồ từ model đã lưu (tách khỏi training)
+
+- Đọc artifact đã save (./models/recommendation_model.pkl), không cần train lại
+- Các plot_* của ModelVisualizer chạy song song trong process pool, backend Agg (không cần display)
+- Manifest (reports/report_manifest.json) lưu fingerprint input của từng biểu đồ:
+  input không đổi + file PNG còn đó -> bỏ qua biểu đồ đó
+
+Fingerprint = component của artifact mà biểu đồ dùng + nội dung model_visualizer.py
+(sửa code vẽ -> vẽ lại toàn bộ).
+
+Usage (chạy từ PyThon_ML_App/):
+    python training/generate_reports.py
+    python training/generate_reports.py --workers 4 --force
+    python training/train_model.py --reports      # train xong tạo report luôn
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+matplotlib.use('Agg')
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from training.stage_cache import StageCache
+from training.model_visualizer import ModelVisualizer
+
+DEFAULT_MODEL_PATH = './models/recommendation_model.pkl'
+DEFAULT_REPORTS_DIR = './reports'
+MANIFEST_NAME = 'report_manifest.json'
+
+# (file, method, component của artifact mà biểu đồ dùng, mô tả)
+FIGURES = [
+    ('1_user_item_matrix.png', 'plot_matrix_heatmap', ('user_item_matrix',), 'User-Item Interaction Matrix'),
+    ('2_interaction_distribution.png', 'plot_interaction_distribution', ('user_item_matrix',), 'Interaction Score Distribution'),
+    ('3_user_similarity.png', 'plot_user_similarity_heatmap', ('user_similarity',), 'User-User Similarity Heatmap'),
+    ('4_popularity_ranking.png', 'plot_popularity_chart', ('popularity_scores',), 'Top 15 Most Popular Rentals'),
+    ('5_geographic_distribution.png', 'plot_geographic_distribution', ('rental_coordinates', 'user_locations'), 'Geographic Distribution Map'),
+    ('6_interactions_per_user.png', 'plot_interactions_per_user', ('user_item_matrix',), 'Interactions per User'),
+    ('7_interactions_per_item.png', 'plot_interactions_per_item', ('user_item_matrix',), 'Interactions per Rental'),
+]
+
+# Visualizer cho worker process: fork kế thừa bản của process cha, spawn thì load lại qua initializer
+_visualizer = None
+
+
+def _init_worker(model_path, output_dir):
+    global _visualizer
+    if _visualizer is None:
+        _visualizer = ModelVisualizer(model_path=model_path, output_dir=output_dir)
+
+
+def _render(filename, method):
+    """Vẽ 1 biểu đồ -> (filename, seconds, ok). plot_* tự bắt exception nên kiểm tra file đã được ghi"""
+    path = os.path.join(_visualizer.output_dir, filename)
+    started = time.time()
+    getattr(_visualizer, method)()
+    ok = os.path.exists(path) and os.path.getmtime(path) >= started - 1
+    return filename, round(time.time() - started, 3), ok
+
+
+def figure_fingerprints(visualizer):
+    """Fingerprint input của từng biểu đồ (component dùng chung chỉ hash 1 lần)"""
+    renderer_key = StageCache.file_fingerprint(os.path.abspath(sys.modules[ModelVisualizer.__module__].__file__))
+    component_keys = {}
+    fingerprints = {}
+    for filename, method, components, _ in FIGURES:
+        for name in components:
+            if name not in component_keys:
+                component_keys[name] = StageCache.fingerprint(name, getattr(visualizer, name))
+        fingerprints[filename] = StageCache.fingerprint(
+            method, renderer_key, *[component_keys[name] for name in components]
+        )
+    return fingerprints
+
+
+def load_manifest(output_dir):
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f).get('figures', {})
+    except (OSError, ValueError) as e:
+        print(f"   ⚠️ Report manifest unreadable ({e}), rendering everything")
+        return {}
+
+
+def save_manifest(output_dir, model_path, figures):
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'model_path': os.path.abspath(model_path),
+            'updated_at': datetime.now().isoformat(),
+            'figures': figures,
+        }, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def generate_reports(model_path=DEFAULT_MODEL_PATH, output_dir=DEFAULT_REPORTS_DIR, workers=None, force=False):
+    """
+    Vẽ các biểu đồ có input thay đổi so với lần chạy trước
+
+    Returns: dict {rendered, skipped, failed, seconds, stats}
+    """
+    global _visualizer
+    started = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+
+    visualizer = ModelVisualizer(model_path=model_path, output_dir=output_dir)
+    fingerprints = figure_fingerprints(visualizer)
+    manifest = {} if force else load_manifest(output_dir)
+
+    pending = []
+    skipped = []
+    for filename, method, _, _ in FIGURES:
+        previous = manifest.get(filename, {})
+        up_to_date = (previous.get('fingerprint') == fingerprints[filename]
+                      and os.path.exists(os.path.join(output_dir, filename)))
+        if up_to_date:
+            skipped.append(filename)
+        else:
+            pending.append((filename, method))
+
+    for filename in skipped:
+        print(f"   ♻️ {filename}: inputs unchanged, skipped")
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(pending) or 1))
+    results = []
+    if pending:
+        print(f"🎨 Rendering {len(pending)} figure(s) with {workers} worker(s)...\n")
+        _visualizer = visualizer
+        try:
+            if workers == 1:
+                results = [_render(filename, method) for filename, method in pending]
+            else:
+                with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                         initargs=(model_path, output_dir)) as executor:
+                    results = list(executor.map(_render, *zip(*pending)))
+        finally:
+            _visualizer = None
+
+    rendered, failed = [], []
+    figures = {name: entry for name, entry in manifest.items() if name in fingerprints}
+    for filename, seconds, ok in results:
+        if ok:
+            rendered.append(filename)
+            figures[filename] = {
+                'fingerprint': fingerprints[filename],
+                'rendered_at': datetime.now().isoformat(),
+                'seconds': seconds,
+            }
+        else:
+            failed.append(filename)
+            figures.pop(filename, None)
+    save_manifest(output_dir, model_path, figures)
+
+    return {
+        'rendered': rendered,
+        'skipped': skipped,
+        'failed': failed,
+        'seconds': round(time.perf_counter() - started, 3),
+        'stats': visualizer.stats,
+    }
+
+
+def print_summary(result, output_dir=DEFAULT_REPORTS_DIR):
+    print("\n" + "="*70)
+    print(f"✅ REPORTS: {len(result['rendered'])} rendered, {len(result['skipped'])} unchanged, "
+          f"{len(result['failed'])} failed in {result['seconds']:.2f}s")
+    print("="*70)
+    print(f"   📁 Location: {os.path.abspath(output_dir)}/\n")
+
+    for filename, _, _, description in FIGURES:
+        filepath = os.path.join(output_dir, filename)
+        if filename in result['failed'] or not os.path.exists(filepath):
+            print(f"   ⚠️  {filename:<35} | MISSING")
+        else:
+            size_kb = os.path.getsize(filepath) / 1024
+            marker = '♻️ ' if filename in result['skipped'] else '✅'
+            print(f"   {marker} {filename:<35} | {size_kb:>6.1f} KB | {description}")
+
+    stats = result['stats']
+    print("\n" + "=" * 70)
+    print("📈 MODEL STATISTICS SUMMARY")
+    print("=" * 70)
+    print(f"   👥 Total Users:           {stats['n_users']:>6,}")
+    print(f"   🏠 Total Rentals:         {stats['n_items']:>6,}")
+    print(f"   📊 Matrix Size:           {stats['n_users']:>6,} × {stats['n_items']:<6,} = {stats['total_cells']:>10,} cells")
+    print(f"   💾 Non-zero Cells:        {stats['nnz']:>10,}")
+    print(f"   📉 Matrix Sparsity:       {stats['sparsity']:>9.2f}%")
+    print(f"   📈 Matrix Density:        {stats['density']:>9.2f}%")
+    print("=" * 70 + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate model visualization reports from a saved artifact')
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    parser.add_argument('--output-dir', default=DEFAULT_REPORTS_DIR)
+    parser.add_argument('--workers', type=int, default=None, help='Số process vẽ song song (mặc định = số CPU)')
+    parser.add_argument('--force', action='store_true', help='Vẽ lại mọi biểu đồ, bỏ qua manifest')
+    args = parser.parse_args()
+
+    try:
+        result = generate_reports(args.model, args.output_dir, workers=args.workers, force=args.force)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"❌ {e}")
+        return 2
+
+    print_summary(result, args.output_dir)
+    return 1 if result['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,172 @@
+"""
+🔢 ID TABLE - Intern id dạng string (ObjectId / Firebase UID) thành code int32
+
+- code = thứ tự lúc build (0..n-1) -> dùng làm row của catalog / index của matrix
+- Key lưu dạng bytes độ dài cố định, sort sẵn -> tra bằng binary search (np.searchsorted),
+  không cần dict string -> int:
+    * toàn bộ là ObjectId (24 hex thường): 12 byte nhị phân / id ('S12')
+    * còn lại (Firebase UID, 'anonymous', ...): UTF-8, độ dài = id dài nhất
+- String chỉ được tạo lại ở biên (response, view dict cũ): id_at() / ids_at()
+
+Usage:
+    table = IdTable.build(item_encoder.classes_)
+    table.code('5f1d7c...')          # -> int | None
+    table.codes(['5f...', 'x'])      # -> int32 array, -1 = không có
+    table.id_at(3), table.ids_at(rows)
+"""
+import re
+from collections.abc import Mapping
+
+import numpy as np
+
+OBJECT_ID_BYTES = 12
+_OBJECT_ID = re.compile(r'[0-9a-f]{24}')
+
+
+def is_object_id(value):
+    """24 ký tự hex thường (dạng str(ObjectId) của Mongo)"""
+    return isinstance(value, str) and _OBJECT_ID.fullmatch(value) is not None
+
+
+class IdTable:
+    """Bảng id <-> code; xem docstring module"""
+
+    def __init__(self, keys, order=None, binary=False):
+        self.keys = keys            # bytes cố định, đã sort
+        self.order = order          # int32: vị trí trong keys -> code (None = keys theo đúng thứ tự code)
+        self.binary = binary
+        self.position = None        # int32: code -> vị trí trong keys
+        if order is not None:
+            self.position = np.empty(len(order), dtype=np.int32)
+            self.position[order] = np.arange(len(order), dtype=np.int32)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, value):
+        return self.code(value) is not None
+
+    # ==================== BUILD / PERSISTENCE ====================
+
+    @classmethod
+    def build(cls, ids):
+        """ids theo thứ tự code (vd. encoder.classes_, phần tử không trùng)"""
+        ids = [str(value) for value in ids]
+        binary = bool(ids) and all(is_object_id(value) for value in ids)
+        if binary:
+            encoded = [bytes.fromhex(value) for value in ids]
+            dtype = f'S{OBJECT_ID_BYTES}'
+        else:
+            encoded = [value.encode('utf-8') for value in ids]
+            dtype = f'S{max((len(key) for key in encoded), default=0) or 1}'
+        keys = np.array(encoded, dtype=dtype)
+
+        order = np.argsort(keys, kind='stable')
+        if np.array_equal(order, np.arange(len(keys))):
+            return cls(keys, binary=binary)
+        return cls(keys[order], order.astype(np.int32), binary=binary)
+
+    def to_state(self):
+        return {'keys': self.keys, 'order': self.order, 'binary': self.binary}
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(state['keys'], state['order'], state['binary'])
+
+    @property
+    def nbytes(self):
+        return int(self.keys.nbytes + sum(a.nbytes for a in (self.order, self.position) if a is not None))
+
+    # ==================== STRING -> CODE ====================
+
+    def _key(self, value):
+        """Key bytes của id (None nếu id không thể có trong bảng)"""
+        if self.binary:
+            # So khớp với phần tử đọc từ mảng 'S12' (đã mất \x00 ở cuối)
+            return bytes.fromhex(value).rstrip(b'\0') if is_object_id(value) else None
+        key = str(value).encode('utf-8')
+        # Dài hơn itemsize: numpy sẽ cắt khi so sánh -> match sai
+        return key if len(key) <= self.keys.itemsize else None
+
+    def code(self, value):
+        key = self._key(value)
+        if key is None or not len(self.keys):
+            return None
+        pos = int(np.searchsorted(self.keys, key))
+        if pos < len(self.keys) and self.keys[pos] == key:
+            return pos if self.order is None else int(self.order[pos])
+        return None
+
+    def codes(self, values):
+        """Vectorized code(); -1 cho id không có trong bảng"""
+        values = list(values)
+        result = np.full(len(values), -1, dtype=np.int32)
+        if not values or not len(self.keys):
+            return result
+        encoded = [self._key(value) for value in values]
+        valid = np.array([key is not None for key in encoded], dtype=bool)
+        if not valid.any():
+            return result
+        keys = np.array([key for key in encoded if key is not None], dtype=self.keys.dtype)
+        pos = np.searchsorted(self.keys, keys)
+        pos_clipped = np.minimum(pos, len(self.keys) - 1)
+        found = (pos < len(self.keys)) & (self.keys[pos_clipped] == keys)
+        found_codes = pos_clipped if self.order is None else self.order[pos_clipped]
+        result[np.flatnonzero(valid)[found]] = found_codes[found]
+        return result
+
+    # ==================== CODE -> STRING (biên) ====================
+
+    def _decode(self, raw):
+        if self.binary:
+            # numpy bỏ byte \x00 ở cuối khi đọc phần tử 'S12'
+            return raw.ljust(OBJECT_ID_BYTES, b'\0').hex()
+        return raw.decode('utf-8')
+
+    def id_at(self, code):
+        return self._decode(self.keys[code if self.position is None else self.position[code]])
+
+    def ids_at(self, codes):
+        codes = np.asarray(codes, dtype=np.int64)
+        positions = codes if self.position is None else self.position[codes]
+        return [self._decode(raw) for raw in self.keys[positions].tolist()]
+
+    def to_array(self, stop=None):
+        """Object array id theo thứ tự code (vd. classes_ cho LabelEncoder)"""
+        stop = len(self) if stop is None else stop
+        return np.array(self.ids_at(np.arange(stop)), dtype=object)
+
+
+class MaskedView(Mapping):
+    """
+    Mapping read-only id -> giá trị trên bảng dạng cột (code = row),
+    chỉ gồm các row có mask=True; call site cũ dùng như dict
+    """
+
+    def __init__(self, table, mask, value_at):
+        self._table = table
+        self._mask = mask
+        self._value_at = value_at
+        self._len = int(mask.sum())
+
+    def _row(self, value):
+        row = self._table.code(value)
+        return row if row is not None and self._mask[row] else None
+
+    def __getitem__(self, value):
+        row = self._row(value)
+        if row is None:
+            raise KeyError(value)
+        return self._value_at(row)
+
+    def __contains__(self, value):
+        return self._row(value) is not None
+
+    def __iter__(self):
+        return iter(self._table.ids_at(np.flatnonzero(self._mask)))
+
+    def __len__(self):
+        return self._len
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self._len} items>"
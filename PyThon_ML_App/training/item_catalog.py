@@ -0,0 +1,243 @@
+"""
+🗂️ ITEM CATALOG - Thông tin rental dạng cột (numpy), thẳng hàng với item index
+
+Thay 4 dict theo rentalId (item_features dict-of-dicts, rental_coordinates, rental_owners,
+popularity_scores) bằng các mảng:
+
+- Hàng 0..n_items-1 = item_encoder.classes_ (row == item_idx của matrix/similarity),
+  rental chỉ có trong rentals.csv (chưa có interaction) nối phía sau
+- price / area_total / longitude / latitude: float32, amenities_count: int32
+- propertyType / location_text / owner: int32 code + bảng giá trị (-1 = không có)
+- popularity: float64 (giữ nguyên điểm 0-100 như trước), has_* mask cho từng nguồn
+- rentalId / owner UID: IdTable (training/id_table.py) - ObjectId lưu 12 byte nhị phân,
+  tra string -> row bằng binary search, string chỉ tạo lại khi trả response
+
+Call site cũ dùng view read-only (Mapping): model.item_features.get(id, {}),
+model.rental_coordinates[id], len(model.popularity_scores)... vẫn chạy như dict.
+Hot path (recommend_for_user, get_popular_items) đọc thẳng mảng theo item_idx.
+
+Usage:
+    catalog = ItemCatalog.build(item_encoder.classes_, item_features, rental_coordinates,
+                                rental_owners, popularity_scores)
+    catalog.popularity[item_idx], catalog.row('5f...')
+    state = catalog.to_state()                     # lưu trong artifact
+    catalog = ItemCatalog.from_state(state)
+"""
+import sys
+
+import numpy as np
+
+from training.id_table import IdTable, MaskedView
+
+CATALOG_VERSION = 2
+
+
+def _encode_categories(values):
+    """list[str | None] -> (int32 codes, list categories) - None = -1"""
+    categories = {}
+    codes = np.full(len(values), -1, dtype=np.int32)
+    for i, value in enumerate(values):
+        if value is not None:
+            codes[i] = categories.setdefault(value, len(categories))
+    return codes, list(categories)
+
+
+def _py_float(value):
+    """float32 -> float Python ngắn nhất (105.802, không phải 105.80200195...)"""
+    if isinstance(value, np.float32):
+        return float(str(value))
+    return float(value)
+
+
+class ItemCatalog:
+    """Columnar catalog; xem docstring module"""
+
+    COLUMNS = ('price', 'area_total', 'longitude', 'latitude', 'amenities_count',
+               'property_type', 'location_text', 'owner', 'popularity',
+               'has_features', 'has_coordinates', 'has_popularity')
+
+    def __init__(self, rental_ids, columns, property_types, location_texts, owner_ids):
+        self.rental_ids = rental_ids    # IdTable: rentalId <-> row
+        self.owner_ids = owner_ids      # IdTable: owner UID <-> owner code
+        for name in self.COLUMNS:
+            setattr(self, name, columns[name])
+        self.property_types = list(property_types)
+        self.location_texts = list(location_texts)
+
+        # Thứ tự popularity giảm dần (stable) - get_popular_items không phải sort mỗi request
+        rows = np.flatnonzero(self.has_popularity)
+        self.popularity_order = rows[np.argsort(-self.popularity[rows], kind='stable')]
+
+    def __len__(self):
+        return len(self.rental_ids)
+
+    # ==================== BUILD ====================
+
+    @classmethod
+    def build(cls, item_ids, item_features, rental_coordinates, rental_owners, popularity_scores):
+        """Từ các dict cũ (output của các stage training); item_ids = item_encoder.classes_"""
+        ids = [str(rental_id) for rental_id in item_ids]
+        known = set(ids)
+        extra = set()
+        for mapping in (item_features, rental_coordinates, rental_owners, popularity_scores):
+            extra.update(rental_id for rental_id in mapping if rental_id not in known)
+        ids.extend(sorted(extra))
+        n = len(ids)
+
+        def column(values, dtype):
+            return np.asarray(values, dtype=dtype) if n else np.zeros(0, dtype=dtype)
+
+        features = [item_features.get(rental_id) for rental_id in ids]
+        coordinates = [rental_coordinates.get(rental_id) for rental_id in ids]
+        has_features = column([f is not None for f in features], bool)
+        has_coordinates = column([c is not None for c in coordinates], bool)
+
+        # Toạ độ: rental_coordinates, không có thì lấy từ item_features (cùng nguồn rentals_df)
+        lons = [c[0] if c is not None else (f.get('longitude', 0.0) if f else 0.0)
+                for c, f in zip(coordinates, features)]
+        lats = [c[1] if c is not None else (f.get('latitude', 0.0) if f else 0.0)
+                for c, f in zip(coordinates, features)]
+
+        property_type, property_types = _encode_categories([f.get('propertyType') if f else None for f in features])
+        location_text, location_texts = _encode_categories([f.get('location_text') if f else None for f in features])
+        owner, owners = _encode_categories([rental_owners.get(rental_id) for rental_id in ids])
+
+        popularity = [popularity_scores.get(rental_id) for rental_id in ids]
+
+        columns = {
+            'price': column([f.get('price', 0.0) if f else 0.0 for f in features], np.float32),
+            'area_total': column([f.get('area_total', 0.0) if f else 0.0 for f in features], np.float32),
+            'amenities_count': column([f.get('amenities_count', 0) if f else 0 for f in features], np.int32),
+            'longitude': column(lons, np.float32),
+            'latitude': column(lats, np.float32),
+            'property_type': property_type,
+            'location_text': location_text,
+            'owner': owner,
+            'popularity': column([p if p is not None else 0.0 for p in popularity], np.float64),
+            'has_features': has_features,
+            'has_coordinates': has_coordinates,
+            'has_popularity': column([p is not None for p in popularity], bool),
+        }
+        return cls(IdTable.build(ids), columns, property_types, location_texts, IdTable.build(owners))
+
+    # ==================== PERSISTENCE ====================
+
+    def to_state(self):
+        """Dict (mảng + list) để lưu trong artifact joblib"""
+        return {
+            'version': CATALOG_VERSION,
+            'rental_ids': self.rental_ids.to_state(),
+            'owner_ids': self.owner_ids.to_state(),
+            'columns': {name: getattr(self, name) for name in self.COLUMNS},
+            'property_types': self.property_types,
+            'location_texts': self.location_texts,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        if state.get('version', 1) < 2:
+            # Catalog v1: id lưu dạng object array / list string
+            rental_ids, owner_ids = IdTable.build(state['ids']), IdTable.build(state['owners'])
+        else:
+            rental_ids, owner_ids = IdTable.from_state(state['rental_ids']), IdTable.from_state(state['owner_ids'])
+        return cls(rental_ids, state['columns'], state['property_types'], state['location_texts'], owner_ids)
+
+    def memory_bytes(self):
+        """Mảng + bảng id (chính xác) + bảng category (ước lượng cho list string)"""
+        arrays = sum(getattr(self, name).nbytes for name in self.COLUMNS) + self.popularity_order.nbytes
+        tables = self.rental_ids.nbytes + self.owner_ids.nbytes
+        tables += sum(sys.getsizeof(s) for s in self.property_types + self.location_texts)
+        return int(arrays + tables)
+
+    # ==================== ACCESSORS ====================
+
+    def row(self, rental_id):
+        """Row của rental (None nếu không có trong catalog)"""
+        return self.rental_ids.code(rental_id)
+
+    def id_at(self, row):
+        return self.rental_ids.id_at(row)
+
+    def ids_at(self, rows):
+        return self.rental_ids.ids_at(rows)
+
+    def features_at(self, row):
+        """Dict features giống item_features cũ ({} nếu rental không có trong rentals.csv)"""
+        if not self.has_features[row]:
+            return {}
+        property_type = self.property_type[row]
+        location_text = self.location_text[row]
+        return {
+            'price': _py_float(self.price[row]),
+            'propertyType': self.property_types[property_type] if property_type >= 0 else 'unknown',
+            'location_text': self.location_texts[location_text] if location_text >= 0 else 'unknown',
+            'area_total': _py_float(self.area_total[row]),
+            'amenities_count': int(self.amenities_count[row]),
+            'longitude': _py_float(self.longitude[row]),
+            'latitude': _py_float(self.latitude[row]),
+        }
+
+    def feature_dicts(self, rows):
+        """
+        features_at cho nhiều row: mỗi cột chỉ tolist() 1 lần (dùng cho scoring theo batch).
+        Giá trị float32 -> float không làm tròn hiển thị ({} nếu row không có features)
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        types = [self.property_types[c] if c >= 0 else 'unknown' for c in self.property_type[rows].tolist()]
+        texts = [self.location_texts[c] if c >= 0 else 'unknown' for c in self.location_text[rows].tolist()]
+        return [
+            {
+                'price': price, 'propertyType': property_type, 'location_text': location_text,
+                'area_total': area, 'amenities_count': amenities, 'longitude': lon, 'latitude': lat,
+            } if has else {}
+            for has, price, property_type, location_text, area, amenities, lon, lat in zip(
+                self.has_features[rows].tolist(), self.price[rows].tolist(), types, texts,
+                self.area_total[rows].tolist(), self.amenities_count[rows].tolist(),
+                self.longitude[rows].tolist(), self.latitude[rows].tolist(),
+            )
+        ]
+
+    def coordinates_at(self, row):
+        return (_py_float(self.longitude[row]), _py_float(self.latitude[row]))
+
+    def rows_owned_by(self, owner_id):
+        code = self.owner_ids.code(owner_id)
+        if code is None:
+            return np.zeros(0, dtype=np.int64)
+        return np.flatnonzero(self.owner == code)
+
+    def valid_coordinates_count(self):
+        """Số rental có toạ độ khác (0, 0)"""
+        return int((self.has_coordinates & (self.longitude != 0) & (self.latitude != 0)).sum())
+
+    # ==================== DICT VIEWS (call site cũ) ====================
+
+    def feature_view(self):
+        return MaskedView(self.rental_ids, self.has_features, self.features_at)
+
+    def coordinate_view(self):
+        return MaskedView(self.rental_ids, self.has_coordinates, self.coordinates_at)
+
+    def owner_view(self):
+        return MaskedView(self.rental_ids, self.owner >= 0, lambda row: self.owner_ids.id_at(self.owner[row]))
+
+    def popularity_view(self):
+        return MaskedView(self.rental_ids, self.has_popularity, lambda row: self.popularity[row])
+
+
+def artifact_item_maps(model_data):
+    """
+    {item_features, rental_coordinates, rental_owners, popularity_scores} từ artifact dict
+    (artifact mới: view trên item_catalog; artifact cũ: dict lưu sẵn)
+    """
+    state = model_data.get('item_catalog')
+    if state is None:
+        return {name: model_data.get(name) or {}
+                for name in ('item_features', 'rental_coordinates', 'rental_owners', 'popularity_scores')}
+    catalog = ItemCatalog.from_state(state)
+    return {
+        'item_features': catalog.feature_view(),
+        'rental_coordinates': catalog.coordinate_view(),
+        'rental_owners': catalog.owner_view(),
+        'popularity_scores': catalog.popularity_view(),
+    }
@@ -0,0 +1,101 @@
+"""
+🧮 MEMORY REPORT - Dung lượng từng component của model trong RAM và peak lúc train/load
+
+- deep_sizeof(obj): bytes thực trong RAM, đi hết cấu trúc lồng nhau (dict-of-dicts, list, set,
+  object có __dict__ như LabelEncoder / catalog / IdTable); array / sparse tính theo buffer;
+  DataFrame dùng memory_usage(deep=True); object dùng chung chỉ đếm 1 lần (seen)
+- track_peak(peaks, 'train'): đo peak Python heap bằng tracemalloc trong khối with
+
+MaskedView (item_features, rental_coordinates, ... sau train/load) chỉ tính vỏ object:
+dữ liệu thật nằm trong item_catalog / user_catalog và được tính ở đó.
+Trên disk chỉ có tổng size artifact (manifest): đo theo từng component phải serialize lần 2.
+
+Usage:
+    from training.memory_report import deep_sizeof, track_peak
+    peaks = {}
+    with track_peak(peaks, 'load'):
+        model_data = joblib.load(path)
+    deep_sizeof(model_data['user_item_matrix'])
+"""
+import sys
+import time
+import types
+import tracemalloc
+from contextlib import contextmanager
+
+# numpy/scipy import trong hàm: model_manifest.read_manifest() không cần các thư viện này
+
+_OPAQUE = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType,
+           types.MethodType, types.LambdaType)
+
+
+# ==================== IN MEMORY ====================
+
+def deep_sizeof(obj, seen=None):
+    """Bytes trong RAM của obj và mọi thứ nó giữ (seen: set id() dùng chung giữa nhiều component)"""
+    import numpy as np
+    from scipy.sparse import issparse
+    from training.id_table import MaskedView
+
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    if isinstance(obj, np.ndarray):
+        if obj.dtype == object:
+            return int(obj.nbytes + sum(deep_sizeof(x, seen) for x in obj.ravel()))
+        # View (base khác None): buffer thuộc array gốc, chỉ đếm 1 lần
+        if obj.base is not None and isinstance(obj.base, np.ndarray) and not isinstance(obj, np.memmap):
+            return int(sys.getsizeof(obj) + deep_sizeof(obj.base, seen))
+        return int(obj.nbytes)
+    if issparse(obj):
+        return int(sys.getsizeof(obj) + sum(deep_sizeof(value, seen) for value in vars(obj).values()
+                                            if isinstance(value, np.ndarray)))
+    if isinstance(obj, MaskedView) or isinstance(obj, _OPAQUE):
+        return int(sys.getsizeof(obj))
+    if hasattr(obj, 'memory_usage') and hasattr(obj, 'columns'):
+        # pandas DataFrame
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    if isinstance(obj, dict):
+        return int(sys.getsizeof(obj) + sum(deep_sizeof(key, seen) + deep_sizeof(value, seen)
+                                            for key, value in obj.items()))
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return int(sys.getsizeof(obj) + sum(deep_sizeof(x, seen) for x in obj))
+    size = sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'):
+        size += deep_sizeof(vars(obj), seen)
+    return int(size)
+
+
+# ==================== PEAKS (TRACEMALLOC) ====================
+
+@contextmanager
+def track_peak(peaks, stage, enabled=True):
+    """
+    peaks[stage] = {'peak_bytes', 'retained_bytes', 'seconds'} của Python heap trong khối with
+
+    Nếu tracemalloc đã bật từ ngoài (vd. benchmarks --tracemalloc) thì chỉ reset peak,
+    không tắt khi xong. enabled=False: không đo (tracemalloc làm chậm code Python ~20%).
+    """
+    if not enabled:
+        yield
+        return
+    owner = not tracemalloc.is_tracing()
+    if owner:
+        tracemalloc.start()
+    else:
+        tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        current, peak = tracemalloc.get_traced_memory()
+        if owner:
+            tracemalloc.stop()
+        peaks[stage] = {
+            'peak_bytes': int(max(peak - baseline, 0)),
+            'retained_bytes': int(current - baseline),
+            'seconds': round(time.perf_counter() - started, 4),
+        }
@@ -0,0 +1,156 @@
+"""
+📋 MODEL MANIFEST - Metadata nhỏ (JSON) ghi cạnh artifact lúc save()
+
+recommendation_model.pkl  ->  recommendation_model.pkl.manifest.json
+
+Chứa shape / nnz / sparsity / số lượng / dung lượng từng component trong RAM / size artifact / trained_at
++ peak tracemalloc lúc train
+-> inspect_model.py đọc manifest (vài KB) thay vì deserialize cả artifact.
+artifact.size_bytes + mtime dùng để phát hiện manifest cũ (artifact bị ghi đè mà không có manifest mới).
+
+Usage:
+    from training.model_manifest import write_manifest, read_manifest
+    write_manifest(model_data, './models/recommendation_model.pkl')
+    manifest = read_manifest('./models/recommendation_model.pkl')   # None nếu chưa có
+"""
+import os
+import json
+from datetime import datetime
+
+# numpy/scipy import trong hàm: read_manifest() (inspect_model.py) chỉ cần json, không tốn ~200ms import
+
+MANIFEST_VERSION = 2
+MANIFEST_SUFFIX = '.manifest.json'
+
+
+def manifest_path(model_path):
+    return f"{model_path}{MANIFEST_SUFFIX}"
+
+
+# ==================== COMPONENT SIZE ====================
+
+def describe_component(obj, seen=None):
+    """
+    Type + shape/nnz/dtype (array, sparse) hoặc len (dict, set, encoder, catalog) + bytes trong RAM
+    (deep size - training/memory_report.py; seen: set dùng chung để không đếm 2 lần object chung)
+    """
+    import numpy as np
+    from scipy.sparse import issparse
+    from training.memory_report import deep_sizeof
+    
+    info = {'type': type(obj).__name__}
+    if obj is None:
+        return info
+    if issparse(obj) or hasattr(obj, 'nnz'):
+        # scipy sparse + QuantizedCSR (training/sparse_storage.py, dtype = int8)
+        info.update(shape=list(obj.shape), nnz=int(obj.nnz), dtype=str(obj.dtype))
+    elif isinstance(obj, np.ndarray):
+        info.update(shape=list(obj.shape), dtype=str(obj.dtype))
+    elif hasattr(obj, 'classes_'):
+        info.update(len=int(len(obj.classes_)))
+    elif hasattr(obj, '__len__'):
+        info.update(len=int(len(obj)))
+    info['bytes'] = deep_sizeof(obj, seen)
+    return info
+
+
+# ==================== BUILD / WRITE / READ ====================
+
+def build_manifest(model_data, model_path=None, memory_peaks=None):
+    """
+    Manifest từ dict artifact (cùng dict mà save() đưa vào joblib.dump)
+    
+    components[name]: bytes = trong RAM sau load (trên disk chỉ có tổng: artifact.size_bytes -
+    đo từng component phải serialize lần 2 lúc save)
+    memory_peaks: model.memory_peaks lúc save (peak tracemalloc của train)
+    """
+    matrix = model_data.get('user_item_matrix')
+    n_users, n_items = (int(matrix.shape[0]), int(matrix.shape[1])) if matrix is not None else (0, 0)
+    nnz = int(matrix.nnz) if matrix is not None else 0
+    total_cells = n_users * n_items
+    sparsity = 100 * (1 - nnz / total_cells) if total_cells else 100.0
+
+    from training.item_catalog import artifact_item_maps
+    from training.user_catalog import artifact_user_locations
+    item_maps = artifact_item_maps(model_data)
+    incremental_state = model_data.get('incremental_state') or {}
+    rental_coordinates = item_maps['rental_coordinates']
+    valid_coordinates = sum(1 for lon, lat in rental_coordinates.values() if lon != 0 and lat != 0)
+
+    components = {}
+    for name, value in model_data.items():
+        if name in ('trained_at', 'matrix_sparsity', 'matrix_density', 'similarity_top_k', 'matrix_storage'):
+            continue
+        components[name] = describe_component(value)
+    
+    manifest = {
+        'manifest_version': MANIFEST_VERSION,
+        'trained_at': model_data.get('trained_at'),
+        'saved_at': datetime.now().isoformat(),
+        'matrix': {
+            'shape': [n_users, n_items],
+            'nnz': nnz,
+            'sparsity': round(sparsity, 4),
+            'density': round(100 - sparsity, 4),
+            'dtype': str(matrix.dtype) if matrix is not None else None,
+        },
+        'counts': {
+            'users': n_users,
+            'items': n_items,
+            'interactions': nnz,
+            'popularity_items': len(item_maps['popularity_scores']),
+            'item_features': len(item_maps['item_features']),
+            'rental_coordinates': len(rental_coordinates),
+            'valid_rental_coordinates': valid_coordinates,
+            'user_locations': len(artifact_user_locations(model_data)),
+            'rental_owners': len(item_maps['rental_owners']),
+            'anonymous_rentals': len(incremental_state['anonymous_rows']) if incremental_state
+                                 else len(model_data.get('anonymous_rentals') or ()),
+        },
+        'config': {
+            'similarity_top_k': model_data.get('similarity_top_k'),
+            'matrix_storage': model_data.get('matrix_storage', 'float64'),
+        },
+        'components': components,
+        'memory_peaks': {stage: peak for stage, peak in (memory_peaks or {}).items() if stage == 'train'},
+    }
+    if model_path is not None and os.path.exists(model_path):
+        stat = os.stat(model_path)
+        manifest['artifact'] = {
+            'file': os.path.basename(model_path),
+            'size_bytes': int(stat.st_size),
+            'mtime': stat.st_mtime,
+        }
+    return manifest
+
+
+def write_manifest(model_data, model_path, memory_peaks=None):
+    """Ghi manifest sau khi artifact đã được dump (cần size/mtime của file artifact)"""
+    manifest = build_manifest(model_data, model_path, memory_peaks)
+    path = manifest_path(model_path)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False, default=str)
+    os.replace(tmp_path, path)
+    return manifest
+
+
+def read_manifest(model_path):
+    """Manifest của artifact -> dict (None nếu không có / hỏng)"""
+    path = manifest_path(model_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_stale(manifest, model_path):
+    """True khi artifact trên disk không còn khớp size/mtime lúc ghi manifest"""
+    artifact = manifest.get('artifact')
+    if not artifact or not os.path.exists(model_path):
+        return True
+    stat = os.stat(model_path)
+    return stat.st_size != artifact['size_bytes'] or abs(stat.st_mtime - artifact['mtime']) > 1e-3
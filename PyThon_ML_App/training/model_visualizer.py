@@ -8,12 +8,73 @@ from datetime import datetime
 import joblib
 from matplotlib import rcParams
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from training.item_catalog import artifact_item_maps
+from training.user_catalog import artifact_user_locations
+
 # Cấu hình font cho Vietnamese
 rcParams['font.sans-serif'] = ['DejaVu Sans']
 rcParams['axes.unicode_minus'] = False
 
+# Giới hạn vẽ: memory/thời gian không phụ thuộc kích thước matrix
+TOP_N_MATRIX = 50          # heatmap chi tiết: top-N users × top-N items theo hoạt động
+TOP_N_SIMILARITY = 15      # similarity heatmap: top-N users
+TOP_N_BARS = 30            # bar chart interactions per user
+DENSITY_BINS = 200         # ảnh mật độ toàn matrix: tối đa 200 × 200 block
+MAX_PLOT_POINTS = 2000     # đường cumulative / pareto: lấy mẫu tối đa N điểm
+MAX_SAMPLE_VALUES = 100_000  # box plot: lấy mẫu tối đa N giá trị
+MAX_SCATTER_POINTS = 1000  # geo: nhiều hơn -> hexbin
+MAX_ANNOTATIONS = 50       # geo: chỉ ghi nhãn khi ít điểm
+
+
+def _top_indices(values, n):
+    """Index của n giá trị lớn nhất (giảm dần) - argpartition, không sort toàn bộ"""
+    values = np.asarray(values)
+    if len(values) <= n:
+        return np.argsort(values)[::-1]
+    top = np.argpartition(values, len(values) - n)[len(values) - n:]
+    return top[np.argsort(values[top])[::-1]]
+
+
+def _block_density(matrix, bins=DENSITY_BINS):
+    """
+    Ảnh mật độ (≤ bins × bins) từ cấu trúc sparse: tỉ lệ ô khác 0 trong mỗi block
+    
+    Chỉ dùng indptr/indices (không toarray) -> memory O(nnz + bins²).
+    """
+    matrix = matrix.tocsr()
+    n_rows, n_cols = matrix.shape
+    row_bins, col_bins = max(1, min(bins, n_rows)), max(1, min(bins, n_cols))
+    
+    rows = np.repeat(np.arange(n_rows, dtype=np.int64), np.diff(matrix.indptr))
+    row_block = rows * row_bins // max(n_rows, 1)
+    col_block = matrix.indices.astype(np.int64) * col_bins // max(n_cols, 1)
+    counts = np.bincount(row_block * col_bins + col_block, minlength=row_bins * col_bins)
+    counts = counts.reshape(row_bins, col_bins).astype(np.float64)
+    
+    # Số ô thực tế của mỗi block (block cuối có thể nhỏ hơn)
+    row_sizes = np.bincount(np.arange(n_rows, dtype=np.int64) * row_bins // max(n_rows, 1), minlength=row_bins)
+    col_sizes = np.bincount(np.arange(n_cols, dtype=np.int64) * col_bins // max(n_cols, 1), minlength=col_bins)
+    cells = np.outer(row_sizes, col_sizes)
+    return np.divide(counts, cells, out=np.zeros_like(counts), where=cells > 0)
+
+
+def _curve_points(n, max_points=MAX_PLOT_POINTS):
+    """Index lấy mẫu đều trên [0, n) (luôn gồm điểm đầu/cuối) để vẽ đường dài"""
+    if n <= max_points:
+        return np.arange(n)
+    return np.unique(np.linspace(0, n - 1, max_points).astype(np.int64))
+
+
+def _sample_values(values, max_values=MAX_SAMPLE_VALUES, seed=0):
+    values = np.asarray(values)
+    if len(values) <= max_values:
+        return values
+    return np.random.default_rng(seed).choice(values, size=max_values, replace=False)
+
 class ModelVisualizer:
-    def __init__(self, model_path='./models/recommendation_model.pkl'):
+    def __init__(self, model_path='./models/recommendation_model.pkl', output_dir='./reports'):
         """Load model và chuẩn bị visualization"""
         print("\n" + "="*70)
         print("📊 MODEL VISUALIZER - PHÂN TÍCH MÔ HÌNH AI (FIXED)")
@@ -62,9 +123,10 @@ class ModelVisualizer:
             self.item_similarity = model_data.get('item_similarity')
             self.user_encoder = model_data.get('user_encoder')
             self.item_encoder = model_data.get('item_encoder')
-            self.popularity_scores = model_data.get('popularity_scores', {})
-            self.rental_coordinates = model_data.get('rental_coordinates', {})
-            self.user_locations = model_data.get('user_locations', {})
+            item_maps = artifact_item_maps(model_data)  # artifact mới: view trên item_catalog
+            self.popularity_scores = item_maps['popularity_scores']
+            self.rental_coordinates = item_maps['rental_coordinates']
+            self.user_locations = artifact_user_locations(model_data)
             
             # 🔥 CRITICAL FIX: Validate critical components before calculating stats
             if self.user_item_matrix is None:
@@ -76,10 +138,11 @@ class ModelVisualizer:
             if not hasattr(self.user_item_matrix, 'nnz'):
                 raise ValueError(f"user_item_matrix has no nnz attribute (type: {type(self.user_item_matrix)})")
             
-            if self.user_encoder is None:
+            # Artifact mới: id nằm trong user_catalog / item_catalog thay cho encoder
+            if self.user_encoder is None and model_data.get('user_catalog') is None:
                 raise ValueError("user_encoder is None")
             
-            if self.item_encoder is None:
+            if self.item_encoder is None and model_data.get('item_catalog') is None:
                 raise ValueError("item_encoder is None")
             
             print("✅ All critical components validated")
@@ -96,7 +159,7 @@ class ModelVisualizer:
                 print(f"   Attributes: {dir(self.user_item_matrix)}")
             raise
         
-        self.output_dir = './reports'
+        self.output_dir = output_dir
         os.makedirs(self.output_dir, exist_ok=True)
         
         plt.style.use('seaborn-v0_8-whitegrid')
@@ -182,22 +245,35 @@ class ModelVisualizer:
                 print("   ⚠️ user_item_matrix is None, skipping")
                 return self.stats
             
-            if not hasattr(self.user_item_matrix, 'toarray'):
-                print(f"   ⚠️ user_item_matrix cannot be converted to array (type: {type(self.user_item_matrix)})")
+            if not hasattr(self.user_item_matrix, 'tocsr'):
+                print(f"   ⚠️ user_item_matrix is not a sparse matrix (type: {type(self.user_item_matrix)})")
                 return self.stats
             
-            matrix_dense = self.user_item_matrix.toarray()
+            matrix = self.user_item_matrix.tocsr()
+            user_activity = np.asarray(matrix.getnnz(axis=1)).ravel()
+            item_activity = np.asarray(matrix.getnnz(axis=0)).ravel()
             
-            fig = plt.figure(figsize=(16, 8))
+            # Chi tiết: top-N users × top-N items (giữ thứ tự gốc khi matrix đủ nhỏ)
+            if matrix.shape[0] <= TOP_N_MATRIX and matrix.shape[1] <= TOP_N_MATRIX:
+                user_idx, item_idx = np.arange(matrix.shape[0]), np.arange(matrix.shape[1])
+                title = 'User-Item Interaction Matrix\n(Darker = More interactions)'
+            else:
+                user_idx = np.sort(_top_indices(user_activity, TOP_N_MATRIX))
+                item_idx = np.sort(_top_indices(item_activity, TOP_N_MATRIX))
+                title = (f'User-Item Matrix: top {len(user_idx)} users × top {len(item_idx)} items\n'
+                         f'(by activity, Darker = More interactions)')
+            matrix_dense = matrix[user_idx][:, item_idx].toarray()
+            
+            fig = plt.figure(figsize=(24, 8))
             
             # Main heatmap
-            ax = plt.subplot(1, 2, 1)
+            ax = plt.subplot(1, 3, 1)
             im = ax.imshow(matrix_dense, cmap='YlOrRd', aspect='auto')
             
             # Thêm text annotations cho small matrix
-            if self.stats['n_users'] <= 20 and self.stats['n_items'] <= 30:
-                for i in range(self.stats['n_users']):
-                    for j in range(self.stats['n_items']):
+            if matrix_dense.shape[0] <= 20 and matrix_dense.shape[1] <= 30:
+                for i in range(matrix_dense.shape[0]):
+                    for j in range(matrix_dense.shape[1]):
                         value = matrix_dense[i, j]
                         if value > 0:
                             text_color = 'white' if value > matrix_dense.max() / 2 else 'black'
@@ -206,13 +282,23 @@ class ModelVisualizer:
             
             ax.set_xlabel('Items (Rentals)', fontsize=12, fontweight='bold')
             ax.set_ylabel('Users', fontsize=12, fontweight='bold')
-            ax.set_title('User-Item Interaction Matrix\n(Darker = More interactions)', 
-                        fontsize=13, fontweight='bold')
+            ax.set_title(title, fontsize=13, fontweight='bold')
             
             plt.colorbar(im, ax=ax, label='Interaction Score')
             
+            # Toàn matrix: mật độ theo block (không toarray)
+            ax = plt.subplot(1, 3, 2)
+            density = _block_density(matrix)
+            im = ax.imshow(density * 100, cmap='viridis', aspect='auto', interpolation='nearest',
+                           extent=(0, matrix.shape[1], matrix.shape[0], 0))
+            ax.set_xlabel('Items (Rentals)', fontsize=12, fontweight='bold')
+            ax.set_ylabel('Users', fontsize=12, fontweight='bold')
+            ax.set_title(f'Full Matrix Density\n({density.shape[0]} × {density.shape[1]} blocks)',
+                         fontsize=13, fontweight='bold')
+            plt.colorbar(im, ax=ax, label='Non-zero cells (%)')
+            
             # Statistics panel
-            ax2 = plt.subplot(1, 2, 2)
+            ax2 = plt.subplot(1, 3, 3)
             ax2.axis('off')
             
             stats_text = f"""
@@ -318,7 +404,7 @@ RECOMMENDATIONS:
             
             # 2. Box plot
             ax = axes[0, 1]
-            bp = ax.boxplot(scores, vert=True, patch_artist=True, widths=0.5)
+            bp = ax.boxplot(_sample_values(scores), vert=True, patch_artist=True, widths=0.5)
             bp['boxes'][0].set_facecolor('lightblue')
             ax.set_title('Score Distribution (Box Plot)', fontsize=12, fontweight='bold')
             ax.set_ylabel('Score Value', fontsize=11)
@@ -328,6 +414,8 @@ RECOMMENDATIONS:
             ax = axes[1, 0]
             sorted_scores = np.sort(scores)
             cumulative = np.cumsum(sorted_scores) / np.sum(sorted_scores)
+            points = _curve_points(len(sorted_scores))
+            sorted_scores, cumulative = sorted_scores[points], cumulative[points]
             ax.plot(sorted_scores, cumulative * 100, linewidth=2, color='darkgreen')
             ax.fill_between(sorted_scores, cumulative * 100, alpha=0.3, color='lightgreen')
             ax.set_title('Cumulative Distribution Function', fontsize=12, fontweight='bold')
@@ -381,7 +469,7 @@ RECOMMENDATIONS:
     # ==================== BIỂU ĐỒ 3: User Similarity ====================
     
     def plot_user_similarity_heatmap(self):
-        """📊 User similarity - Chỉ top 15 users"""
+        """📊 User similarity - Chỉ top 15 users (theo hoạt động)"""
         print("📊 [3/7] Creating User Similarity visualization...")
         
         try:
@@ -389,19 +477,23 @@ RECOMMENDATIONS:
                 print("   ⚠️ user_similarity is None\n")
                 return
             
-            if hasattr(self.user_similarity, 'toarray'):
-                sim_matrix = self.user_similarity.toarray()
+            # Chỉ cắt top-N hàng/cột rồi mới densify (không toarray cả n × n)
+            user_activity = np.asarray(self.user_item_matrix.getnnz(axis=1)).ravel()
+            user_idx = np.sort(_top_indices(user_activity, TOP_N_SIMILARITY))
+            user_idx = user_idx[user_idx < self.user_similarity.shape[0]]
+            
+            if hasattr(self.user_similarity, 'tocsr'):
+                sim_matrix = self.user_similarity.tocsr()[user_idx][:, user_idx].toarray()
             else:
-                sim_matrix = self.user_similarity
+                sim_matrix = np.asarray(self.user_similarity)[np.ix_(user_idx, user_idx)]
             
-            max_size = min(15, sim_matrix.shape[0])
-            sim_matrix = sim_matrix[:max_size, :max_size]
+            max_size = len(user_idx)
             
             fig, ax = plt.subplots(figsize=(12, 10))
             
             im = ax.imshow(sim_matrix, cmap='RdBu_r', vmin=-1, vmax=1, aspect='auto')
             
-            user_labels = [f'U{i+1}' for i in range(max_size)]
+            user_labels = [f'U{i+1}' for i in user_idx]
             ax.set_xticks(range(max_size))
             ax.set_yticks(range(max_size))
             ax.set_xticklabels(user_labels, rotation=45)
@@ -473,6 +565,23 @@ RECOMMENDATIONS:
     
     # ==================== BIỂU ĐỒ 5: Geographic Distribution ====================
     
+    def _plot_locations(self, ax, lons, lats, cmap, edgecolor, marker, size, label_prefix, colorbar_label):
+        """Ít điểm: scatter (+ nhãn khi ≤ MAX_ANNOTATIONS); nhiều điểm: hexbin mật độ"""
+        lons, lats = np.asarray(lons, dtype=float), np.asarray(lats, dtype=float)
+        
+        if len(lons) > MAX_SCATTER_POINTS:
+            hb = ax.hexbin(lons, lats, gridsize=60, cmap=cmap, mincnt=1, bins='log')
+            plt.colorbar(hb, ax=ax, label='Count (log)')
+            return
+        
+        scatter = ax.scatter(lons, lats, s=size, alpha=0.7, c=range(len(lons)), cmap=cmap,
+                             edgecolors=edgecolor, linewidth=2, marker=marker)
+        if len(lons) <= MAX_ANNOTATIONS:
+            for i, (lon, lat) in enumerate(zip(lons, lats)):
+                ax.annotate(f'{label_prefix}{i+1}', (lon, lat), fontsize=8,
+                            xytext=(5, 5), textcoords='offset points')
+        plt.colorbar(scatter, ax=ax, label=colorbar_label)
+    
     def plot_geographic_distribution(self):
         """🌍 Geographic distribution"""
         print("📊 [5/7] Creating Geographic distribution...")
@@ -482,47 +591,27 @@ RECOMMENDATIONS:
             
             # Rentals
             if self.rental_coordinates:
-                valid_coords = {k: v for k, v in self.rental_coordinates.items() 
-                              if v[0] != 0 and v[1] != 0}
+                valid_coords = [v for v in self.rental_coordinates.values() if v[0] != 0 and v[1] != 0]
                 
                 if valid_coords:
-                    rental_lons = [coord[0] for coord in valid_coords.values()]
-                    rental_lats = [coord[1] for coord in valid_coords.values()]
-                    
-                    scatter1 = ax1.scatter(rental_lons, rental_lats, s=200, alpha=0.7, 
-                                         c=range(len(rental_lons)), cmap='Reds', 
-                                         edgecolors='darkred', linewidth=2)
-                    
-                    for i, (lon, lat) in enumerate(zip(rental_lons, rental_lats)):
-                        ax1.annotate(f'R{i+1}', (lon, lat), fontsize=8, 
-                                   xytext=(5, 5), textcoords='offset points')
-                    
+                    self._plot_locations(ax1, [c[0] for c in valid_coords], [c[1] for c in valid_coords],
+                                         'Reds', 'darkred', 'o', 200, 'R', 'Rental Index')
                     ax1.set_title(f'Rental Locations ({len(valid_coords)} with coordinates)', 
                                 fontsize=13, fontweight='bold')
                     ax1.set_xlabel('Longitude', fontsize=11)
                     ax1.set_ylabel('Latitude', fontsize=11)
                     ax1.grid(True, alpha=0.3)
-                    plt.colorbar(scatter1, ax=ax1, label='Rental Index')
             
             # Users
             if self.user_locations:
-                user_lons = [coord[0] for coord in self.user_locations.values()]
-                user_lats = [coord[1] for coord in self.user_locations.values()]
-                
-                scatter2 = ax2.scatter(user_lons, user_lats, s=250, alpha=0.7,
-                                     c=range(len(user_lons)), cmap='Blues',
-                                     edgecolors='darkblue', linewidth=2, marker='^')
-                
-                for i, (lon, lat) in enumerate(zip(user_lons, user_lats)):
-                    ax2.annotate(f'U{i+1}', (lon, lat), fontsize=8,
-                               xytext=(5, 5), textcoords='offset points')
-                
+                coords = list(self.user_locations.values())
+                self._plot_locations(ax2, [c[0] for c in coords], [c[1] for c in coords],
+                                     'Blues', 'darkblue', '^', 250, 'U', 'User Index')
                 ax2.set_title(f'User Location Centroids ({len(self.user_locations)} users)', 
                              fontsize=13, fontweight='bold')
                 ax2.set_xlabel('Longitude', fontsize=11)
                 ax2.set_ylabel('Latitude', fontsize=11)
                 ax2.grid(True, alpha=0.3)
-                plt.colorbar(scatter2, ax=ax2, label='User Index')
             
             plt.tight_layout()
             output_path = os.path.join(self.output_dir, '5_geographic_distribution.png')
@@ -544,13 +633,19 @@ RECOMMENDATIONS:
             
             fig, axes = plt.subplots(2, 2, figsize=(15, 10))
             
-            # 1. Bar chart
+            # 1. Bar chart (tối đa TOP_N_BARS users hoạt động nhiều nhất)
             ax = axes[0, 0]
-            users = [f'U{i+1}' for i in range(len(interactions_count))]
+            if len(interactions_count) <= TOP_N_BARS:
+                user_idx = np.arange(len(interactions_count))
+                title = 'Interactions per User (Bar Chart)'
+            else:
+                user_idx = _top_indices(interactions_count, TOP_N_BARS)
+                title = f'Top {TOP_N_BARS} Users by Interactions'
+            users = [f'U{i+1}' for i in user_idx]
             colors = plt.cm.Pastel1(np.linspace(0, 1, len(users)))
-            bars = ax.bar(users, interactions_count, color=colors, edgecolor='black', linewidth=1.5)
+            bars = ax.bar(users, interactions_count[user_idx], color=colors, edgecolor='black', linewidth=1.5)
             
-            ax.set_title('Interactions per User (Bar Chart)', fontsize=12, fontweight='bold')
+            ax.set_title(title, fontsize=12, fontweight='bold')
             ax.set_xlabel('User', fontsize=11)
             ax.set_ylabel('Total Score', fontsize=11)
             ax.tick_params(axis='x', rotation=45)
@@ -564,7 +659,7 @@ RECOMMENDATIONS:
             
             # 2. Distribution histogram
             ax = axes[0, 1]
-            counts, bins, patches = ax.hist(interactions_count, bins=max(10, len(interactions_count)//2), 
+            counts, bins, patches = ax.hist(interactions_count, bins=min(max(10, len(interactions_count)//2), 50), 
                                            edgecolor='black', color='skyblue', alpha=0.7)
             ax.set_title('Distribution of User Activity', fontsize=12, fontweight='bold')
             ax.set_xlabel('Total Score', fontsize=11)
@@ -575,9 +670,11 @@ RECOMMENDATIONS:
             ax = axes[1, 0]
             sorted_interactions = np.sort(interactions_count)[::-1]
             cumsum = np.cumsum(sorted_interactions)
-            ax.plot(range(len(sorted_interactions)), cumsum, marker='o', 
+            points = _curve_points(len(cumsum))
+            marker = 'o' if len(cumsum) <= 100 else None
+            ax.plot(points, cumsum[points], marker=marker, 
                    linewidth=2, markersize=8, color='darkgreen')
-            ax.fill_between(range(len(sorted_interactions)), cumsum, alpha=0.3, color='lightgreen')
+            ax.fill_between(points, cumsum[points], alpha=0.3, color='lightgreen')
             ax.set_title('Cumulative Interactions (Pareto)', fontsize=12, fontweight='bold')
             ax.set_xlabel('User Rank', fontsize=11)
             ax.set_ylabel('Cumulative Score', fontsize=11)
@@ -630,7 +727,7 @@ RECOMMENDATIONS:
             fig, axes = plt.subplots(2, 2, figsize=(15, 10))
             
             # Get top 20
-            top_indices = np.argsort(interactions_count)[::-1][:20]
+            top_indices = _top_indices(interactions_count, 20)
             top_counts = interactions_count[top_indices]
             
             # 1. Bar chart (top 20)
@@ -664,10 +761,12 @@ RECOMMENDATIONS:
             cumsum = np.cumsum(sorted_scores)
             cumsum_pct = (cumsum / cumsum[-1]) * 100 if cumsum[-1] > 0 else cumsum * 0
             
-            ax.plot(range(len(cumsum_pct)), cumsum_pct, marker='o', linewidth=2.5, 
+            points = _curve_points(len(cumsum_pct))
+            marker = 'o' if len(cumsum_pct) <= 100 else None
+            ax.plot(points, cumsum_pct[points], marker=marker, linewidth=2.5, 
                    markersize=7, color='darkred', label='Cumulative %')
             ax.axhline(y=80, color='green', linestyle='--', linewidth=2, label='80% threshold')
-            ax.fill_between(range(len(cumsum_pct)), cumsum_pct, alpha=0.3, color='lightcoral')
+            ax.fill_between(points, cumsum_pct[points], alpha=0.3, color='lightcoral')
             
             idx_80 = np.where(cumsum_pct >= 80)[0][0] if any(cumsum_pct >= 80) else len(cumsum_pct)
             ax.axvline(x=idx_80, color='orange', linestyle=':', linewidth=2, 
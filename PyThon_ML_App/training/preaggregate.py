@@ -0,0 +1,107 @@
+"""
+🧹 PRE-AGGREGATION - Gộp interaction nhiễu trước khi build matrix
+
+interactions.csv phần lớn là `anonymous` + `view` lặp lại cách nhau vài giây trên cùng 1 bài.
+Stage này chạy trước prepare_data():
+
+1. Collapse: (userId, rentalId, interactionType, cửa sổ thời gian) -> 1 dòng
+   - eventCount = số event gốc trong cửa sổ
+   - interactionScore = điểm 1 event (score_mode='once') hoặc tổng (score_mode='sum')
+   - Cửa sổ cố định theo timestamp.floor(window) (event sát ranh giới có thể rơi vào 2 cửa sổ)
+2. Split: traffic anonymous tách khỏi CF matrix -> stream chỉ dùng cho popularity
+   (rental chỉ có traffic anonymous vẫn là 1 cột 0 của matrix -> vẫn là candidate)
+
+Usage:
+    from training.preaggregate import preaggregate_interactions
+    cf_df, popularity_only_df, report = preaggregate_interactions(interactions_df, window='30min')
+    model.train(cf_df, rentals_df, popularity_only_df=popularity_only_df)
+"""
+# pandas import trong hàm: train_model (API serving) chỉ cần ANONYMOUS_USER_IDS
+
+ANONYMOUS_USER_IDS = ('anonymous',)
+DEFAULT_WINDOW = '30min'
+
+GROUP_KEYS = ['userId', 'rentalId', 'interactionType']
+
+
+def collapse_events(interactions_df, window=DEFAULT_WINDOW, score_mode='once'):
+    """
+    Gộp event trùng (user, rental, type) trong cùng cửa sổ thời gian
+
+    window=None: gộp toàn bộ theo (user, rental, type), bỏ qua thời gian.
+    Cột khác giữ giá trị của event mới nhất; timestamp = event mới nhất.
+    """
+    if score_mode not in ('once', 'sum'):
+        raise ValueError(f"Unknown score_mode: {score_mode}")
+    import pandas as pd
+
+    if len(interactions_df) == 0:
+        return interactions_df.assign(eventCount=pd.Series(dtype='int64'))
+
+    df = interactions_df
+    keys = list(GROUP_KEYS)
+    if window and 'timestamp' in df.columns:
+        timestamps = pd.to_datetime(df['timestamp'], errors='coerce')
+        df = df.assign(timestamp=timestamps, _window=timestamps.dt.floor(window))
+        df = df.sort_values('timestamp', kind='stable')
+        keys.append('_window')
+
+    grouped = df.groupby(keys, sort=False, dropna=False)
+    other_columns = [c for c in df.columns if c not in keys and c != 'interactionScore']
+
+    sizes = grouped.size()
+    collapsed = grouped[other_columns].last() if other_columns else pd.DataFrame(index=sizes.index)
+    scores = grouped['interactionScore']
+    collapsed['interactionScore'] = scores.sum() if score_mode == 'sum' else scores.first()
+    collapsed['eventCount'] = sizes
+
+    collapsed = collapsed.reset_index()
+    if '_window' in collapsed.columns:
+        collapsed = collapsed.drop(columns='_window')
+
+    ordered = [c for c in interactions_df.columns if c in collapsed.columns] + ['eventCount']
+    return collapsed[ordered]
+
+
+def split_anonymous(interactions_df, anonymous_ids=ANONYMOUS_USER_IDS):
+    """(identified_df, anonymous_df) - userId rỗng cũng tính là anonymous"""
+    user_ids = interactions_df['userId']
+    is_anonymous = user_ids.isna() | user_ids.astype(str).str.strip().eq('') | user_ids.isin(anonymous_ids)
+    return interactions_df[~is_anonymous], interactions_df[is_anonymous]
+
+
+def preaggregate_interactions(interactions_df, window=DEFAULT_WINDOW, score_mode='once',
+                              anonymous_ids=ANONYMOUS_USER_IDS, split=True):
+    """
+    Collapse + split -> (cf_df, popularity_only_df, report)
+
+    cf_df đi vào prepare_data/matrix; popularity_only_df chỉ cộng vào popularity
+    (None khi split=False).
+    """
+    valid = interactions_df[interactions_df['rentalId'].notna()]
+    collapsed = collapse_events(valid, window=window, score_mode=score_mode)
+
+    if split:
+        cf_df, popularity_only_df = split_anonymous(collapsed, anonymous_ids)
+    else:
+        cf_df, popularity_only_df = collapsed, None
+
+    report = {
+        'raw_rows': int(len(interactions_df)),
+        'collapsed_rows': int(len(collapsed)),
+        'cf_rows': int(len(cf_df)),
+        'popularity_only_rows': int(len(popularity_only_df)) if popularity_only_df is not None else 0,
+        'reduction': round(1 - len(cf_df) / max(len(interactions_df), 1), 4),
+        'window': window,
+        'score_mode': score_mode,
+    }
+    return cf_df.reset_index(drop=True), popularity_only_df, report
+
+
+def print_report(report):
+    print("\n🧹 Pre-aggregation:")
+    print(f"   Raw interactions:      {report['raw_rows']:,}")
+    print(f"   After collapse:        {report['collapsed_rows']:,} (window={report['window']}, score={report['score_mode']})")
+    print(f"   → CF matrix rows:      {report['cf_rows']:,}")
+    print(f"   → Popularity-only:     {report['popularity_only_rows']:,}")
+    print(f"   Reduction:             {report['reduction']:.1%}")
@@ -0,0 +1,176 @@
+"""
+🏭 HEADLESS TRAINING RUNNER - cho cron / container job (không input(), không vẽ biểu đồ)
+
+- Load + pre-aggregate + train (các stage độc lập sau matrix chạy song song: --workers)
+- Smoke check: recommend_for_user + popular phải chạy được trước khi ghi artifact
+- Ghi model + timing report JSON theo từng stage
+
+Exit code:
+    0 = OK
+    1 = lỗi khi train / smoke check / save
+    2 = input không hợp lệ (thiếu file, quá ít interactions khi không có --allow-small)
+
+Usage (chạy từ PyThon_ML_App/):
+    python training/run_training.py
+    python training/run_training.py --workers 4 --similarity-top-k 200 --report ./reports/training_report.json
+    python training/run_training.py --stream --chunksize 500000 --min-interactions 0
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import traceback
+from datetime import datetime
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from training.train_model import add_training_arguments, build_model, load_interactions, preaggregate
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_INVALID_INPUT = 2
+
+
+def _peak_rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+class StageTimer:
+    """Thời gian các bước ngoài model.train() (load, preaggregate, smoke check, save)"""
+
+    def __init__(self):
+        self.stages = {}
+
+    def run(self, stage, func, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.stages[stage] = {'seconds': round(time.perf_counter() - started, 4)}
+
+
+def smoke_check(model):
+    """Model vừa train phải trả được recommendation (personalized + popular)"""
+    users = model.user_encoder.classes_
+    if len(users) == 0:
+        raise RuntimeError("Model has no users")
+
+    model.recommend_for_user(users[0], n_recommendations=5)
+    if not model.popularity_scores:
+        raise RuntimeError("Model has no popularity scores")
+
+
+def run(args, timer):
+    """Trả về (exit_code, report)"""
+    interactions_path = os.path.join(args.data_dir, 'interactions.csv')
+    rentals_path = os.path.join(args.data_dir, 'rentals.csv')
+    report = {
+        'started_at': datetime.now().isoformat(),
+        'interactions_path': interactions_path,
+        'rentals_path': rentals_path,
+        'model_path': args.output,
+    }
+
+    for path in (interactions_path, rentals_path):
+        if not os.path.exists(path):
+            report['error'] = f"{path} not found (run data/export_dataset.py first)"
+            return EXIT_INVALID_INPUT, report
+
+    model = build_model(args)
+    rentals_df = timer.run('load_rentals', pd.read_csv, rentals_path)
+
+    if args.stream:
+        timer.run('train', model.train_streaming, interactions_path, rentals_df, chunksize=args.chunksize)
+    else:
+        interactions_df, csv_key = timer.run('load_interactions', load_interactions, interactions_path, model.stage_cache)
+        report['raw_interactions'] = int(len(interactions_df))
+
+        if len(interactions_df) < args.min_interactions and not args.allow_small:
+            report['error'] = (f"Only {len(interactions_df)} interactions (< --min-interactions "
+                               f"{args.min_interactions}); pass --allow-small to train anyway")
+            return EXIT_INVALID_INPUT, report
+
+        interactions_df, popularity_only_df, preaggregate_report, input_key = timer.run(
+            'preaggregate', preaggregate, interactions_df, args, model.stage_cache, csv_key
+        )
+        report['preaggregate'] = preaggregate_report
+        timer.run('train', model.train, interactions_df, rentals_df,
+                  popularity_only_df=popularity_only_df, input_key=input_key)
+
+    report['model_stages'] = model.stage_timings
+    report['model'] = {
+        'users': int(len(model.user_encoder.classes_)),
+        'items': int(len(model.item_encoder.classes_)),
+        'interactions': int(model.user_item_matrix.nnz),
+        'sparsity': round(float(model.matrix_sparsity), 4),
+        'user_similarity_nnz': int(model.user_similarity.nnz),
+        'item_similarity_nnz': int(model.item_similarity.nnz),
+    }
+
+    timer.run('smoke_check', smoke_check, model)
+
+    if not args.dry_run:
+        timer.run('save', model.save, args.output)
+
+    if model.stage_cache is not None:
+        report['stage_cache'] = {
+            'dir': os.path.abspath(model.stage_cache.cache_dir),
+            'hits': model.stage_cache.hits,
+            'misses': model.stage_cache.misses,
+        }
+    return EXIT_OK, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Headless recommendation model training (cron / container job)')
+    parser.add_argument('--data-dir', default='./data', help='Thư mục chứa interactions.csv + rentals.csv')
+    parser.add_argument('--output', default='./models/recommendation_model.pkl')
+    parser.add_argument('--report', default='./reports/training_report.json', help="Timing report JSON ('' = không ghi)")
+    parser.add_argument('--min-interactions', type=int, default=100)
+    parser.add_argument('--allow-small', action='store_true', help='Vẫn train khi ít hơn --min-interactions')
+    parser.add_argument('--dry-run', action='store_true', help='Train + smoke check, không ghi artifact')
+    add_training_arguments(parser)
+    args = parser.parse_args()
+
+    timer = StageTimer()
+    started = time.perf_counter()
+    try:
+        exit_code, report = run(args, timer)
+    except Exception as e:
+        traceback.print_exc()
+        exit_code, report = EXIT_FAILED, {'error': f"{type(e).__name__}: {e}"}
+
+    report['status'] = {EXIT_OK: 'ok', EXIT_FAILED: 'failed', EXIT_INVALID_INPUT: 'invalid_input'}[exit_code]
+    report['exit_code'] = exit_code
+    report['stages'] = timer.stages
+    report['total_seconds'] = round(time.perf_counter() - started, 3)
+    report['peak_rss_mb'] = _peak_rss_mb()
+    report['config'] = vars(args)
+
+    print("\n" + "=" * 70)
+    print(f"🏭 TRAINING RUN: {report['status'].upper()} in {report['total_seconds']:.2f}s (peak RSS {report['peak_rss_mb']} MB)")
+    print("=" * 70)
+    for stage, timing in timer.stages.items():
+        print(f"   {stage:<20} {timing['seconds']:>9.3f}s")
+        if stage == 'train':
+            for model_stage, model_timing in report.get('model_stages', {}).items():
+                cached = ' ♻️ cached' if model_timing['cached'] else ''
+                print(f"     └ {model_stage:<16} {model_timing['seconds']:>9.3f}s{cached}")
+    if 'error' in report:
+        print(f"   ❌ {report['error']}")
+
+    if args.report:
+        os.makedirs(os.path.dirname(os.path.abspath(args.report)), exist_ok=True)
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False, default=str)
+        print(f"\n📄 Report: {args.report}")
+
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
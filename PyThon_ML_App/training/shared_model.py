@@ -0,0 +1,207 @@
+"""
+🤝 SHARED MODEL - 1 bản model (memory-map read-only) dùng chung cho mọi uvicorn worker
+
+Mỗi worker load() riêng = mỗi process 1 bản copy matrix / similarity / catalog.
+Chế độ shared (MODEL_SHARED=1):
+
+- Publish: artifact -> snapshot bất biến <model>.shared/v{N}.pkl (hard link, không copy được thì copy)
+  + manifest, rồi ghi <model>.shared.json {version: N, snapshot, source: size/mtime của artifact}.
+  Chỉ 1 process publish (flock trên <model>.shared.lock); process khác thấy version đã có thì dùng luôn.
+- Attach: load(snapshot, mmap=True) -> array là memory-map read-only của cùng 1 file,
+  page cache dùng chung giữa các worker (RAM không nhân theo số worker).
+- Handshake: worker định kỳ refresh(): đọc version file + stat artifact; artifact bị save() đè
+  -> publish version mới; version khác version đang dùng -> attach snapshot mới.
+  Snapshot cũ giữ lại KEEP_SNAPSHOTS bản (worker chưa đổi vẫn đọc được; unlink không ảnh hưởng mmap đang mở).
+
+Usage:
+    shared = SharedModel('./models/recommendation_model.pkl')
+    model = shared.attach()
+    ...
+    new_model = shared.refresh()      # None nếu không có version mới
+    python training/shared_model.py --model ./models/recommendation_model.pkl   # publish thủ công
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: không có flock -> publish không khoá (chỉ chạy 1 worker)
+    fcntl = None
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from training.model_manifest import manifest_path
+
+VERSION_SUFFIX = '.shared.json'
+SNAPSHOT_DIR_SUFFIX = '.shared'
+LOCK_SUFFIX = '.shared.lock'
+KEEP_SNAPSHOTS = 3
+DEFAULT_CHECK_INTERVAL = 5.0
+
+
+def version_path(model_path):
+    return f"{model_path}{VERSION_SUFFIX}"
+
+
+def read_version(model_path):
+    """Version file -> dict (None nếu chưa publish / hỏng)"""
+    try:
+        with open(version_path(model_path), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _source_stat(model_path):
+    stat = os.stat(model_path)
+    return {'size': int(stat.st_size), 'mtime_ns': int(stat.st_mtime_ns)}
+
+
+def _is_current(state, model_path):
+    """Version đã publish vẫn khớp artifact (và snapshot còn trên disk)"""
+    if state is None or state.get('source') != _source_stat(model_path):
+        return False
+    return os.path.exists(os.path.join(os.path.dirname(model_path), state['snapshot']))
+
+
+class _PublishLock:
+    """flock độc quyền trên <model>.shared.lock (no-op nếu không có fcntl)"""
+
+    def __init__(self, model_path):
+        self.path = f"{model_path}{LOCK_SUFFIX}"
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, 'a')
+        if fcntl is not None:
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+
+# ==================== PUBLISH ====================
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def publish(model_path, force=False):
+    """
+    Snapshot artifact hiện tại thành version mới (nếu artifact đổi so với version đã publish)
+    -> state trong version file
+    """
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Model file not found: {model_path}")
+
+    with _PublishLock(model_path):
+        state = read_version(model_path)
+        if not force and _is_current(state, model_path):
+            return state   # process khác vừa publish
+
+        version = (state or {}).get('version', 0) + 1
+        model_dir = os.path.dirname(model_path)
+        snapshot_dir = f"{model_path}{SNAPSHOT_DIR_SUFFIX}"
+        os.makedirs(snapshot_dir, exist_ok=True)
+        snapshot = os.path.join(snapshot_dir, f"v{version}.pkl")
+
+        source = _source_stat(model_path)
+        _link_or_copy(model_path, snapshot)
+        if os.path.exists(manifest_path(model_path)):
+            shutil.copy2(manifest_path(model_path), manifest_path(snapshot))
+
+        state = {
+            'version': version,
+            'snapshot': os.path.relpath(snapshot, model_dir),
+            'source': source,
+            'published_at': datetime.now().isoformat(),
+            'publisher_pid': os.getpid(),
+        }
+        tmp_path = f"{version_path(model_path)}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, version_path(model_path))
+
+        _prune_snapshots(snapshot_dir, version)
+        print(f"🤝 Published shared model v{version}: {snapshot}")
+        return state
+
+
+def _prune_snapshots(snapshot_dir, version):
+    for name in os.listdir(snapshot_dir):
+        stem = name.split('.', 1)[0]
+        if stem.startswith('v') and stem[1:].isdigit() and int(stem[1:]) <= version - KEEP_SNAPSHOTS:
+            os.remove(os.path.join(snapshot_dir, name))
+
+
+def ensure_published(model_path):
+    """State của version hiện tại; publish trước nếu chưa có / artifact đã đổi"""
+    state = read_version(model_path)
+    if _is_current(state, model_path):
+        return state
+    return publish(model_path)
+
+
+# ==================== ATTACH (WORKER) ====================
+
+class SharedModel:
+    """Handle của 1 worker: model memory-map của version hiện tại + refresh theo version counter"""
+
+    def __init__(self, model_path, check_interval=DEFAULT_CHECK_INTERVAL):
+        self.model_path = model_path
+        self.check_interval = check_interval
+        self.version = None
+        self.snapshot = None
+        self.model = None
+        self._checked_at = 0.0
+
+    def attach(self):
+        return self._attach(ensure_published(self.model_path))
+
+    def _attach(self, state):
+        from training.train_model import RecommendationModel
+
+        snapshot = os.path.join(os.path.dirname(self.model_path), state['snapshot'])
+        model = RecommendationModel.load(snapshot, mmap=True)
+        self.model, self.version, self.snapshot = model, state['version'], snapshot
+        self._checked_at = time.monotonic()
+        return model
+
+    def refresh(self, force=False):
+        """Model của version mới nếu có (None nếu vẫn là version đang dùng / chưa tới lượt check)"""
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.check_interval:
+            return None
+        self._checked_at = now
+        state = ensure_published(self.model_path)
+        if state['version'] == self.version:
+            return None
+        print(f"🤝 Shared model v{self.version} -> v{state['version']}")
+        return self._attach(state)
+
+    def info(self):
+        return {'version': self.version, 'snapshot': self.snapshot, 'pid': os.getpid()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Publish artifact as a shared (memory-mapped) model version')
+    parser.add_argument('--model', default='./models/recommendation_model.pkl')
+    parser.add_argument('--force', action='store_true', help='Publish version mới kể cả khi artifact không đổi')
+    args = parser.parse_args()
+    state = publish(args.model, force=args.force)
+    print(json.dumps(state, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""
+🧮 BLOCKED COSINE SIMILARITY - Tính similarity theo block hàng, song song, có top-K pruning
+
+- Normalize (L2) matrix 1 lần duy nhất (cosine_similarity của sklearn normalize lại lần nữa)
+- Chia hàng thành block, mỗi block: normalized[block] @ normalized.T trong thread/process pool
+- Giữ top-K mỗi hàng ngay khi tính xong block -> memory ~ block_size × n + n × K
+- Ghép các block thành CSR (n × n)
+
+top_k=None: giữ toàn bộ, kết quả giống cosine_similarity(dense_output=False).
+
+Usage:
+    from training.similarity import blocked_cosine_similarity
+    user_similarity = blocked_cosine_similarity(user_item_matrix, top_k=200, n_jobs=4)
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+# sklearn (normalize) import trong blocked_cosine_similarity: API serving chỉ import DEFAULT_BLOCK_SIZE
+
+DEFAULT_BLOCK_SIZE = 1024
+
+# Matrix đã normalize cho worker process (gửi 1 lần qua initializer, không gửi theo từng block)
+_worker_matrices = None
+
+
+def _init_worker(normalized):
+    global _worker_matrices
+    _worker_matrices = (normalized, normalized.T.tocsr())
+
+
+def _process_block(bounds, top_k):
+    normalized, normalized_t = _worker_matrices
+    return _similarity_block(normalized, normalized_t, bounds[0], bounds[1], top_k)
+
+
+def _similarity_block(normalized, normalized_t, start, stop, top_k):
+    block = (normalized[start:stop] @ normalized_t).tocsr()
+    if top_k is not None:
+        block = prune_top_k(block, top_k)
+    return block
+
+
+def prune_top_k(matrix, top_k):
+    """Giữ K giá trị lớn nhất mỗi hàng của CSR (hàng có <= K entry giữ nguyên)"""
+    matrix = matrix.tocsr()
+    row_nnz = np.diff(matrix.indptr)
+    if top_k <= 0 or len(row_nnz) == 0 or row_nnz.max() <= top_k:
+        return matrix
+
+    keep = np.ones(matrix.nnz, dtype=bool)
+    for row in np.flatnonzero(row_nnz > top_k):
+        start, stop = matrix.indptr[row], matrix.indptr[row + 1]
+        values = matrix.data[start:stop]
+        dropped = np.argpartition(values, len(values) - top_k)[:len(values) - top_k]
+        keep[start + dropped] = False
+
+    kept_before = np.concatenate([[0], np.cumsum(keep)])
+    indptr = kept_before[matrix.indptr]
+    return csr_matrix((matrix.data[keep], matrix.indices[keep], indptr), shape=matrix.shape)
+
+
+def _stack_blocks(blocks, n_cols):
+    """vstack CSR blocks, giải phóng từng block sau khi copy (peak ~ kết quả + 1 block)"""
+    nnz = sum(block.nnz for block in blocks)
+    data = np.empty(nnz, dtype=np.float64)
+    indices = np.empty(nnz, dtype=np.int64 if nnz > np.iinfo(np.int32).max else np.int32)
+    indptr = [np.zeros(1, dtype=np.int64)]
+    offset = 0
+    blocks.reverse()
+    while blocks:
+        block = blocks.pop()
+        data[offset:offset + block.nnz] = block.data
+        indices[offset:offset + block.nnz] = block.indices
+        indptr.append(block.indptr[1:].astype(np.int64) + offset)
+        offset += block.nnz
+    indptr = np.concatenate(indptr)
+    return csr_matrix((data, indices, indptr), shape=(len(indptr) - 1, n_cols))
+
+
+def blocked_cosine_similarity(matrix, top_k=None, block_size=DEFAULT_BLOCK_SIZE, n_jobs=None, backend='thread'):
+    """
+    Cosine similarity giữa các hàng của `matrix` (sparse) -> CSR n × n
+
+    Args:
+        top_k: số neighbor giữ lại mỗi hàng (None = giữ hết)
+        block_size: số hàng mỗi block (giới hạn memory của 1 sản phẩm trung gian)
+        n_jobs: số worker (None = os.cpu_count())
+        backend: 'thread' (share memory; sparse matmul của scipy chạy ngoài GIL)
+                 hoặc 'process' (mỗi worker giữ 1 bản copy matrix đã normalize)
+    """
+    if backend not in ('thread', 'process'):
+        raise ValueError(f"Unknown backend: {backend}")
+    from sklearn.preprocessing import normalize
+
+    normalized = normalize(csr_matrix(matrix, dtype=np.float64), norm='l2', axis=1)
+    n_rows = normalized.shape[0]
+    if n_rows == 0:
+        return csr_matrix((0, 0))
+
+    block_size = max(1, int(block_size))
+    bounds = [(start, min(start + block_size, n_rows)) for start in range(0, n_rows, block_size)]
+    n_jobs = max(1, min(n_jobs or os.cpu_count() or 1, len(bounds)))
+
+    if n_jobs == 1:
+        normalized_t = normalized.T.tocsr()
+        blocks = [_similarity_block(normalized, normalized_t, start, stop, top_k) for start, stop in bounds]
+    elif backend == 'thread':
+        normalized_t = normalized.T.tocsr()
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            blocks = list(executor.map(
+                lambda b: _similarity_block(normalized, normalized_t, b[0], b[1], top_k), bounds
+            ))
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(normalized,)) as executor:
+            blocks = list(executor.map(_process_block, bounds, [top_k] * len(bounds)))
+
+    return _stack_blocks(blocks, n_rows)
@@ -0,0 +1,115 @@
+"""
+🗜️ SPARSE STORAGE - Kiểu lưu của user_item_matrix / user_similarity / item_similarity
+
+Chọn bằng model.matrix_storage (--matrix-storage khi train), áp dụng sau train/update,
+lưu nguyên kiểu trong artifact:
+
+- 'float64': giữ như lúc tính (mặc định)
+- 'float32': value float32, indices/indptr int32 (khi nnz / số cột < 2^31)
+- 'int8':    như float32 cho user_item_matrix; similarity lượng tử hoá 8 bit
+             với scale riêng mỗi hàng (QuantizedCSR, value ≈ code * scale[row], sai số <= scale / 2)
+
+Scorer không cần biết kiểu lưu: QuantizedCSR[row] trả về CSR 1 × n float32 đã dequantize
+(chỉ hàng được đọc), tocsr() / tocoo() dequantize toàn bộ (update(), report, inspect).
+
+materialize(matrix): copy matrix đang memory-map (load lazy) vào RAM của process.
+
+Usage:
+    from training.sparse_storage import apply_storage
+    model.user_similarity = apply_storage(model.user_similarity, 'int8', similarity=True)
+    model.user_similarity[user_idx].toarray().ravel()     # float32
+"""
+import numpy as np
+from scipy.sparse import csr_matrix
+
+MATRIX_STORAGES = ('float64', 'float32', 'int8')
+DEFAULT_MATRIX_STORAGE = 'float64'
+
+_INT8_MAX = 127
+
+
+def compact_csr(matrix, dtype=np.float32):
+    """CSR với value `dtype` và index int32 (scipy tự giữ int64 nếu không vừa int32)"""
+    matrix = matrix.tocsr()
+    indices = matrix.indices
+    if matrix.nnz < np.iinfo(np.int32).max and matrix.shape[1] < np.iinfo(np.int32).max:
+        indices = indices.astype(np.int32, copy=False)
+    return csr_matrix((matrix.data.astype(dtype, copy=False), indices, matrix.indptr), shape=matrix.shape)
+
+
+class QuantizedCSR:
+    """CSR similarity lượng tử hoá int8 + scale float32 mỗi hàng; xem docstring module"""
+
+    def __init__(self, codes, indices, indptr, scale, shape):
+        self.codes = codes        # int8, thẳng hàng với indices
+        self.indices = indices    # int32 cột
+        self.indptr = indptr      # int32/int64, len = n_rows + 1
+        self.scale = scale        # float32 mỗi hàng: value = code * scale[row]
+        self.shape = tuple(shape)
+
+    @classmethod
+    def from_csr(cls, matrix):
+        matrix = compact_csr(matrix, np.float32)
+        row_nnz = np.diff(matrix.indptr)
+        row_max = np.zeros(matrix.shape[0], dtype=np.float32)
+        non_empty = row_nnz > 0
+        if matrix.nnz:
+            row_max[non_empty] = np.maximum.reduceat(np.abs(matrix.data), matrix.indptr[:-1][non_empty])
+        scale = np.where(row_max > 0, row_max / _INT8_MAX, 1.0).astype(np.float32)
+        entry_scale = np.repeat(scale, row_nnz)
+        codes = np.rint(matrix.data / entry_scale).clip(-_INT8_MAX, _INT8_MAX).astype(np.int8)
+        return cls(codes, matrix.indices, matrix.indptr, scale, matrix.shape)
+
+    @property
+    def nnz(self):
+        return int(len(self.codes))
+
+    @property
+    def dtype(self):
+        return self.codes.dtype
+
+    @property
+    def data(self):
+        """Value đã dequantize (float32, thẳng hàng với indices)"""
+        return self.codes * np.repeat(self.scale, np.diff(self.indptr))
+
+    def __getitem__(self, row):
+        """Hàng `row` -> CSR 1 × n float32 (scorer: similarity[idx].toarray())"""
+        if not isinstance(row, (int, np.integer)):
+            raise TypeError("QuantizedCSR chỉ hỗ trợ lấy 1 hàng theo index int; dùng tocsr() cho slicing khác")
+        if row < 0:
+            row += self.shape[0]
+        start, stop = self.indptr[row], self.indptr[row + 1]
+        return csr_matrix(
+            (self.codes[start:stop] * self.scale[row], self.indices[start:stop], np.array([0, stop - start])),
+            shape=(1, self.shape[1])
+        )
+
+    def tocsr(self):
+        return csr_matrix((self.data, self.indices, self.indptr), shape=self.shape)
+
+    def tocoo(self):
+        return self.tocsr().tocoo()
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.shape[0]}x{self.shape[1]}, {self.nnz} int8 entries>"
+
+
+def materialize(matrix):
+    """Copy matrix (array memory-map từ joblib.load(mmap_mode='r')) vào RAM riêng của process"""
+    if isinstance(matrix, QuantizedCSR):
+        return QuantizedCSR(np.array(matrix.codes), np.array(matrix.indices), np.array(matrix.indptr),
+                            np.array(matrix.scale), matrix.shape)
+    matrix = matrix.tocsr()
+    return csr_matrix((np.array(matrix.data), np.array(matrix.indices), np.array(matrix.indptr)), shape=matrix.shape)
+
+
+def apply_storage(matrix, storage, similarity=False):
+    """Đổi matrix sang kiểu lưu `storage` (similarity=True: 'int8' -> QuantizedCSR)"""
+    if storage not in MATRIX_STORAGES:
+        raise ValueError(f"Unknown matrix storage: {storage} (chọn {', '.join(MATRIX_STORAGES)})")
+    if matrix is None or storage == 'float64':
+        return matrix
+    if storage == 'int8' and similarity:
+        return matrix if isinstance(matrix, QuantizedCSR) else QuantizedCSR.from_csr(matrix)
+    return compact_csr(matrix, np.float32)
@@ -0,0 +1,174 @@
+"""
+♻️ STAGE CACHE - Cache kết quả từng stage training theo hash nội dung input
+
+Key = sha256(tên stage, version, input đã fingerprint, tham số).
+Input giống hệt -> load output từ disk thay vì tính lại
+(CSV đã parse, interactions đã encode, CSR matrix, similarity, popularity...).
+
+- DataFrame: pd.util.hash_pandas_object (nội dung + tên/dtype cột)
+- Sparse matrix / ndarray: bytes của data/indices/indptr
+- File: sha256 nội dung file, nhớ theo (path, size, mtime_ns) trong files.json -> lần chạy sau
+  file không đổi thì không đọc lại; size/mtime đổi mới hash lại nội dung
+  (touch mà nội dung giữ nguyên vẫn ra cùng key)
+- Key của stage trước có thể làm input của stage sau (chain) -> không phải hash lại output lớn
+
+Thư mục mặc định: ./.cache/stages (ML_STAGE_CACHE_DIR). Xoá thư mục = xoá cache.
+
+Usage:
+    cache = StageCache()
+    interactions_df, csv_key = cache.load_csv('./data/interactions.csv')
+    key = cache.fingerprint('similarity', 1, matrix_key, top_k)
+    value, hit = cache.cached('similarity', key, lambda: compute(...))
+"""
+import os
+import json
+import time
+import pickle
+import hashlib
+import threading
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import issparse
+
+DEFAULT_CACHE_DIR = os.getenv('ML_STAGE_CACHE_DIR', './.cache/stages')
+
+
+class StageCache:
+    """
+    Content-addressed cache trên local disk, 1 file / (stage, key)
+
+    Dùng pickle protocol 5 thay vì joblib: DataFrame nhiều cột string load nhanh hơn ~10x.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()  # train() có thể chạy nhiều stage song song
+
+    # ==================== FINGERPRINT ====================
+
+    @classmethod
+    def fingerprint(cls, *parts):
+        hasher = hashlib.sha256()
+        for part in parts:
+            cls._update(hasher, part)
+        return hasher.hexdigest()[:32]
+
+    @classmethod
+    def _update(cls, hasher, obj):
+        if isinstance(obj, pd.DataFrame):
+            hasher.update(b'df')
+            hasher.update(repr([(str(c), str(t)) for c, t in obj.dtypes.items()]).encode())
+            hasher.update(pd.util.hash_pandas_object(obj, index=False).to_numpy().tobytes())
+        elif isinstance(obj, pd.Series):
+            hasher.update(b'series' + str(obj.dtype).encode())
+            hasher.update(pd.util.hash_pandas_object(obj, index=False).to_numpy().tobytes())
+        elif issparse(obj):
+            matrix = obj.tocsr()
+            hasher.update(f"csr{matrix.shape}{matrix.dtype}".encode())
+            for array in (matrix.data, matrix.indices, matrix.indptr):
+                hasher.update(np.ascontiguousarray(array).tobytes())
+        elif isinstance(obj, np.ndarray):
+            hasher.update(f"nd{obj.shape}{obj.dtype}".encode())
+            hasher.update(np.ascontiguousarray(obj).tobytes() if obj.dtype != object else repr(obj.tolist()).encode())
+        elif isinstance(obj, bytes):
+            hasher.update(obj)
+        elif isinstance(obj, Mapping) and not isinstance(obj, dict):
+            # View read-only (ItemCatalog) -> hash như dict tương ứng
+            cls._update(hasher, dict(obj))
+            return
+        else:
+            hasher.update(json.dumps(obj, sort_keys=True, default=str).encode())
+        hasher.update(b'|')
+
+    @staticmethod
+    def file_fingerprint(path, chunk_size=1 << 20):
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    def file_key(self, path):
+        """
+        file_fingerprint() nhớ theo (size, mtime_ns): file không đổi -> chỉ tốn 1 os.stat
+        (hash 1 file CSV lớn tốn gần bằng parse nó)
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        signature = [stat.st_size, stat.st_mtime_ns]
+
+        index_path = os.path.join(self.cache_dir, 'files.json')
+        with self._lock:
+            try:
+                with open(index_path) as f:
+                    index = json.load(f)
+            except (OSError, ValueError):
+                index = {}
+
+            entry = index.get(path)
+            if entry and entry['stat'] == signature:
+                return entry['sha256']
+
+            digest = self.file_fingerprint(path)
+            index[path] = {'stat': signature, 'sha256': digest}
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{index_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(index, f)
+            os.replace(tmp_path, index_path)
+            return digest
+
+    # ==================== STORE ====================
+
+    def _path(self, stage, key):
+        return os.path.join(self.cache_dir, stage, f"{key}.pkl")
+
+    def load(self, stage, key):
+        """-> (value, hit)"""
+        path = self._path(stage, key)
+        if os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    value = pickle.load(f)['value']
+                with self._lock:
+                    self.hits += 1
+                return value, True
+            except Exception as e:
+                print(f"   ⚠️ Stage cache entry unreadable ({stage}/{key}): {e}")
+        with self._lock:
+            self.misses += 1
+        return None, False
+
+    def store(self, stage, key, value):
+        path = self._path(stage, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'value': value, 'created_at': time.time()}, f, protocol=5)
+        os.replace(tmp_path, path)
+
+    def cached(self, stage, key, compute):
+        """Load (stage, key) nếu có, không thì compute() + lưu -> (value, hit)"""
+        value, hit = self.load(stage, key)
+        if not hit:
+            value = compute()
+            self.store(stage, key, value)
+        return value, hit
+
+    def load_csv(self, path, **kwargs):
+        """pd.read_csv cache theo nội dung file (+ kwargs) -> (df, key) - key dùng để chain stage sau"""
+        key = self.fingerprint('csv', self.file_key(path), kwargs)
+        df, hit = self.cached('csv', key, lambda: pd.read_csv(path, **kwargs))
+        if hit:
+            print(f"   ♻️ {os.path.basename(path)}: parsed CSV from stage cache")
+        return df, key
+
+    def size_bytes(self):
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+        return total
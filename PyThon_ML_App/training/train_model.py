@@ -1,28 +1,85 @@
 import os
 import sys
-import pandas as pd
+import time
+import logging
+import argparse
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import joblib
 from datetime import datetime
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import StandardScaler, LabelEncoder
 from scipy.sparse import csr_matrix
 from math import radians, sin, cos, sqrt, atan2
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from instrumentation import span, record_stage, get_logger, RECOMMEND_DURATION, RECOMMEND_DEGRADED
+from training.similarity import blocked_cosine_similarity, prune_top_k, DEFAULT_BLOCK_SIZE
+from training.preaggregate import ANONYMOUS_USER_IDS, preaggregate_interactions, print_report, DEFAULT_WINDOW
+from training.model_manifest import write_manifest, read_manifest, is_stale, describe_component
+from training.memory_report import track_peak
+from training.sparse_storage import apply_storage, materialize, MATRIX_STORAGES, DEFAULT_MATRIX_STORAGE
+from training.item_catalog import ItemCatalog, artifact_item_maps
+from training.user_catalog import UserCatalog
+
+# pandas / sklearn import trong hàm chỉ dùng khi train / update: API (app/main.py) chỉ load() + recommend_*,
+# không tốn ~1.3s import lúc cold start (benchmarks/import_budget.py)
+
+log = get_logger('model')
+
+# Tăng version khi đổi logic của stage -> cache cũ của stage đó (và stage sau) tự hết hiệu lực
+STAGE_VERSIONS = {
+    'preaggregate': 1,
+    'prepare': 4,
+    'matrix': 1,
+    'user_locations': 1,
+    'user_similarity': 1,
+    'item_similarity': 1,
+    'popularity': 1,
+    'item_features': 2,
+}
+
+# Component lớn load lazy được (load(lazy=True)): đọc vào RAM lần đầu được truy cập
+LAZY_COMPONENTS = ('user_item_matrix', 'user_similarity', 'item_similarity')
+
+
+def _lazy_component(name):
+    """Property cho component trong LAZY_COMPONENTS (giá trị thật ở self._<name>)"""
+    attr = f'_{name}'
+    
+    def getter(self):
+        if name in self._pending_components:
+            return self._load_component(name)
+        return getattr(self, attr)
+    
+    def setter(self, value):
+        # Gán trực tiếp (train/update/load thường) thay bản lazy chưa load
+        self._pending_components.pop(name, None)
+        setattr(self, attr, value)
+    
+    return property(getter, setter)
+
 
 class RecommendationModel:
     """🎯 Improved Recommendation Engine with Hybrid Approach"""
     
+    user_item_matrix = _lazy_component('user_item_matrix')
+    user_similarity = _lazy_component('user_similarity')
+    item_similarity = _lazy_component('item_similarity')
+    
     def __init__(self):
+        # load(lazy=True): {component: bản memory-map trong artifact} chưa copy vào RAM
+        self._pending_components = {}
+        self._component_lock = threading.Lock()
+        self.lazy_components = {}  # {component: {'loaded': bool, 'seconds': float}}
+        
         self.user_item_matrix = None
         self.user_similarity = None
         self.item_similarity = None
         self.user_features = {}
         self.item_features = {}
-        self.user_encoder = LabelEncoder()
-        self.item_encoder = LabelEncoder()
-        self.scaler = StandardScaler()
+        self.user_encoder = None  # LabelEncoder tạo khi cần (_materialize_encoders)
+        self.item_encoder = None
         
         # Geographic data
         self.rental_coordinates = {}
@@ -33,81 +90,235 @@ class RecommendationModel:
         self.popularity_scores = {}
         self.interactions_df = None
         
+        # Sau train/load: item_features, rental_coordinates, rental_owners, popularity_scores,
+        # user_locations là view read-only trên catalog dạng cột, id interned thành int
+        # (training/item_catalog.py, training/user_catalog.py, training/id_table.py)
+        self.item_catalog = None
+        self.user_catalog = None
+        
+        # Aggregate thô cho update() - {rentalId: [total_score, unique_users]}, {userId: (sum_lon, sum_lat, n)}
+        self.popularity_stats = {}
+        self.user_location_sums = {}
+        self.anonymous_rentals = set()  # rental đã có traffic anonymous (đếm 1 "user" trong popularity)
+        self._packed_incremental_state = None  # 3 aggregate trên dạng mảng theo row (model load từ artifact)
+        self.trained_at = None
+        
+        # Similarity: top-K neighbor mỗi hàng (None = giữ hết), block + số worker khi train
+        self.similarity_top_k = None
+        self.similarity_block_size = DEFAULT_BLOCK_SIZE
+        self.similarity_jobs = None
+        self.similarity_backend = 'thread'
+        
+        # Kiểu lưu matrix + similarity sau train/update: 'float64' | 'float32' | 'int8' (training/sparse_storage.py)
+        self.matrix_storage = DEFAULT_MATRIX_STORAGE
+        
+        # StageCache (training/stage_cache.py) - None = không cache
+        self.stage_cache = None
+        
+        # Số stage chạy song song sau khi có matrix (similarity, popularity, features, centroids)
+        self.max_workers = 1
+        self.stage_timings = {}  # {stage: {'seconds': float, 'cached': bool}} của lần train gần nhất
+        
+        # Peak Python heap (tracemalloc) của train/load: {'train': {...}, 'load': {...}} - xem memory_report()
+        self.trace_memory = True
+        self.memory_peaks = {}
+        self.artifact_path = None  # artifact vừa load/save -> dung lượng trên disk từ manifest
+        self.memory_mapped = False  # load(mmap=True): array là memory-map dùng chung, không phải RAM riêng
+        
         # 🔥 FIX: Initialize matrix_sparsity & matrix_density
         self.matrix_sparsity = 0.0  # Default value
         self.matrix_density = 0.0   # Default value
         
         print("✅ RecommendationModel initialized")
     
-    def prepare_data(self, interactions_df, rentals_df):
-        """Chuẩn bị dữ liệu cho training"""
+    # Artifact chỉ lưu IdTable (không lưu LabelEncoder): encoder dựng lại khi training/update cần
+    @property
+    def user_encoder(self):
+        if self._user_encoder is None:
+            self._materialize_encoders()
+        return self._user_encoder
+    
+    @user_encoder.setter
+    def user_encoder(self, encoder):
+        self._user_encoder = encoder
+    
+    @property
+    def item_encoder(self):
+        if self._item_encoder is None:
+            self._materialize_encoders()
+        return self._item_encoder
+    
+    @item_encoder.setter
+    def item_encoder(self, encoder):
+        self._item_encoder = encoder
+    
+    def prepare_data(self, interactions_df, rentals_df, compute_locations=True, extra_rental_ids=None):
+        """
+        Chuẩn bị dữ liệu cho training
+        
+        compute_locations=False: bỏ qua centroid (train() chạy stage user_locations riêng, song song)
+        extra_rental_ids: rental không có CF signal (chỉ traffic anonymous) vẫn được encode thành
+        cột 0 của matrix -> vẫn là candidate cho personalized / popular / similar
+        """
         print("\n📊 Preparing data...")
         
         # Store interactions for later use
         self.interactions_df = interactions_df.copy()
         
         # Filter valid interactions
-        valid_interactions = interactions_df[
-            (interactions_df['userId'].notna()) & 
-            (interactions_df['rentalId'].notna())
-        ].copy()
+        valid_interactions = self._valid_interactions(interactions_df)
         
         print(f"   Total interactions: {len(valid_interactions)}")
         print(f"   Unique users: {valid_interactions['userId'].nunique()}")
         print(f"   Unique rentals: {valid_interactions['rentalId'].nunique()}")
         
-        # Store rental coordinates
+        # Store rental coordinates + ownership
         print("\n   📍 Loading rental coordinates...")
-        for _, row in rentals_df.iterrows():
-            rental_id = str(row['_id'])
-            lon = float(row.get('longitude', 0))
-            lat = float(row.get('latitude', 0))
-            self.rental_coordinates[rental_id] = (lon, lat)
-            
-            # Store rental ownership
-            if 'userId' in row and pd.notna(row['userId']):
-                self.rental_owners[rental_id] = str(row['userId'])
+        self._load_rental_maps(rentals_df)
         
         print(f"      Stored {len(self.rental_coordinates)} rental coordinates")
         print(f"      Stored {len(self.rental_owners)} rental ownerships")
         
         # Calculate user location centroids
-        print("   👥 Calculating user location centroids...")
-        self._calculate_user_locations(valid_interactions)
+        if compute_locations:
+            print("   👥 Calculating user location centroids...")
+            self._calculate_user_locations(valid_interactions)
         
         # Encode users and items
         valid_interactions['user_idx'] = self.user_encoder.fit_transform(valid_interactions['userId'])
-        valid_interactions['item_idx'] = self.item_encoder.fit_transform(valid_interactions['rentalId'])
+        if extra_rental_ids is not None and len(extra_rental_ids) > 0:
+            import pandas as pd
+            self.item_encoder.fit(pd.concat([valid_interactions['rentalId'], pd.Series(extra_rental_ids)]).astype(str))
+            valid_interactions['item_idx'] = self.item_encoder.transform(valid_interactions['rentalId'].astype(str))
+        else:
+            valid_interactions['item_idx'] = self.item_encoder.fit_transform(valid_interactions['rentalId'])
         
         print(f"   Encoded {len(self.user_encoder.classes_)} users")
         print(f"   Encoded {len(self.item_encoder.classes_)} items")
         
         return valid_interactions, rentals_df
     
+    @staticmethod
+    def _valid_interactions(interactions_df):
+        """Bản copy các dòng có đủ userId + rentalId"""
+        return interactions_df[
+            (interactions_df['userId'].notna()) & 
+            (interactions_df['rentalId'].notna())
+        ].copy()
+    
+    def _load_rental_maps(self, rentals_df):
+        """rental_coordinates + rental_owners từ rentals_df (columnar - không iterrows)"""
+        rental_ids = rentals_df['_id'].astype(str).tolist()
+        lons = self._float_column(rentals_df, 'longitude').tolist()
+        lats = self._float_column(rentals_df, 'latitude').tolist()
+        self.rental_coordinates.update(zip(rental_ids, zip(lons, lats)))
+        
+        if 'userId' in rentals_df.columns:
+            has_owner = rentals_df['userId'].notna().to_numpy()
+            owner_ids = rentals_df['userId'][has_owner].astype(str).tolist()
+            self.rental_owners.update(zip(np.asarray(rental_ids, dtype=object)[has_owner].tolist(), owner_ids))
+    
     def _calculate_user_locations(self, interactions_df):
-        """Tính vị trí centroid của mỗi user"""
+        """
+        Tính vị trí centroid của mỗi user
+        
+        Join interactions với toạ độ rental theo rentalId rồi groupby sum/count -
+        O(interactions) thay vì filter lại toàn bộ bảng cho từng user.
+        Mỗi interaction tính 1 lần (bài xem nhiều lần kéo centroid về gần hơn).
+        Giữ lại tổng (user_location_sums) để update() cộng dồn không cần dữ liệu cũ.
+        """
         try:
-            for user_id in interactions_df['userId'].unique():
-                user_interactions = interactions_df[interactions_df['userId'] == user_id]
-                
-                valid_coords = []
-                for _, row in user_interactions.iterrows():
-                    rental_id = str(row['rentalId'])
-                    if rental_id in self.rental_coordinates:
-                        coords = self.rental_coordinates[rental_id]
-                        if coords[0] != 0 and coords[1] != 0:
-                            valid_coords.append(coords)
-                
-                if valid_coords:
-                    avg_lon = np.mean([c[0] for c in valid_coords])
-                    avg_lat = np.mean([c[1] for c in valid_coords])
-                    self.user_locations[user_id] = (avg_lon, avg_lat)
+            sums = self._location_sums(interactions_df)
+            self.user_location_sums.update(sums)
+            self.user_locations.update(
+                (user_id, (sum_lon / n, sum_lat / n)) for user_id, (sum_lon, sum_lat, n) in sums.items()
+            )
             
             print(f"      Calculated locations for {len(self.user_locations)} users")
         
         except Exception as e:
             print(f"      ⚠️ Error calculating user locations: {e}")
     
+    def _location_sums(self, interactions_df):
+        """{userId: (sum_lon, sum_lat, n)} trên các interaction có toạ độ rental hợp lệ"""
+        if not self.rental_coordinates or len(interactions_df) == 0:
+            return {}
+        import pandas as pd
+        
+        coords_df = pd.DataFrame(
+            list(self.rental_coordinates.values()),
+            index=pd.Index(list(self.rental_coordinates.keys()), name='rentalId'),
+            columns=['_lon', '_lat']
+        )
+        
+        joined = pd.DataFrame({
+            'userId': interactions_df['userId'].to_numpy(),
+            'rentalId': interactions_df['rentalId'].astype(str).to_numpy(),
+        }).join(coords_df, on='rentalId', how='inner')
+        
+        valid = joined[
+            (joined['_lon'] != 0) & (joined['_lat'] != 0) &
+            joined['_lon'].notna() & joined['_lat'].notna()
+        ]
+        
+        grouped = valid.groupby('userId', sort=False)
+        totals = grouped[['_lon', '_lat']].sum()
+        counts = grouped.size()
+        
+        return dict(zip(
+            totals.index.tolist(),
+            zip(totals['_lon'].tolist(), totals['_lat'].tolist(), counts.reindex(totals.index).tolist())
+        ))
+    
+    @staticmethod
+    def _float_column(df, column, default=0.0):
+        """Cột số dạng float64 (thiếu cột -> default), giữ NaN như float(row.get(...))"""
+        if column not in df.columns:
+            return np.full(len(df), default, dtype=float)
+        import pandas as pd
+        return pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=float)
+    
+    def _extract_item_features(self, rentals_df):
+        """
+        Item features dạng columnar: mỗi cột được chuẩn hoá 1 lần bằng array ops,
+        sau đó mới zip thành dict theo rentalId (định dạng recommend_* đang dùng)
+        """
+        n = len(rentals_df)
+        
+        def text_column(column):
+            if column not in rentals_df.columns:
+                return ['unknown'] * n
+            values = rentals_df[column]
+            return values.astype(str).where(values.notna(), 'unknown').tolist()
+        
+        prices = np.nan_to_num(self._float_column(rentals_df, 'price'), nan=0.0)
+        areas = np.nan_to_num(self._float_column(rentals_df, 'area_total'), nan=0.0)
+        amenities = np.nan_to_num(self._float_column(rentals_df, 'amenities_count'), nan=0.0).astype(int)
+        
+        columns = zip(
+            rentals_df['_id'].astype(str).tolist(),
+            prices.tolist(),
+            text_column('propertyType'),
+            text_column('location_short'),
+            areas.tolist(),
+            amenities.tolist(),
+            self._float_column(rentals_df, 'longitude').tolist(),
+            self._float_column(rentals_df, 'latitude').tolist(),
+        )
+        
+        return {
+            rental_id: {
+                'price': price,
+                'propertyType': property_type,
+                'location_text': location_text,
+                'area_total': area_total,
+                'amenities_count': amenities_count,
+                'longitude': lon,
+                'latitude': lat,
+            }
+            for rental_id, price, property_type, location_text, area_total, amenities_count, lon, lat in columns
+        }
+    
 
     def build_user_item_matrix(self, interactions_df):
         """
@@ -152,34 +363,35 @@ class RecommendationModel:
         """Tính User-User Similarity (Collaborative Filtering)"""
         print("\n🧮 Computing User-User Similarity...")
         
-        # Normalize user vectors
-        user_norms = np.sqrt(np.array(self.user_item_matrix.power(2).sum(axis=1)).flatten())
-        user_norms[user_norms == 0] = 1
-        
-        normalized_matrix = self.user_item_matrix.multiply(1 / user_norms[:, np.newaxis])
+        self.user_similarity = self._blocked_similarity(self.user_item_matrix)
         
-        # Compute cosine similarity
-        self.user_similarity = cosine_similarity(normalized_matrix, dense_output=False)
-        
-        print(f"   Computed similarity for {self.user_similarity.shape[0]} users")
+        print(f"   Computed similarity for {self.user_similarity.shape[0]} users "
+              f"({self.user_similarity.nnz:,} entries)")
     
     def compute_item_similarity(self):
         """Tính Item-Item Similarity (Content-Based)"""
         print("\n🧮 Computing Item-Item Similarity...")
         
         # Transpose to get item vectors
-        item_matrix = self.user_item_matrix.T
-        
-        # Normalize
-        item_norms = np.sqrt(np.array(item_matrix.power(2).sum(axis=1)).flatten())
-        item_norms[item_norms == 0] = 1
+        self.item_similarity = self._blocked_similarity(self.user_item_matrix.T.tocsr())
         
-        normalized_matrix = item_matrix.multiply(1 / item_norms[:, np.newaxis])
-        
-        # Compute similarity
-        self.item_similarity = cosine_similarity(normalized_matrix, dense_output=False)
-        
-        print(f"   Computed similarity for {self.item_similarity.shape[0]} items")
+        print(f"   Computed similarity for {self.item_similarity.shape[0]} items "
+              f"({self.item_similarity.nnz:,} entries)")
+    
+    def _blocked_similarity(self, matrix):
+        return blocked_cosine_similarity(
+            matrix,
+            top_k=self.similarity_top_k,
+            block_size=self.similarity_block_size,
+            n_jobs=self.similarity_jobs,
+            backend=self.similarity_backend
+        )
+    
+    def _apply_matrix_storage(self):
+        """user_item_matrix + similarity -> kiểu lưu self.matrix_storage (scorer dequantize khi đọc hàng)"""
+        self.user_item_matrix = apply_storage(self.user_item_matrix, self.matrix_storage)
+        self.user_similarity = apply_storage(self.user_similarity, self.matrix_storage, similarity=True)
+        self.item_similarity = apply_storage(self.item_similarity, self.matrix_storage, similarity=True)
     
     def compute_popularity_scores(self, interactions_df):
         """Tính popularity score cho mỗi item"""
@@ -192,24 +404,69 @@ class RecommendationModel:
         
         rental_scores.columns = ['rentalId', 'total_score', 'unique_users']
         
+        # Giữ aggregate thô để update() cộng dồn
+        self.anonymous_rentals = set(
+            interactions_df.loc[interactions_df['userId'].isin(ANONYMOUS_USER_IDS), 'rentalId'].astype(str)
+        )
+        self.popularity_stats = {
+            rental_id: [float(total), int(unique)]
+            for rental_id, total, unique in zip(
+                rental_scores['rentalId'].tolist(),
+                rental_scores['total_score'].tolist(),
+                rental_scores['unique_users'].tolist()
+            )
+        }
+        self.popularity_scores = self._normalize_popularity(self.popularity_stats)
+        
+        print(f"   Computed popularity for {len(self.popularity_scores)} items")
+        print(f"   Top item popularity: {max(self.popularity_scores.values(), default=0):.2f}")
+    
+    @staticmethod
+    def _with_popularity_only(interactions_df, popularity_only_df):
+        """CF interactions + stream popularity-only (anonymous gom về 1 user như trước khi tách)"""
+        if popularity_only_df is None or len(popularity_only_df) == 0:
+            return interactions_df
+        import pandas as pd
+        
+        popularity_only = popularity_only_df[popularity_only_df['rentalId'].notna()].assign(
+            userId=ANONYMOUS_USER_IDS[0]
+        )
+        columns = ['userId', 'rentalId', 'interactionScore']
+        return pd.concat([interactions_df[columns], popularity_only[columns]], ignore_index=True)
+
+    @staticmethod
+    def _popularity_only_rentals(popularity_only_df):
+        """rentalId (sorted, unique) của stream popularity-only - [] khi không có"""
+        if popularity_only_df is None or len(popularity_only_df) == 0:
+            return []
+        rental_ids = popularity_only_df['rentalId'].dropna().astype(str)
+        return sorted(rental_ids.unique().tolist())
+
+    @staticmethod
+    def _normalize_popularity(popularity_stats):
+        """total_score * log1p(unique_users), chuẩn hoá về 0-100"""
+        if not popularity_stats:
+            return {}
+        
+        rental_ids = list(popularity_stats.keys())
+        stats = np.array(list(popularity_stats.values()), dtype=float)
+        
         # Weighted popularity
-        rental_scores['popularity'] = rental_scores['total_score'] * np.log1p(rental_scores['unique_users'])
+        popularity = stats[:, 0] * np.log1p(stats[:, 1])
         
         # Normalize to 0-100
-        max_pop = rental_scores['popularity'].max()
+        max_pop = popularity.max()
         if max_pop > 0:
-            rental_scores['popularity'] = (rental_scores['popularity'] / max_pop) * 100
-        
-        self.popularity_scores = dict(zip(rental_scores['rentalId'], rental_scores['popularity']))
+            popularity = (popularity / max_pop) * 100
         
-        print(f"   Computed popularity for {len(self.popularity_scores)} items")
-        print(f"   Top item popularity: {rental_scores['popularity'].max():.2f}")
+        return dict(zip(rental_ids, popularity))
 
     def get_user_preferences(self, user_id):
         """Lấy preferences của user từ interactions"""
         try:
             if self.interactions_df is None:
                 return None
+            import pandas as pd
                 
             user_interactions = self.interactions_df[self.interactions_df['userId'] == user_id]
             
@@ -238,7 +495,7 @@ class RecommendationModel:
             
             return prefs
         except Exception as e:
-            print(f"Error getting user preferences: {e}")
+            log.warning(f"Error getting user preferences: {e}")
             return None
     
     @staticmethod
@@ -255,11 +512,26 @@ class RecommendationModel:
         
         return R * c
     
-    def train(self, interactions_df, rentals_df):
-        """Train toàn bộ model"""
+    def train(self, interactions_df, rentals_df, popularity_only_df=None, input_key=None):
+        """
+        Train toàn bộ model
+        
+        popularity_only_df: interactions chỉ cộng vào popularity, không vào CF matrix
+        (traffic anonymous sau preaggregate_interactions())
+        input_key: stage-cache key của (interactions_df, popularity_only_df) mà caller đã có
+        (vd key của preaggregate / CSV) -> stage prepare / popularity chain theo key,
+        không hash lại DataFrame
+        """
+        with track_peak(self.memory_peaks, 'train', enabled=self.trace_memory):
+            self._train(interactions_df, rentals_df, popularity_only_df, input_key)
+        self._print_memory_peak('train')
+    
+    def _train(self, interactions_df, rentals_df, popularity_only_df, input_key=None):
+        """Thân train()"""
         print("\n" + "="*70)
         print("🚀 STARTING MODEL TRAINING WITH GEOGRAPHIC FEATURES")
         print("="*70)
+        self._unpack_catalogs()
         
         # 1. Data validation
         print("\n📊 DATA VALIDATION:")
@@ -269,43 +541,111 @@ class RecommendationModel:
         
         # 2. Prepare data (encode users/items)
         print("\n📊 Preparing data...")
-        interactions_df, rentals_df = self.prepare_data(interactions_df, rentals_df)
+        self.stage_timings = {}
+        raw_interactions_df = interactions_df
+        # Rental chỉ có traffic anonymous: cột 0 trong matrix, không mất candidate
+        popularity_only_rentals = self._popularity_only_rentals(popularity_only_df)
+        interaction_inputs = (input_key,) if input_key else (interactions_df, popularity_only_rentals)
+        prepared = {}
+        
+        def prepare():
+            # Cache chỉ lưu cột index (int32), không lưu lại cả DataFrame đã encode
+            prepared['df'] = self.prepare_data(raw_interactions_df, rentals_df, compute_locations=False,
+                                               extra_rental_ids=popularity_only_rentals)[0]
+            return prepared['df'][['user_idx', 'item_idx']].to_numpy(dtype=np.int32)
+        
+        prepare_key, encoded, hit = self._run_stage(
+            'prepare', (*interaction_inputs, rentals_df), prepare,
+            attrs=('user_encoder', 'item_encoder', 'rental_coordinates', 'rental_owners')
+        )
+        if hit:
+            self.interactions_df = raw_interactions_df.copy()
+            interactions_df = self._valid_interactions(raw_interactions_df).assign(
+                user_idx=encoded[:, 0].astype(np.int64), item_idx=encoded[:, 1].astype(np.int64)
+            )
+        else:
+            interactions_df = prepared['df']
         
         # 🔥 CRITICAL: Phải call build_user_item_matrix()
         print("\n🔨 Building matrices...")
-        self.build_user_item_matrix(interactions_df)
-        
-        # 3. Compute similarities
-        print("\n🧮 Computing similarities...")
-        self.compute_user_similarity()
-        self.compute_item_similarity()
-        
-        # 4. Compute popularity
-        print("\n⭐ Computing popularity scores...")
-        self.compute_popularity_scores(interactions_df)
+        matrix_key, _, _ = self._run_stage(
+            'matrix', (prepare_key,),
+            lambda: self.build_user_item_matrix(interactions_df),
+            attrs=('user_item_matrix', 'matrix_sparsity', 'matrix_density')
+        )
         
-        # 5. Extract item features
-        print("\n📋 Extracting item features...")
-        self.item_features = {}
+        # 3-6. Các stage độc lập khi đã có matrix -> chạy song song nếu max_workers > 1
+        print("\n🧮 Computing similarities, popularity, item features, user centroids...")
+        popularity_input = self._with_popularity_only(interactions_df, popularity_only_df)
+        popularity_key = (input_key,) if input_key else (popularity_input[['userId', 'rentalId', 'interactionScore']],)
+        self._run_stages([
+            ('user_similarity', (matrix_key, self.similarity_top_k),
+             self.compute_user_similarity, ('user_similarity',)),
+            ('item_similarity', (matrix_key, self.similarity_top_k),
+             self.compute_item_similarity, ('item_similarity',)),
+            ('popularity', popularity_key,
+             lambda: self.compute_popularity_scores(popularity_input),
+             ('popularity_stats', 'popularity_scores', 'anonymous_rentals')),
+            ('item_features', (rentals_df,),
+             lambda: self.compute_item_features(rentals_df), ('item_features',)),
+            ('user_locations', (prepare_key,),
+             lambda: self._calculate_user_locations(interactions_df), ('user_locations', 'user_location_sums')),
+        ])
+        
+        self._apply_matrix_storage()
+        self._build_catalogs()
+        self._print_training_summary()
+    
+    def compute_item_features(self, rentals_df):
+        """📋 Item features (price, type, location, area...) cho content-based scoring"""
+        self.item_features = self._extract_item_features(rentals_df)
+        print(f"   ✅ Extracted features for {len(self.item_features)} items")
+    
+    def _run_stages(self, stages):
+        """[(stage, inputs, compute, attrs)] độc lập nhau: tuần tự hoặc thread pool (max_workers)"""
+        if self.max_workers <= 1:
+            for stage, inputs, compute, attrs in stages:
+                self._run_stage(stage, inputs, compute, attrs)
+            return
         
-        for idx, row in rentals_df.iterrows():
-            try:
-                rental_id = str(row['_id'])
-                self.item_features[rental_id] = {
-                    'price': float(row['price']) if pd.notna(row['price']) else 0,
-                    'propertyType': str(row['propertyType']) if pd.notna(row['propertyType']) else 'unknown',
-                    'location_text': str(row.get('location_short', 'unknown')) if 'location_short' in row and pd.notna(row.get('location_short')) else 'unknown',
-                    'area_total': float(row.get('area_total', 0)) if 'area_total' in row and pd.notna(row.get('area_total')) else 0,
-                    'amenities_count': int(row.get('amenities_count', 0)) if 'amenities_count' in row else 0,
-                    'longitude': float(row.get('longitude', 0)) if 'longitude' in row else 0,
-                    'latitude': float(row.get('latitude', 0)) if 'latitude' in row else 0,
-                }
-            except Exception as e:
-                print(f"      ⚠️ Error extracting features for rental {idx}: {e}")
-                continue
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='train-stage') as executor:
+            futures = [executor.submit(self._run_stage, *stage) for stage in stages]
+            for future in futures:
+                future.result()
+    
+    def _run_stage(self, stage, inputs, compute, attrs=()):
+        """
+        Chạy 1 stage qua stage_cache (nếu có) -> (key, kết quả compute(), hit)
         
-        print(f"   ✅ Extracted features for {len(self.item_features)} items")
+        Cache lưu kết quả trả về + các attribute `attrs` mà stage gán lên model;
+        hit thì khôi phục attrs thay vì chạy compute(). key dùng làm input cho stage sau.
+        Thời gian từng stage ghi vào self.stage_timings (+ metric ml_stage_duration_seconds).
+        """
+        started = time.perf_counter()
+        key, result, hit = None, None, False
         
+        if self.stage_cache is None:
+            result = compute()
+        else:
+            key = self.stage_cache.fingerprint(stage, STAGE_VERSIONS[stage], *inputs)
+            
+            def run():
+                value = compute()
+                return {'result': value, 'attrs': {name: getattr(self, name) for name in attrs}}
+            
+            entry, hit = self.stage_cache.cached(stage, key, run)
+            if hit:
+                for name, value in entry['attrs'].items():
+                    setattr(self, name, value)
+                print(f"   ♻️ {stage}: loaded from stage cache")
+            result = entry['result']
+        
+        seconds = time.perf_counter() - started
+        self.stage_timings[stage] = {'seconds': round(seconds, 4), 'cached': hit}
+        record_stage(f"train_{stage}", seconds)
+        return key, result, hit
+    
+    def _print_training_summary(self):
         print("\n" + "="*70)
         print("✅ TRAINING COMPLETED")
         print("="*70 + "\n")
@@ -319,11 +659,634 @@ class RecommendationModel:
         print(f"   📍 Rental coordinates: {len(self.rental_coordinates)}")
         print(f"   👤 User locations: {len(self.user_locations)}")
         print(f"   🏢 Item features: {len(self.item_features)}")
+        print(f"   🗂️ Item catalog: {len(self.item_catalog)} rentals, "
+              f"{self.item_catalog.memory_bytes() / (1024*1024):.2f} MB")
+        print(f"   👥 User catalog: {len(self.user_catalog)} users, "
+              f"{self.user_catalog.memory_bytes() / (1024*1024):.2f} MB")
+        print(f"   🗜️ Matrix storage: {self.matrix_storage}")
         print()
+    
+    def _print_memory_peak(self, stage):
+        peak = self.memory_peaks.get(stage)
+        if peak is not None:
+            print(f"🧮 Peak Python heap ({stage}, tracemalloc): {peak['peak_bytes'] / (1024*1024):.1f} MB, "
+                  f"retained {peak['retained_bytes'] / (1024*1024):.1f} MB")
+    
+    # ==================== MEMORY REPORT ====================
+    
+    # Tên attribute -> tên component (giống key trong artifact khi có)
+    _MEMORY_COMPONENT_NAMES = {
+        '_user_item_matrix': 'user_item_matrix',
+        '_user_similarity': 'user_similarity',
+        '_item_similarity': 'item_similarity',
+        '_user_encoder': 'user_encoder',
+        '_item_encoder': 'item_encoder',
+        '_packed_incremental_state': 'incremental_state',
+    }
+    _MEMORY_SKIP = ('stage_cache', 'stage_timings', 'memory_peaks', 'lazy_components',
+                    '_pending_components', '_component_lock')
+    
+    def memory_report(self):
+        """
+        🧮 Dung lượng từng component của model -> chọn similarity_top_k / dtype / pruning theo số liệu
+        
+        - components: mọi attribute không phải scalar (CSR matrix, similarity, encoder, catalog,
+          dict/set aggregate, view, interactions_df - nguồn của preference profile)
+          memory_bytes: deep size trong RAM (object dùng chung chỉ tính cho component đầu tiên;
+          view trên catalog chỉ tính vỏ)
+        - artifact: path + size_bytes của artifact vừa load/save (theo manifest)
+        - peaks: tracemalloc peak / retained của train và load gần nhất
+        - lazy_components: trạng thái component load lazy (chưa load thì không có trong components)
+        - memory_mapped: True = memory_bytes của array là page cache dùng chung, không phải RAM riêng
+        """
+        artifact = None
+        if self.artifact_path is not None:
+            manifest = read_manifest(self.artifact_path)
+            if manifest is not None and not is_stale(manifest, self.artifact_path):
+                artifact = {'path': self.artifact_path, 'size_bytes': manifest['artifact']['size_bytes']}
+        
+        seen = set()
+        components = {}
+        for attr, value in vars(self).items():
+            if attr in self._MEMORY_SKIP or value is None or isinstance(value, (bool, int, float, str)):
+                continue
+            name = self._MEMORY_COMPONENT_NAMES.get(attr, attr)
+            info = describe_component(value, seen)
+            info['memory_bytes'] = info.pop('bytes')
+            components[name] = info
+        
+        return {
+            'components': components,
+            'total_memory_bytes': sum(info['memory_bytes'] for info in components.values()),
+            'artifact': artifact,
+            'peaks': self.memory_peaks,
+            'lazy_components': self.lazy_components,
+            'memory_mapped': self.memory_mapped,
+        }
+    
+    def matrix_stats(self):
+        """
+        {'n_users', 'n_items', 'n_interactions', 'source'} của user_item_matrix mà không load lazy:
+        matrix đã trong RAM -> đọc trực tiếp; chưa load -> manifest của artifact (không stale),
+        không có manifest -> số user/item theo catalog, n_interactions = None
+        """
+        if 'user_item_matrix' not in self._pending_components:
+            matrix = self.user_item_matrix
+            if matrix is None:
+                return {'n_users': 0, 'n_items': 0, 'n_interactions': 0, 'source': 'matrix'}
+            return {'n_users': int(matrix.shape[0]), 'n_items': int(matrix.shape[1]),
+                    'n_interactions': int(matrix.nnz), 'source': 'matrix'}
+        
+        manifest = read_manifest(self.artifact_path) if self.artifact_path is not None else None
+        if manifest is not None and not is_stale(manifest, self.artifact_path):
+            n_users, n_items = manifest['matrix']['shape']
+            return {'n_users': n_users, 'n_items': n_items,
+                    'n_interactions': manifest['matrix']['nnz'], 'source': 'manifest'}
+        return {'n_users': len(self.user_catalog), 'n_items': len(self.item_catalog),
+                'n_interactions': None, 'source': 'catalog'}
+    
+    # ==================== LAZY COMPONENTS ====================
+    
+    def _load_component(self, name):
+        """Copy component memory-map vào RAM (1 lần, thread khác chờ lock rồi dùng kết quả)"""
+        with self._component_lock:
+            pending = self._pending_components.get(name)
+            if pending is None:
+                return getattr(self, f'_{name}')
+            started = time.perf_counter()
+            value = materialize(pending)
+            setattr(self, f'_{name}', value)
+            del self._pending_components[name]
+            seconds = time.perf_counter() - started
+        
+        self.lazy_components[name] = {'loaded': True, 'seconds': round(seconds, 4)}
+        record_stage(f"load_{name}", seconds)
+        log.info(f"Lazy-loaded {name} in {seconds * 1000:.1f} ms")
+        return value
+    
+    # ==================== CATALOGS (ITEM / USER) ====================
+    
+    def _build_catalogs(self):
+        """Dict của các stage -> ItemCatalog + UserCatalog; attribute dict thành view trên catalog"""
+        self.item_catalog = ItemCatalog.build(
+            self.item_encoder.classes_, self.item_features, self.rental_coordinates,
+            self.rental_owners, self.popularity_scores
+        )
+        self.user_catalog = UserCatalog.build(self.user_encoder.classes_, self.user_locations)
+        self._attach_catalog_views()
+    
+    def _attach_catalog_views(self):
+        self.item_features = self.item_catalog.feature_view()
+        self.rental_coordinates = self.item_catalog.coordinate_view()
+        self.rental_owners = self.item_catalog.owner_view()
+        self.popularity_scores = self.item_catalog.popularity_view()
+        self.user_locations = self.user_catalog.location_view()
+    
+    def _unpack_catalogs(self):
+        """View -> dict thường trước khi train()/update() sửa tại chỗ (catalog dựng lại ở cuối)"""
+        if self.item_catalog is None:
+            return
+        # Cần catalog để đổi row -> id: encoder + aggregate của artifact mới
+        self._materialize_encoders()
+        self._unpack_incremental_state()
+        self.item_features = dict(self.item_features)
+        self.rental_coordinates = dict(self.rental_coordinates)
+        self.rental_owners = dict(self.rental_owners)
+        self.popularity_scores = dict(self.popularity_scores)
+        self.user_locations = dict(self.user_locations)
+        self.item_catalog = None
+        self.user_catalog = None
+    
+    def _materialize_encoders(self):
+        """
+        LabelEncoder từ IdTable của catalog (row 0..n-1 = index của matrix);
+        chưa có catalog (model mới, trước train) -> encoder chưa fit
+        """
+        from sklearn.preprocessing import LabelEncoder
+        
+        if self._user_encoder is None:
+            self._user_encoder = LabelEncoder()
+            if self.user_catalog is not None and self.user_item_matrix is not None:
+                self._user_encoder.classes_ = self.user_catalog.user_ids.to_array(self.user_item_matrix.shape[0])
+        if self._item_encoder is None:
+            self._item_encoder = LabelEncoder()
+            if self.item_catalog is not None and self.user_item_matrix is not None:
+                self._item_encoder.classes_ = self.item_catalog.rental_ids.to_array(self.user_item_matrix.shape[1])
+    
+    def _pack_incremental_state(self):
+        """popularity_stats / anonymous_rentals / user_location_sums -> mảng theo row catalog (lưu artifact)"""
+        if self._packed_incremental_state is not None:
+            return self._packed_incremental_state
+        popularity = np.array(list(self.popularity_stats.values()), dtype=np.float64).reshape(-1, 2)
+        location_sums = np.array(list(self.user_location_sums.values()), dtype=np.float64).reshape(-1, 3)
+        return {
+            'popularity_rows': self.item_catalog.rental_ids.codes(self.popularity_stats.keys()),
+            'popularity_stats': popularity,           # [total_score, unique_users]
+            'anonymous_rows': self.item_catalog.rental_ids.codes(self.anonymous_rentals),
+            'location_rows': self.user_catalog.user_ids.codes(self.user_location_sums.keys()),
+            'location_sums': location_sums,           # [sum_lon, sum_lat, n]
+        }
+    
+    def _unpack_incremental_state(self):
+        """Mảng theo row -> dict theo id (chỉ khi update()/train lại, serving không cần)"""
+        state = self._packed_incremental_state
+        if state is None:
+            return
+        rental_ids = self.item_catalog.ids_at(state['popularity_rows'])
+        self.popularity_stats = {
+            rental_id: [total, int(users)]
+            for rental_id, (total, users) in zip(rental_ids, state['popularity_stats'].tolist())
+        }
+        self.anonymous_rentals = set(self.item_catalog.ids_at(state['anonymous_rows']))
+        user_ids = self.user_catalog.user_ids.ids_at(state['location_rows'])
+        self.user_location_sums = {
+            user_id: (sum_lon, sum_lat, int(n))
+            for user_id, (sum_lon, sum_lat, n) in zip(user_ids, state['location_sums'].tolist())
+        }
+        self._packed_incremental_state = None
 
 
+    # ==================== STREAMING (OUT-OF-CORE) TRAINING ====================
+    
+    def train_streaming(self, interactions_path, rentals_df, chunksize=200_000):
+        """
+        🌊 Train từ file interactions quá lớn để load 1 lần
+        
+        Đọc CSV theo chunk: encode id ngay trong chunk, cộng dồn triplets
+        (user, item, score) + tổng toạ độ theo user, rồi mới dựng CSR ở cuối.
+        Peak memory ~ kích thước matrix (nnz), không phụ thuộc số dòng log.
+        
+        Khác train(): không giữ interactions_df nên get_user_preferences()
+        trả về None (giống model sau khi load() ở API).
+        """
+        with track_peak(self.memory_peaks, 'train', enabled=self.trace_memory):
+            self._train_streaming(interactions_path, rentals_df, chunksize)
+        self._print_memory_peak('train')
+    
+    def _train_streaming(self, interactions_path, rentals_df, chunksize):
+        """Thân train_streaming()"""
+        import pandas as pd
+        
+        print("\n" + "="*70)
+        print("🌊 STARTING STREAMING MODEL TRAINING")
+        print("="*70)
+        print(f"   Source: {interactions_path}")
+        print(f"   Chunk size: {chunksize:,} rows")
+        
+        self.interactions_df = None
+        self._unpack_catalogs()
+        self._load_rental_maps(rentals_df)
+        
+        user_index = pd.Index([], dtype=object)
+        item_index = pd.Index([], dtype=object)
+        rows, cols, scores = [], [], []
+        pending = 0
+        compact_at = max(chunksize * 4, 1_000_000)
+        total_rows = 0
+        valid_rows = 0
+        
+        reader = pd.read_csv(
+            interactions_path,
+            chunksize=chunksize,
+            usecols=['userId', 'rentalId', 'interactionScore'],
+            dtype={'userId': str, 'rentalId': str}
+        )
+        
+        for chunk_no, chunk in enumerate(reader, 1):
+            total_rows += len(chunk)
+            chunk = chunk[chunk['userId'].notna() & chunk['rentalId'].notna()]
+            valid_rows += len(chunk)
+            if len(chunk) == 0:
+                continue
+            
+            # Encode on the fly (index tạm theo thứ tự xuất hiện)
+            user_index, user_codes = self._encode_streaming(user_index, chunk['userId'].to_numpy())
+            item_index, item_codes = self._encode_streaming(item_index, chunk['rentalId'].to_numpy())
+            
+            aggregated = pd.DataFrame({
+                'u': user_codes, 'i': item_codes, 'score': chunk['interactionScore'].to_numpy(dtype=float)
+            }).groupby(['u', 'i'])['score'].sum()
+            
+            rows.append(aggregated.index.get_level_values(0).to_numpy())
+            cols.append(aggregated.index.get_level_values(1).to_numpy())
+            scores.append(aggregated.to_numpy())
+            pending += len(aggregated)
+            
+            # Centroid sums cộng dồn theo user
+            for user_id, (sum_lon, sum_lat, n) in self._location_sums(chunk).items():
+                old_lon, old_lat, old_n = self.user_location_sums.get(user_id, (0.0, 0.0, 0))
+                self.user_location_sums[user_id] = (old_lon + sum_lon, old_lat + sum_lat, old_n + n)
+            
+            # Gộp triplets trùng định kỳ để bộ nhớ không tăng theo số chunk
+            if pending > compact_at:
+                compacted = self._triplets_to_csr(rows, cols, scores, (len(user_index), len(item_index))).tocoo()
+                rows, cols, scores = [compacted.row], [compacted.col], [compacted.data]
+                pending = compacted.nnz
+                compact_at = max(compact_at, pending * 2)
+            
+            print(f"   📦 Chunk {chunk_no}: {total_rows:,} rows read, "
+                  f"{len(user_index):,} users, {len(item_index):,} items")
+        
+        if valid_rows == 0:
+            raise ValueError(f"No valid interactions in {interactions_path}")
+        
+        # Encoder cuối cùng = sorted (giống LabelEncoder.fit), remap index tạm
+        user_remap = self._finalize_streaming_encoder(self.user_encoder, user_index)
+        item_remap = self._finalize_streaming_encoder(self.item_encoder, item_index)
+        
+        print("\n🔨 Building User-Item Matrix...")
+        shape = (len(user_index), len(item_index))
+        self.user_item_matrix = self._triplets_to_csr(
+            [user_remap[np.concatenate(rows)]], [item_remap[np.concatenate(cols)]], [np.concatenate(scores)], shape
+        )
+        del rows, cols, scores
+        self._update_sparsity()
+        
+        print(f"   Matrix size: {shape[0]} users × {shape[1]} items")
+        print(f"   Rows read: {total_rows:,} (valid: {valid_rows:,})")
+        print(f"   ✅ Sparsity: {self.matrix_sparsity:.2f}%")
+        
+        self.user_locations = {
+            user_id: (sum_lon / n, sum_lat / n)
+            for user_id, (sum_lon, sum_lat, n) in self.user_location_sums.items()
+        }
+        
+        print("\n🧮 Computing similarities...")
+        self.compute_user_similarity()
+        self.compute_item_similarity()
+        
+        print("\n⭐ Computing popularity scores...")
+        self.popularity_stats = self._popularity_stats_from_matrix()
+        self.popularity_scores = self._normalize_popularity(self.popularity_stats)
+        self.anonymous_rentals = self._anonymous_rentals_from_matrix()
+        print(f"   Computed popularity for {len(self.popularity_scores)} items")
+        
+        print("\n📋 Extracting item features...")
+        self.item_features = self._extract_item_features(rentals_df)
+        print(f"   ✅ Extracted features for {len(self.item_features)} items")
+        
+        self._apply_matrix_storage()
+        self._build_catalogs()
+        self._print_training_summary()
+    
+    @staticmethod
+    def _encode_streaming(index, values):
+        """Index tạm (thứ tự xuất hiện) -> (index mở rộng, codes)"""
+        import pandas as pd
+        codes = index.get_indexer(values)
+        unseen = codes < 0
+        if unseen.any():
+            index = index.append(pd.Index(pd.unique(values[unseen]), dtype=object))
+            codes[unseen] = index.get_indexer(values[unseen])
+        return index, codes
+    
+    @staticmethod
+    def _finalize_streaming_encoder(encoder, index):
+        """Gán classes_ đã sort cho encoder; trả về mảng index tạm -> index cuối"""
+        ids = index.to_numpy(dtype=object)
+        order = np.argsort(ids, kind='stable')
+        encoder.classes_ = ids[order]
+        remap = np.empty(len(ids), dtype=np.int64)
+        remap[order] = np.arange(len(ids))
+        return remap
+    
+    @staticmethod
+    def _triplets_to_csr(rows, cols, scores, shape):
+        """COO -> CSR, cộng các cặp trùng (giữ explicit zeros như groupby sum)"""
+        return csr_matrix(
+            (np.concatenate(scores), (np.concatenate(rows), np.concatenate(cols))),
+            shape=shape
+        )
+    
+    def _popularity_stats_from_matrix(self):
+        """{rentalId: [total_score, unique_users]} = tổng cột + nnz cột"""
+        matrix = self.user_item_matrix.tocsc()
+        totals = np.asarray(matrix.sum(axis=0)).ravel()
+        uniques = np.diff(matrix.indptr)
+        return {
+            rental_id: [float(totals[idx]), int(uniques[idx])]
+            for idx, rental_id in enumerate(self.item_encoder.classes_)
+            if uniques[idx] > 0
+        }
+    
+    # ==================== INCREMENTAL UPDATE ====================
+    
+    def update(self, new_interactions_df, new_rentals_df=None, popularity_only_df=None):
+        """
+        🔄 Cập nhật model với interactions/rentals MỚI, không retrain toàn bộ
+        
+        - Encoder: hợp (sorted union) với id mới, remap index cũ -> mới
+        - User-item matrix: cộng thêm triplets mới (giống groupby sum của train)
+        - Similarity: chỉ tính lại hàng/cột của user/item bị ảnh hưởng
+        - Popularity + user centroids: cộng dồn từ aggregate thô đã lưu
+        - popularity_only_df (traffic anonymous đã tách): chỉ cộng vào popularity
+        
+        Kết quả giống train() trên toàn bộ dữ liệu (sai số float ở similarity).
+        """
+        if self.user_item_matrix is None:
+            raise ValueError("Model chưa được train - chạy train() trước khi update()")
+        
+        self._unpack_catalogs()
+        try:
+            return self._apply_update(new_interactions_df, new_rentals_df, popularity_only_df)
+        finally:
+            self._apply_matrix_storage()
+            self._build_catalogs()
+    
+    def _apply_update(self, new_interactions_df, new_rentals_df, popularity_only_df):
+        """Thân update() - item_* là dict thường trong lúc chạy"""
+        import pandas as pd
+        from sklearn.preprocessing import normalize
+        
+        print("\n" + "="*70)
+        print("🔄 INCREMENTAL MODEL UPDATE")
+        print("="*70)
+        started = time.perf_counter()
+        
+        # 1. Rentals mới / thay đổi
+        if new_rentals_df is not None and len(new_rentals_df) > 0:
+            self._load_rental_maps(new_rentals_df)
+            self.item_features.update(self._extract_item_features(new_rentals_df))
+            print(f"   🏠 Updated {len(new_rentals_df)} rentals")
+        
+        new_df = new_interactions_df[
+            new_interactions_df['userId'].notna() & new_interactions_df['rentalId'].notna()
+        ]
+        # Aggregate thô của model cũ (artifact cũ chưa lưu thì suy ra từ matrix)
+        self._ensure_incremental_state()
+        
+        popularity_only = self._add_popularity_only(popularity_only_df)
+        
+        summary = {
+            'new_interactions': int(len(new_df)),
+            'popularity_only_interactions': popularity_only,
+            'new_users': 0,
+            'new_items': 0,
+            'affected_users': 0,
+            'affected_items': 0,
+        }
+        
+        # Rental mới chỉ có traffic anonymous -> vẫn thêm cột (0) như train()
+        new_columns = set(self._popularity_only_rentals(popularity_only_df)) - set(self.item_encoder.classes_.tolist())
+        if len(new_df) == 0 and not new_columns:
+            print("   ℹ️ No new interactions")
+            return summary
+        
+        # 2. Mở rộng encoder + remap matrices
+        n_users_before = len(self.user_encoder.classes_)
+        n_items_before = len(self.item_encoder.classes_)
+        user_map = self._extend_encoder(self.user_encoder, new_df['userId'])
+        item_map = self._extend_encoder(
+            self.item_encoder, pd.concat([new_df['rentalId'].astype(str), pd.Series(sorted(new_columns), dtype=object)])
+        )
+        n_users = len(self.user_encoder.classes_)
+        n_items = len(self.item_encoder.classes_)
+        summary['new_users'] = n_users - n_users_before
+        summary['new_items'] = n_items - n_items_before
+        
+        self.user_item_matrix = self._remap_sparse(self.user_item_matrix, user_map, item_map, (n_users, n_items))
+        self.user_similarity = self._remap_sparse(self.user_similarity, user_map, user_map, (n_users, n_users))
+        self.item_similarity = self._remap_sparse(self.item_similarity, item_map, item_map, (n_items, n_items))
+        
+        if len(new_df) == 0:
+            self._update_sparsity()
+            print(f"   🏠 Items: {n_items} (+{summary['new_items']}, popularity-only)")
+            return summary
+        
+        # 3. Triplets mới
+        user_idx = self.user_encoder.transform(new_df['userId'])
+        item_idx = self.item_encoder.transform(new_df['rentalId'])
+        batch = pd.DataFrame({
+            'user_idx': user_idx,
+            'item_idx': item_idx,
+            'interactionScore': new_df['interactionScore'].to_numpy()
+        }).groupby(['user_idx', 'item_idx'])['interactionScore'].sum().reset_index()
+        
+        batch_rows = batch['user_idx'].to_numpy()
+        batch_cols = batch['item_idx'].to_numpy()
+        
+        # Cặp (user, item) chưa từng có -> +1 unique_users cho popularity
+        pair_matrix = csr_matrix((np.ones(len(batch)), (batch_rows, batch_cols)), shape=(n_users, n_items))
+        existing = self.user_item_matrix.copy()
+        existing.data = np.ones_like(existing.data, dtype=float)
+        new_pairs_per_item = (
+            np.asarray(pair_matrix.sum(axis=0)).ravel() -
+            np.asarray(existing.multiply(pair_matrix).sum(axis=0)).ravel()
+        )
+        
+        old_coo = self.user_item_matrix.tocoo()
+        self.user_item_matrix = csr_matrix(
+            (
+                np.concatenate([old_coo.data, batch['interactionScore'].to_numpy(dtype=old_coo.data.dtype)]),
+                (np.concatenate([old_coo.row, batch_rows]), np.concatenate([old_coo.col, batch_cols]))
+            ),
+            shape=(n_users, n_items)
+        )
+        self._update_sparsity()
+        
+        # 4. Similarity chỉ cho hàng/cột bị ảnh hưởng
+        affected_users = np.unique(batch_rows)
+        affected_items = np.unique(batch_cols)
+        summary['affected_users'] = int(len(affected_users))
+        summary['affected_items'] = int(len(affected_items))
+        
+        with span('similarity_update'):
+            normalized_users = normalize(self.user_item_matrix, norm='l2', axis=1)
+            self.user_similarity = self._prune_similarity(self._patch_similarity(
+                self.user_similarity, affected_users,
+                normalized_users[affected_users] @ normalized_users.T
+            ))
+            
+            normalized_items = normalize(self.user_item_matrix.T.tocsr(), norm='l2', axis=1)
+            self.item_similarity = self._prune_similarity(self._patch_similarity(
+                self.item_similarity, affected_items,
+                normalized_items[affected_items] @ normalized_items.T
+            ))
+        
+        # 5. Popularity
+        anonymous_items = set(batch_cols[np.isin(batch_rows, self._anonymous_user_indices())].tolist())
+        self.anonymous_rentals.update(self.item_encoder.classes_[list(anonymous_items)].tolist())
+        item_scores = batch.groupby('item_idx')['interactionScore'].sum()
+        for idx, score in zip(item_scores.index.tolist(), item_scores.tolist()):
+            rental_id = self.item_encoder.classes_[idx]
+            stats = self.popularity_stats.setdefault(rental_id, [0.0, 0])
+            stats[0] += float(score)
+            stats[1] += int(new_pairs_per_item[idx])
+        self.popularity_scores = self._normalize_popularity(self.popularity_stats)
+        
+        # 6. User centroids
+        for user_id, (sum_lon, sum_lat, n) in self._location_sums(new_df).items():
+            old_lon, old_lat, old_n = self.user_location_sums.get(user_id, (0.0, 0.0, 0))
+            total = (old_lon + sum_lon, old_lat + sum_lat, old_n + n)
+            self.user_location_sums[user_id] = total
+            self.user_locations[user_id] = (total[0] / total[2], total[1] / total[2])
+        
+        if self.interactions_df is not None:
+            self.interactions_df = pd.concat([self.interactions_df, new_df], ignore_index=True)
+        
+        summary['seconds'] = round(time.perf_counter() - started, 3)
+        
+        print(f"   👥 Users: {n_users} (+{summary['new_users']}), affected: {summary['affected_users']}")
+        print(f"   🏠 Items: {n_items} (+{summary['new_items']}), affected: {summary['affected_items']}")
+        print(f"   📊 Interactions: {self.user_item_matrix.nnz}, sparsity: {self.matrix_sparsity:.2f}%")
+        print(f"   ⏱️ Update took {summary['seconds']:.2f}s")
+        print("="*70 + "\n")
+        
+        return summary
+    
+    def _add_popularity_only(self, popularity_only_df):
+        """Cộng stream popularity-only vào popularity_stats; anonymous = 1 user mỗi rental"""
+        if popularity_only_df is None:
+            return 0
+        
+        rows = popularity_only_df[popularity_only_df['rentalId'].notna()]
+        if len(rows) == 0:
+            return 0
+        
+        item_scores = rows.groupby(rows['rentalId'].astype(str))['interactionScore'].sum()
+        for rental_id, score in zip(item_scores.index.tolist(), item_scores.tolist()):
+            stats = self.popularity_stats.setdefault(rental_id, [0.0, 0])
+            stats[0] += float(score)
+            if rental_id not in self.anonymous_rentals:
+                stats[1] += 1
+                self.anonymous_rentals.add(rental_id)
+        
+        self.popularity_scores = self._normalize_popularity(self.popularity_stats)
+        print(f"   ⭐ Popularity-only interactions: {len(rows)} ({len(item_scores)} rentals)")
+        return int(len(rows))
+    
+    def _anonymous_user_indices(self):
+        anonymous = [u for u in ANONYMOUS_USER_IDS if u in set(self.user_encoder.classes_)]
+        return self.user_encoder.transform(anonymous) if anonymous else np.array([], dtype=int)
+    
+    def _anonymous_rentals_from_matrix(self):
+        """Rental có entry ở hàng anonymous của matrix (model train không tách anonymous)"""
+        anonymous_idx = self._anonymous_user_indices()
+        if len(anonymous_idx) == 0:
+            return set()
+        item_idx = np.unique(self.user_item_matrix[anonymous_idx].indices)
+        return set(self.item_encoder.classes_[item_idx].tolist())
+    
+    def _ensure_incremental_state(self):
+        """
+        Artifact train trước khi có update(): suy ra aggregate thô từ matrix.
+        - popularity_stats: tổng cột + số user khác nhau (nnz cột) - chính xác
+        - user_location_sums: centroid * số item đã tương tác - xấp xỉ
+          (matrix không lưu số lần xem mỗi bài)
+        """
+        if not self.popularity_stats and self.user_item_matrix.nnz > 0:
+            self.popularity_stats = self._popularity_stats_from_matrix()
+        
+        if not self.anonymous_rentals:
+            self.anonymous_rentals = self._anonymous_rentals_from_matrix()
+        
+        missing = [u for u in self.user_locations if u not in self.user_location_sums]
+        if missing:
+            row_nnz = np.diff(self.user_item_matrix.indptr)
+            encoded = self.user_encoder.transform(missing)
+            for user_id, idx in zip(missing, encoded):
+                weight = max(int(row_nnz[idx]), 1)
+                lon, lat = self.user_locations[user_id]
+                self.user_location_sums[user_id] = (lon * weight, lat * weight, weight)
+    
+    @staticmethod
+    def _extend_encoder(encoder, values):
+        """Sorted union classes_ cũ + id mới; trả về mảng index cũ -> index mới"""
+        import pandas as pd
+        old_classes = encoder.classes_
+        new_values = np.asarray(pd.unique(values), dtype=old_classes.dtype)
+        merged = np.union1d(old_classes, new_values)
+        encoder.classes_ = merged
+        return np.searchsorted(merged, old_classes)
+    
+    @staticmethod
+    def _remap_sparse(matrix, row_map, col_map, shape):
+        """Đổi index hàng/cột theo encoder mới (giữ cả explicit zeros như train)"""
+        coo = matrix.tocoo()
+        return csr_matrix((coo.data, (row_map[coo.row], col_map[coo.col])), shape=shape)
+    
+    def _prune_similarity(self, similarity):
+        if self.similarity_top_k is None:
+            return similarity
+        return prune_top_k(similarity, self.similarity_top_k)
+    
+    @staticmethod
+    def _patch_similarity(similarity, affected, affected_rows):
+        """
+        Thay hàng + cột `affected` của ma trận similarity đối xứng:
+        giữ entry cũ không chạm affected, thêm affected_rows và transpose của nó
+        (với top-K, update() prune lại sau khi patch vì transpose thêm entry vào hàng khác)
+        """
+        n = similarity.shape[0]
+        is_affected = np.zeros(n, dtype=bool)
+        is_affected[affected] = True
+        
+        old = similarity.tocoo()
+        keep = ~is_affected[old.row] & ~is_affected[old.col]
+        
+        fresh = affected_rows.tocoo()
+        fresh_rows = affected[fresh.row]
+        mirror = ~is_affected[fresh.col]  # (affected, affected) đã có trong fresh
+        
+        return csr_matrix(
+            (
+                np.concatenate([old.data[keep], fresh.data, fresh.data[mirror]]),
+                (
+                    np.concatenate([old.row[keep], fresh_rows, fresh.col[mirror]]),
+                    np.concatenate([old.col[keep], fresh.col, fresh_rows[mirror]])
+                )
+            ),
+            shape=(n, n)
+        )
+    
+    def _update_sparsity(self):
+        n_users, n_items = self.user_item_matrix.shape
+        total_cells = n_users * n_items
+        self.matrix_sparsity = 100 * (1 - self.user_item_matrix.nnz / max(total_cells, 1))
+        self.matrix_density = 100 - self.matrix_sparsity
+    
     def recommend_for_user(self, user_id, n_recommendations=10, exclude_items=None, 
-                        use_location=True, radius_km=20, context=None):
+                        use_location=True, radius_km=20, context=None, budget_ms=None, info=None):
         """
         🎯 IMPROVED HYBRID RECOMMENDATION ENGINE
         
@@ -334,21 +1297,39 @@ class RecommendationModel:
         4. ✅ Better price matching logic
         5. ✅ Exclude user's own rentals automatically
         6. ✅ Detailed scoring breakdown for explainability
+        
+        **Deadline (budget_ms, tính từ lúc gọi)** - stage chạy theo thứ tự ưu tiên:
+        1. popularity + content + location + preference cho mọi candidate (rẻ)
+        2. CF theo thứ tự cận trên của final score (đắt); dừng khi top N đã chắc chắn
+           (hàng user_similarity của user lấy 1 lần cho cả stage)
+        Deadline kiểm tra trước stage 1 (preference lookup / load matrix đã tiêu hết budget),
+        trong stage 1 (mỗi 256 candidate), trước khi lấy hàng similarity và trước mỗi lần chấm CF.
+        Hết budget ở stage 2 -> blend (fallback='blend'): candidate chưa chấm CF giữ score của stage 1;
+        trước / trong stage 1 -> fallback popular / nearby từ thứ tự popularity sort sẵn của catalog.
+        benchmarks/budget_check.py kiểm tra từng nhánh bằng clock giả.
+        info: dict nhận trạng thái {'degraded', 'completed_stages', 'cf_scored', 'cf_skipped',
+        'cf_pending', 'fallback', 'budget_ms', 'elapsed_ms'}
         """
         
+        started = time.perf_counter()
+        
         context = context or {}
         exclude_items = set(exclude_items or [])
         
         # Get user data
-        user_location = self.user_locations.get(user_id)
-        user_prefs = self.get_user_preferences(user_id)
+        # userId -> row (int) 1 lần; phần còn lại của request chỉ dùng row/item_idx
+        catalog = self.item_catalog
+        n_users, n_items = self.user_item_matrix.shape
+        user_row = self.user_catalog.row(user_id)
         
-        # Exclude user's own rentals
-        user_own_rentals = {
-            rental_id for rental_id, owner_id in self.rental_owners.items()
-            if owner_id == user_id
-        }
-        exclude_items.update(user_own_rentals)
+        with span('preference_lookup'):
+            user_location = None
+            if user_row is not None and self.user_catalog.has_location[user_row]:
+                user_location = self.user_catalog.location_at(user_row)
+            user_prefs = self.get_user_preferences(user_id)
+        
+        # Own rentals: owner code trên catalog (không quét dict), loại ở candidate mask bên dưới
+        own_rows = catalog.rows_owned_by(user_id)
         
         # Determine adaptive weights
         matrix_sparsity = getattr(self, 'matrix_sparsity', 0.0)
@@ -361,7 +1342,7 @@ class RecommendationModel:
                 'cf': 0.20
             }
             strategy = 'content-focused'
-            print(f"   ⚠️ High sparsity ({matrix_sparsity:.1f}%) → Using content-focused weights")
+            log.debug("   ⚠️ High sparsity (%.1f%%) → Using content-focused weights", matrix_sparsity)
         elif total_interactions >= 30:
             weights = {
                 'popularity': 0.20,
@@ -369,7 +1350,7 @@ class RecommendationModel:
                 'cf': 0.45
             }
             strategy = 'cf-focused'
-            print(f"   👤 Experienced user ({total_interactions} interactions) → Using CF-focused weights")
+            log.debug("   👤 Experienced user (%s interactions) → Using CF-focused weights", total_interactions)
         else:
             weights = {
                 'popularity': 0.25,
@@ -378,60 +1359,90 @@ class RecommendationModel:
             }
             strategy = 'balanced'
         
-        print(f"\n🎯 RECOMMEND (Hybrid {strategy.upper()})")
-        print(f"   User: {user_id}")
-        print(f"   Weights: Pop={weights['popularity']:.0%}, Content={weights['content']:.0%}, CF={weights['cf']:.0%}")
-        print(f"   Data: {len(self.user_encoder.classes_)} users, {len(self.item_encoder.classes_)} rentals")
-        print(f"   Matrix sparsity: {matrix_sparsity:.1f}%")
-        print(f"   Excluding: {len(exclude_items)} items (own rentals + seen)")
-        
-        # Score all candidates
+        log.debug("\n🎯 RECOMMEND (Hybrid %s)", strategy.upper())
+        log.debug("   User: %s", user_id)
+        log.debug("   Weights: Pop=%.0f%%, Content=%.0f%%, CF=%.0f%%",
+                  weights['popularity'] * 100, weights['content'] * 100, weights['cf'] * 100)
+        log.debug("   Data: %s users, %s rentals", n_users, n_items)
+        log.debug("   Matrix sparsity: %.1f%%", matrix_sparsity)
+        log.debug("   Excluding: %s items (own rentals + seen)", len(exclude_items) + len(own_rows))
+        
+        # Score all candidates (stage theo thứ tự ưu tiên, xem docstring: budget_ms)
+        deadline = started + budget_ms / 1000.0 if budget_ms else None
+        status = {
+            'degraded': False,
+            'budget_ms': budget_ms,
+            'completed_stages': [],
+            'cf_scored': 0,
+            'cf_skipped': 0,   # chắc chắn không vào top N (cận trên < điểm thứ N) - không ảnh hưởng kết quả
+            'cf_pending': 0,   # chưa kịp chấm CF khi hết budget - giữ score không có CF
+            'fallback': None,
+        }
         candidate_scores = {}
-        
-        user_exists = user_id in self.user_encoder.classes_
+        cf_seconds = 0.0
+        geo_seconds = 0.0
+        candidates_started = time.perf_counter()
+        
+        user_exists = user_row is not None and user_row < n_users
+        use_cf = user_exists and n_users >= 5
+        
+        # Candidate mask trên catalog (row == item_idx cho mọi item đã encode):
+        # bỏ own rentals, excluded/impressions, item user đã tương tác
+        candidate_mask = np.ones(n_items, dtype=bool)
+        candidate_mask[own_rows[own_rows < n_items]] = False
+        excluded_rows = catalog.rental_ids.codes(exclude_items.union(context.get('impressions', [])))
+        candidate_mask[excluded_rows[(excluded_rows >= 0) & (excluded_rows < n_items)]] = False
         if user_exists:
-            user_idx = self.user_encoder.transform([user_id])[0]
-        
-        for item_idx, rental_id in enumerate(self.item_encoder.classes_):
-            rental_id = str(rental_id)
-            
-            if rental_id in exclude_items or rental_id in context.get('impressions', []):
-                continue
-            
-            if user_exists and self.user_item_matrix[user_idx, item_idx] > 0:
-                continue
-            
-            # Calculate scores
-            popularity_score = self.popularity_scores.get(rental_id, 0) / 100
-            content_score = self._calculate_content_score(rental_id, user_prefs)
-            
-            cf_score = 0
-            if user_exists and len(self.user_encoder.classes_) >= 5:
-                try:
-                    cf_score = self._calculate_cf_score(user_idx, item_idx)
-                except Exception:
-                    cf_score = 0
-            
-            # Hybrid base score
-            hybrid_score = (
-                popularity_score * weights['popularity'] +
-                content_score * weights['content'] +
-                cf_score * weights['cf']
-            )
+            user_idx = user_row
+            user_interactions = self.user_item_matrix[user_idx]
+            candidate_mask[user_interactions.indices[user_interactions.data > 0]] = False
+        
+        candidate_rows = np.flatnonzero(candidate_mask)
+        # Deadline trước stage 1: preference lookup / load matrix đã tiêu hết budget -> fallback,
+        # không dựng feature dict cho mọi candidate
+        expired = deadline is not None and time.perf_counter() > deadline
+        candidate_popularity = (catalog.popularity[candidate_rows] / 100).tolist()
+        # Features chỉ cần khi có user_prefs (content + preference bonus)
+        if user_prefs and not expired:
+            candidate_features = catalog.feature_dicts(candidate_rows)
+        else:
+            candidate_features = [None] * len(candidate_rows)
+        has_coordinates = catalog.has_coordinates
+        time_bonus = self._calculate_time_bonus(user_id, context)  # không phụ thuộc candidate
+        
+        # Stage 1 (rẻ): popularity + content + location + preference cho mọi candidate
+        # partial: (item_idx, popularity, content, base = pop*w + content*w, location_bonus, distance_km, preference_bonus)
+        partial = []
+        for position, (item_idx, popularity_score, rental) in enumerate(
+                zip(candidate_rows.tolist(), candidate_popularity, candidate_features)):
+            if expired or (deadline is not None and position % 256 == 0 and time.perf_counter() > deadline):
+                expired = True
+                break
+            # Calculate scores (features truyền sẵn -> không tra theo rentalId)
+            content_score = self._calculate_content_score(None, user_prefs, rental)
+            base_score = popularity_score * weights['popularity'] + content_score * weights['content']
             
             # Location bonus
             location_bonus = 1.0
             distance_km = None
-            if use_location and user_location and rental_id in self.rental_coordinates:
+            if use_location and user_location and has_coordinates[item_idx]:
+                geo_started = time.perf_counter()
                 location_bonus, distance_km = self._calculate_location_bonus(
-                    self.rental_coordinates[rental_id],
+                    catalog.coordinates_at(item_idx),
                     user_location,
                     radius_km
                 )
+                geo_seconds += time.perf_counter() - geo_started
             
             # Other bonuses
-            preference_bonus = self._calculate_preference_bonus(rental_id, user_prefs)
-            time_bonus = self._calculate_time_bonus(user_id, context)
+            preference_bonus = self._calculate_preference_bonus(None, user_prefs, rental)
+            partial.append((item_idx, popularity_score, content_score, base_score,
+                            location_bonus, distance_km, preference_bonus))
+        
+        def finalize(entry, cf_score):
+            item_idx, popularity_score, content_score, base_score, location_bonus, distance_km, preference_bonus = entry
+            # Hybrid base score (= pop*w + content*w + cf*w, cùng thứ tự cộng)
+            hybrid_score = base_score + cf_score * weights['cf']
             
             # Final score
             final_score = hybrid_score * location_bonus * preference_bonus * time_bonus
@@ -446,7 +1457,7 @@ class RecommendationModel:
                 total_interactions=total_interactions
             )
             
-            candidate_scores[rental_id] = {
+            return {
                 'final_score': final_score,
                 'hybrid_score': hybrid_score,
                 'popularity': popularity_score,
@@ -461,71 +1472,227 @@ class RecommendationModel:
                 'strategy': strategy
             }
         
-        # Sort and select top N
-        sorted_items = sorted(
-            candidate_scores.items(),
-            key=lambda x: x[1]['final_score'],
-            reverse=True
-        )
-        
-        # Build recommendations
-        recommendations = []
-        
-        for rental_id, scores in sorted_items[:n_recommendations]:
-            coords = self.rental_coordinates.get(rental_id, (0, 0))
+        if not expired:
+            status['completed_stages'].append('content')
             
-            recommendation = {
-                'rentalId': rental_id,
-                'score': float(scores['hybrid_score']),
-                'popularityScore': float(scores['popularity']),
-                'contentScore': float(scores['content_score']),
-                'cfScore': float(scores['cf_score']),
-                'locationBonus': float(scores['location_bonus']),
-                'preferenceBonus': float(scores['preference_bonus']),
-                'timeBonus': float(scores['time_bonus']),
-                'finalScore': float(scores['final_score']),
-                'confidence': float(scores['confidence']),
-                'method': f'hybrid_{strategy}',
-                'weights': scores['weights'],
-                'coordinates': coords,
-                'distance_km': float(scores['distance_km']) if scores['distance_km'] else None,
-                'scoreBreakdown': {
-                    'popularity': {
-                        'score': float(scores['popularity']),
-                        'weight': float(weights['popularity']),
-                        'contribution': float(scores['popularity'] * weights['popularity'])
-                    },
-                    'content': {
-                        'score': float(scores['content_score']),
-                        'weight': float(weights['content']),
-                        'contribution': float(scores['content_score'] * weights['content'])
-                    },
-                    'collaborative': {
-                        'score': float(scores['cf_score']),
-                        'weight': float(weights['cf']),
-                        'contribution': float(scores['cf_score'] * weights['cf'])
-                    }
-                }
-            }
+            # Stage 2 (đắt): CF theo thứ tự cận trên của final score (cf_score trong [0, 1])
+            # -> top N thường chắc chắn trước khi chấm hết; hết budget thì phần còn lại giữ score không CF
+            order = range(len(partial))
+            bounds = None
+            if use_cf:
+                bounds = [
+                    max(entry[3] * entry[4] * entry[6] * time_bonus,
+                        (entry[3] + weights['cf']) * entry[4] * entry[6] * time_bonus)
+                    for entry in partial
+                ]
+                if not any(np.isnan(bound) for bound in bounds):
+                    order = sorted(order, key=lambda i: bounds[i], reverse=True)
+                else:
+                    bounds = None  # NaN: không so sánh được, chấm hết theo thứ tự row
             
-            recommendations.append(recommendation)
-        
-        # Log summary
-        print(f"   ✅ Generated {len(recommendations)} recommendations")
-        
-        if recommendations:
-            top = recommendations[0]
-            print(f"   🥇 Top recommendation:")
-            print(f"      rentalId: {top['rentalId'][:16]}...")
-            print(f"      finalScore: {top['finalScore']:.2f}")
-            print(f"      confidence: {top['confidence']:.2f} ({int(top['confidence']*100)}%)")
-            print(f"      breakdown: Pop={top['scoreBreakdown']['popularity']['contribution']:.2f}, "
-                  f"Content={top['scoreBreakdown']['content']['contribution']:.2f}, "
-                  f"CF={top['scoreBreakdown']['collaborative']['contribution']:.2f}")
+            top_scores = []  # min-heap final_score của N candidate tốt nhất đã chấm CF
+            user_similarities = None  # hàng similarity của user: lấy 1 lần, trước candidate CF đầu tiên
             
-            if top['distance_km']:
-                print(f"      distance: {top['distance_km']:.2f}km")
+            def blend_rest(position):
+                """Hết budget: blend - candidate chưa chấm CF dùng score của stage 1 (cf = 0)"""
+                status['degraded'] = True
+                status['fallback'] = 'blend'
+                status['cf_pending'] = len(order) - position
+                for j in order[position:]:
+                    candidate_scores[partial[j][0]] = finalize(partial[j], 0)
+            
+            for position, i in enumerate(order):
+                cf_score = 0
+                if use_cf:
+                    if bounds is not None and len(top_scores) >= n_recommendations and top_scores[0] > bounds[i]:
+                        status['cf_skipped'] = len(order) - position
+                        break
+                    if deadline is not None and time.perf_counter() > deadline:
+                        blend_rest(position)
+                        break
+                    cf_started = time.perf_counter()
+                    if user_similarities is None:
+                        # Stage similarity: lần đầu có thể là lúc user_similarity (lazy) được copy vào RAM
+                        user_similarities = self._user_similarity_row(user_idx)
+                        if deadline is not None and time.perf_counter() > deadline:
+                            cf_seconds += time.perf_counter() - cf_started
+                            blend_rest(position)
+                            break
+                    try:
+                        cf_score = self._calculate_cf_score(user_idx, partial[i][0], user_similarities)
+                    except Exception:
+                        cf_score = 0
+                    cf_seconds += time.perf_counter() - cf_started
+                    status['cf_scored'] += 1
+                
+                scores = finalize(partial[i], cf_score)
+                candidate_scores[partial[i][0]] = scores
+                if bounds is not None:
+                    if len(top_scores) < n_recommendations:
+                        heapq.heappush(top_scores, scores['final_score'])
+                    elif scores['final_score'] > top_scores[0]:
+                        heapq.heapreplace(top_scores, scores['final_score'])
+            
+            if use_cf and not status['degraded']:
+                status['completed_stages'].append('cf')
+            # Thứ tự row như khi chấm tuần tự -> sort ổn định, tie-break giống nhau
+            candidate_scores = dict(sorted(candidate_scores.items()))
         
+        # CF / geo được cộng dồn trong vòng lặp, nằm lồng trong candidate_generation
+        record_stage('candidate_generation', time.perf_counter() - candidates_started)
+        if user_exists:
+            record_stage('cf', cf_seconds)
+        if use_location and user_location:
+            record_stage('geo', geo_seconds)
+        
+        if expired:
+            # Hết budget trước khi chấm xong stage 1: popular / nearby dựng từ catalog
+            status['degraded'] = True
+            with span('fallback'):
+                recommendations = self._fallback_recommendations(
+                    candidate_rows, n_recommendations, user_location if use_location else None,
+                    radius_km, user_prefs, total_interactions, status
+                )
+        else:
+            # Sort and select top N
+            with span('sorting'):
+                sorted_items = sorted(
+                    candidate_scores.items(),
+                    key=lambda x: x[1]['final_score'],
+                    reverse=True
+                )
+            
+            # Build recommendations
+            serialization_started = time.perf_counter()
+            recommendations = [
+                self._recommendation_dict(row, scores, f'hybrid_{strategy}')
+                for row, scores in sorted_items[:n_recommendations]
+            ]
+            record_stage('serialization', time.perf_counter() - serialization_started)
+        
+        RECOMMEND_DURATION.observe(time.perf_counter() - started, strategy=strategy)
+        status['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        if info is not None:
+            info.update(status)
+        if status['degraded']:
+            RECOMMEND_DEGRADED.inc(mode=status['fallback'])
+            log.debug("   ⏱️ Degraded (budget %sms): stages=%s, cf %s scored / %s pending, fallback=%s",
+                      budget_ms, status['completed_stages'], status['cf_scored'], status['cf_pending'],
+                      status['fallback'])
+        
+        # Log summary (top recommendation: chỉ build khi bật DEBUG)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("   ✅ Generated %s recommendations", len(recommendations))
+            
+            if recommendations:
+                top = recommendations[0]
+                log.debug("   🥇 Top recommendation:")
+                log.debug("      rentalId: %s...", top['rentalId'][:16])
+                log.debug("      finalScore: %.2f", top['finalScore'])
+                log.debug("      confidence: %.2f (%s%%)", top['confidence'], int(top['confidence']*100))
+                breakdown = top['scoreBreakdown']
+                log.debug("      breakdown: Pop=%.2f, Content=%.2f, CF=%.2f",
+                          breakdown['popularity']['contribution'], breakdown['content']['contribution'],
+                          breakdown['collaborative']['contribution'])
+                
+                if top['distance_km']:
+                    log.debug("      distance: %.2fkm", top['distance_km'])
+        
+        return recommendations
+    
+    def _recommendation_dict(self, row, scores, method):
+        """Candidate đã chấm -> dict response của recommend_for_user (rentalId tạo ở đây, chỉ cho top N)"""
+        catalog = self.item_catalog
+        weights = scores['weights']
+        coords = catalog.coordinates_at(row) if catalog.has_coordinates[row] else (0, 0)
+        
+        return {
+            'rentalId': catalog.id_at(row),
+            'score': float(scores['hybrid_score']),
+            'popularityScore': float(scores['popularity']),
+            'contentScore': float(scores['content_score']),
+            'cfScore': float(scores['cf_score']),
+            'locationBonus': float(scores['location_bonus']),
+            'preferenceBonus': float(scores['preference_bonus']),
+            'timeBonus': float(scores['time_bonus']),
+            'finalScore': float(scores['final_score']),
+            'confidence': float(scores['confidence']),
+            'method': method,
+            'weights': weights,
+            'coordinates': coords,
+            'distance_km': float(scores['distance_km']) if scores['distance_km'] else None,
+            'scoreBreakdown': {
+                'popularity': {
+                    'score': float(scores['popularity']),
+                    'weight': float(weights['popularity']),
+                    'contribution': float(scores['popularity'] * weights['popularity'])
+                },
+                'content': {
+                    'score': float(scores['content_score']),
+                    'weight': float(weights['content']),
+                    'contribution': float(scores['content_score'] * weights['content'])
+                },
+                'collaborative': {
+                    'score': float(scores['cf_score']),
+                    'weight': float(weights['cf']),
+                    'contribution': float(scores['cf_score'] * weights['cf'])
+                }
+            }
+        }
+    
+    def _fallback_recommendations(self, candidate_rows, n_recommendations, user_location, radius_km,
+                                  user_prefs, total_interactions, status):
+        """
+        Hết budget trước khi chấm xong: candidate theo popularity_order đã sort sẵn của catalog;
+        biết vị trí user -> rental trong bán kính radius_km lên trước (nearby), còn lại theo popularity
+        """
+        catalog = self.item_catalog
+        is_candidate = np.zeros(len(catalog), dtype=bool)
+        is_candidate[candidate_rows] = True
+        ordered = catalog.popularity_order[is_candidate[catalog.popularity_order]]
+        # Candidate chưa có popularity xếp sau, theo row
+        without_popularity = candidate_rows[~catalog.has_popularity[candidate_rows]]
+        ordered = np.concatenate([ordered, without_popularity]).astype(np.int64, copy=False)
+        
+        status['fallback'] = 'popular'
+        if user_location and (user_location[0] != 0 or user_location[1] != 0) and len(ordered):
+            # Haversine vector hoá (chỉ để chia trong / ngoài bán kính; bonus tính lại cho top N)
+            lon1, lat1 = np.radians(user_location[0]), np.radians(user_location[1])
+            lon2, lat2 = np.radians(catalog.longitude[ordered]), np.radians(catalog.latitude[ordered])
+            a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+            distances = 6371 * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+            valid = catalog.has_coordinates[ordered] & ((catalog.longitude[ordered] != 0) | (catalog.latitude[ordered] != 0))
+            nearby = valid & (distances <= radius_km)
+            if nearby.any():
+                ordered = np.concatenate([ordered[nearby], ordered[~nearby]])
+                status['fallback'] = 'nearby'
+        
+        weights = {'popularity': 1.0, 'content': 0.0, 'cf': 0.0}
+        recommendations = []
+        for row in ordered[:n_recommendations].tolist():
+            popularity_score = float(catalog.popularity[row]) / 100 if catalog.has_popularity[row] else 0.0
+            location_bonus, distance_km = 1.0, None
+            if user_location and catalog.has_coordinates[row]:
+                location_bonus, distance_km = self._calculate_location_bonus(
+                    catalog.coordinates_at(row), user_location, radius_km
+                )
+            scores = {
+                'final_score': popularity_score * location_bonus,
+                'hybrid_score': popularity_score,
+                'popularity': popularity_score,
+                'content_score': 0.0,
+                'cf_score': 0.0,
+                'location_bonus': location_bonus,
+                'preference_bonus': 1.0,
+                'time_bonus': 1.0,
+                'distance_km': distance_km,
+                'confidence': self._calculate_confidence(
+                    content_score=0.0, cf_score=0.0, popularity_score=popularity_score,
+                    user_prefs=user_prefs, location_bonus=location_bonus, total_interactions=total_interactions
+                ),
+                'weights': weights,
+            }
+            recommendations.append(self._recommendation_dict(row, scores, f"fallback_{status['fallback']}"))
         return recommendations
 
 # ================================ CẬP NHẬT HELPER MỚI 
@@ -593,17 +1760,19 @@ class RecommendationModel:
             
             return float(confidence)
 
-    def _calculate_content_score(self, rental_id, user_prefs):
+    def _calculate_content_score(self, rental_id, user_prefs, rental=None):
         """
         📊 IMPROVED CONTENT-BASED SCORING
         
         Adjusted weights: Price 40%, Type 35%, Location 25%
+        rental: features đã lấy từ catalog (None = tra theo rental_id)
         """
         
         if not user_prefs:
             return 0.60
         
-        rental = self.item_features.get(rental_id, {})
+        if rental is None:
+            rental = self.item_features.get(rental_id, {})
         if not rental:
             return 0.40
         
@@ -815,17 +1984,26 @@ class RecommendationModel:
         
         return max(0.1, min(1.5, bonus)), distance_km
     
-    def _calculate_cf_score(self, user_idx, item_idx):
+    def _user_similarity_row(self, user_idx):
+        """Hàng user_similarity (dense) của user - None khi model chưa có similarity"""
+        if self.user_similarity is None:
+            return None
+        return self.user_similarity[user_idx].toarray().flatten()
+    
+    def _calculate_cf_score(self, user_idx, item_idx, user_similarities=None):
         """
         👥 Calculate Collaborative Filtering score
         Uses user-user similarity to predict item rating
+        
+        user_similarities: hàng similarity của user đã lấy sẵn (recommend_for_user lấy 1 lần mỗi request)
         """
         try:
             if self.user_similarity is None or self.user_item_matrix is None:
                 return 0.0
             
             # Get similar users (top K similar users)
-            user_similarities = self.user_similarity[user_idx].toarray().flatten()
+            if user_similarities is None:
+                user_similarities = self._user_similarity_row(user_idx)
             
             # Get users who interacted with this item
             item_vector = self.user_item_matrix[:, item_idx].toarray().flatten()
@@ -853,17 +2031,18 @@ class RecommendationModel:
             return min(1.0, max(0.0, cf_score))
             
         except Exception as e:
-            print(f"      ⚠️ Error calculating CF score: {e}")
+            log.warning(f"      ⚠️ Error calculating CF score: {e}")
             return 0.0
     
-    def _calculate_preference_bonus(self, rental_id, user_prefs):
+    def _calculate_preference_bonus(self, rental_id, user_prefs, rental=None):
         """
         🎯 Calculate preference bonus based on user's historical preferences
         """
         if not user_prefs:
             return 1.0
         
-        rental = self.item_features.get(rental_id, {})
+        if rental is None:
+            rental = self.item_features.get(rental_id, {})
         if not rental:
             return 1.0
         
@@ -943,37 +2122,33 @@ class RecommendationModel:
         """
         context = context or {}
         
-        if item_id not in self.item_encoder.classes_:
-            print(f"⚠️ Item {item_id} not found")
+        catalog = self.item_catalog
+        item_idx = catalog.row(item_id)
+        if item_idx is None or item_idx >= self.user_item_matrix.shape[1]:
+            log.debug("⚠️ Item %s not found", item_id)
             return []
         
-        item_idx = self.item_encoder.transform([item_id])[0]
-        item_similarities = self.item_similarity[item_idx].toarray().flatten()
-        
-        # Get reference rental's location
-        ref_location = self.rental_coordinates.get(item_id, (0, 0))
+        with span('candidate_generation'):
+            item_similarities = self.item_similarity[item_idx].toarray().flatten()
+            
+            # Get reference rental's location
+            ref_location = catalog.coordinates_at(item_idx) if catalog.has_coordinates[item_idx] else (0, 0)
+            
+            # Get top K similar items (bỏ chính item: similarity int8 có thể hoà với hàng khác ở 1.0)
+            similar_items_idx = np.argsort(item_similarities)[::-1]
+            similar_items_idx = similar_items_idx[similar_items_idx != item_idx][:n_recommendations+9]
         
-        # Get top K similar items
-        similar_items_idx = np.argsort(item_similarities)[::-1][1:n_recommendations+10]
+        impression_rows = set(catalog.rental_ids.codes(context.get('impressions') or []).tolist())
         
         recommendations = []
-        for idx in similar_items_idx:
-            rental_id = self.item_encoder.inverse_transform([idx])[0]
-            
+        for idx in similar_items_idx.tolist():
             # Skip if already shown
-            if context.get('impressions') and rental_id in context.get('impressions'):
+            if idx in impression_rows:
                 continue
             
             base_score = float(item_similarities[idx])
 
-            rental_coords = self.rental_coordinates.get(rental_id, (0, 0))
-
-            if not isinstance(rental_coords, (tuple, list)):
-                rental_coords = (0, 0)
-            elif len(rental_coords) < 2:
-                rental_coords = (0, 0)
-            else:
-                rental_coords = (float(rental_coords[0]), float(rental_coords[1]))
+            rental_coords = catalog.coordinates_at(idx) if catalog.has_coordinates[idx] else (0, 0)
             
             # LOCATION PROXIMITY BONUS
             location_bonus = 1.0
@@ -995,7 +2170,7 @@ class RecommendationModel:
             final_score = base_score * location_bonus
         
             recommendations.append({
-                'rentalId': rental_id,
+                'rentalId': catalog.id_at(idx),
                 'score': base_score,
                 'locationBonus': location_bonus,
                 'finalScore': final_score,
@@ -1006,7 +2181,8 @@ class RecommendationModel:
             })
     
         # Sort by final score
-        recommendations.sort(key=lambda x: x['finalScore'], reverse=True)
+        with span('sorting'):
+            recommendations.sort(key=lambda x: x['finalScore'], reverse=True)
         
         return recommendations[:n_recommendations]
     
@@ -1016,39 +2192,46 @@ class RecommendationModel:
         """
         context = context or {}
         
-        sorted_items = sorted(
-            self.popularity_scores.items(), 
-            key=lambda x: x[1], 
-            reverse=True
-        )
+        # Thứ tự popularity đã sort sẵn trong catalog
+        catalog = self.item_catalog
+        with span('sorting'):
+            ordered_rows = catalog.popularity_order
         
+        skipped_rows = set(catalog.rental_ids.codes(
+            set(exclude_items or ()).union(context.get('impressions') or ())
+        ).tolist())
+        
+        # Chỉ đọc prefix của thứ tự (chunk n + số row bị bỏ đủ cho lượt đầu) thay vì tolist() cả catalog
         recommendations = []
-        for rental_id, score in sorted_items:
-            if exclude_items and rental_id in exclude_items:
-                continue
-            
-            if context.get('impressions') and rental_id in context.get('impressions'):
-                continue
-            
-            # 🔥 FIX: Add all required fields for PersonalizedRecommendationResponse
-            recommendations.append({
-                'rentalId': rental_id,
-                'score': float(score),
-                'locationBonus': 1.0,        # 🔥 ADD: Default location bonus
-                'preferenceBonus': 1.0,      # 🔥 ADD: Default preference bonus
-                'timeBonus': 1.0,            # 🔥 ADD: Default time bonus
-                'finalScore': float(score),  # 🔥 FIX: ADD finalScore (same as score)
-                'method': 'popularity',
-                'coordinates': self.rental_coordinates.get(rental_id, (0, 0)),
-                'distance_km': None,         # 🔥 ADD: No distance for popularity
-                'explanation': {
-                    'popularity': f'Được {int(score)} người quan tâm'
-                },
-                'confidence': min(1.0, score / 100),
-            })
-            
+        chunk = max(n_recommendations + len(skipped_rows), 1)
+        for start in range(0, len(ordered_rows), chunk):
             if len(recommendations) >= n_recommendations:
                 break
+            for row in ordered_rows[start:start + chunk].tolist():
+                if row in skipped_rows:
+                    continue
+                rental_id = catalog.id_at(row)
+                score = catalog.popularity[row]
+                
+                # 🔥 FIX: Add all required fields for PersonalizedRecommendationResponse
+                recommendations.append({
+                    'rentalId': rental_id,
+                    'score': float(score),
+                    'locationBonus': 1.0,        # 🔥 ADD: Default location bonus
+                    'preferenceBonus': 1.0,      # 🔥 ADD: Default preference bonus
+                    'timeBonus': 1.0,            # 🔥 ADD: Default time bonus
+                    'finalScore': float(score),  # 🔥 FIX: ADD finalScore (same as score)
+                    'method': 'popularity',
+                    'coordinates': catalog.coordinates_at(row) if catalog.has_coordinates[row] else (0, 0),
+                    'distance_km': None,         # 🔥 ADD: No distance for popularity
+                    'explanation': {
+                        'popularity': f'Được {int(score)} người quan tâm'
+                    },
+                    'confidence': min(1.0, score / 100),
+                })
+                
+                if len(recommendations) >= n_recommendations:
+                    break
         
         return recommendations
     
@@ -1058,22 +2241,30 @@ class RecommendationModel:
         
         os.makedirs(os.path.dirname(filepath), exist_ok=True)
         
+        if self.item_catalog is None:
+            self._build_catalogs()
+        
+        # Id chỉ lưu trong IdTable của 2 catalog (thay LabelEncoder + dict theo string id)
         model_data = {
             'user_item_matrix': self.user_item_matrix,
             'user_similarity': self.user_similarity,
             'item_similarity': self.item_similarity,
-            'user_encoder': self.user_encoder,
-            'item_encoder': self.item_encoder,
-            'popularity_scores': self.popularity_scores,
-            'rental_coordinates': self.rental_coordinates,
-            'user_locations': self.user_locations,
-            'rental_owners': self.rental_owners,
+            'user_catalog': self.user_catalog.to_state(),  # userId + user_locations
+            'item_catalog': self.item_catalog.to_state(),  # rentalId + item_features + coordinates + owners + popularity
+            'incremental_state': self._pack_incremental_state(),  # popularity_stats, user_location_sums, anonymous_rentals
             'matrix_sparsity': self.matrix_sparsity,  # 🔥 ADD
             'matrix_density': self.matrix_density,    # 🔥 ADD
+            'similarity_top_k': self.similarity_top_k,
+            'matrix_storage': self.matrix_storage,
             'trained_at': datetime.now().isoformat()
         }
         
-        joblib.dump(model_data, filepath)
+        # Ghi file tạm rồi rename: process đang đọc lazy / memory-map artifact cũ vẫn giữ inode cũ
+        tmp_path = f"{filepath}.tmp"
+        joblib.dump(model_data, tmp_path)
+        os.replace(tmp_path, filepath)
+        write_manifest(model_data, filepath, memory_peaks=self.memory_peaks)
+        self.artifact_path = filepath
         
         print(f"✅ Model saved successfully")
         print(f"   File size: {os.path.getsize(filepath) / (1024*1024):.2f} MB")
@@ -1083,28 +2274,92 @@ class RecommendationModel:
 
     # 🔥 UPDATE: load method to include rental_owners (line ~530)
     @classmethod
-    def load(cls, filepath='./models/recommendation_model.pkl'):
-        """Load model từ file"""
-        print(f"\n📂 Loading model from {filepath}...")
+    def load(cls, filepath='./models/recommendation_model.pkl', lazy=False, preload=(), mmap=False,
+             trace_memory=False):
+        """
+        Load model từ file
+        
+        lazy=True: artifact mở với mmap_mode='r' (chỉ đọc cấu trúc, catalog, id); user_item_matrix /
+        user_similarity / item_similarity copy vào RAM lần đầu được truy cập (có lock) -> worker chỉ
+        phục vụ popular/personalized không tốn thời gian + RAM cho item_similarity.
+        preload: component trong LAZY_COMPONENTS load sẵn ngay ('all' = tất cả).
+        mmap=True: mọi array giữ dạng memory-map read-only, không copy (nhiều process cùng map 1 file
+        dùng chung page cache - training/shared_model.py); file không được ghi đè tại chỗ.
+        trace_memory=True: đo peak tracemalloc lúc load (memory_peaks['load']); mặc định tắt vì
+        tracemalloc làm load chậm ~5x (API startup, mỗi worker, mỗi SharedModel.refresh())
+        """
+        mode = ' (memory-mapped)' if mmap else ' (lazy)' if lazy else ''
+        print(f"\n📂 Loading model from {filepath}{mode}...")
         
         if not os.path.exists(filepath):
             raise FileNotFoundError(f"Model file not found: {filepath}")
+        preload = LAZY_COMPONENTS if preload == 'all' else tuple(preload or ())
+        unknown = set(preload) - set(LAZY_COMPONENTS)
+        if unknown:
+            raise ValueError(f"Unknown preload component(s): {', '.join(sorted(unknown))} "
+                             f"(chọn trong {', '.join(LAZY_COMPONENTS)})")
+        
+        peaks = {}
+        with track_peak(peaks, 'load', enabled=trace_memory):
+            model = cls._load_artifact(filepath, lazy and not mmap, mmap)
+            for name in preload:
+                getattr(model, name)
+        
+        # Peak lúc train (ghi trong manifest khi save) + peak load vừa đo
+        manifest = read_manifest(filepath)
+        if manifest is not None and not is_stale(manifest, filepath):
+            model.memory_peaks.update(manifest.get('memory_peaks') or {})
+        model.memory_peaks.update(peaks)
+        model.artifact_path = filepath
         
-        model_data = joblib.load(filepath)
+        print(f"✅ Model loaded successfully")
+        print(f"   Trained at: {model.trained_at or 'unknown'}")
+        print(f"   Rental coordinates loaded: {len(model.rental_coordinates)}")
+        print(f"   User locations loaded: {len(model.user_locations)}")
+        print(f"   🔥 Matrix sparsity: {model.matrix_sparsity:.2f}%")
+        model._print_memory_peak('load')
+        
+        return model
+    
+    @classmethod
+    def _load_artifact(cls, filepath, lazy=False, mmap=False):
+        """Thân load(): artifact -> model"""
+        model_data = joblib.load(filepath, mmap_mode='r' if lazy or mmap else None)
         
         # ✅ FIX: Create instance properly
         model = cls()
+        model.memory_mapped = mmap
         
         # ✅ Restore all attributes from saved model
-        model.user_item_matrix = model_data['user_item_matrix']
-        model.user_similarity = model_data['user_similarity']
-        model.item_similarity = model_data['item_similarity']
-        model.user_encoder = model_data['user_encoder']
-        model.item_encoder = model_data['item_encoder']
-        model.popularity_scores = model_data['popularity_scores']
-        model.rental_coordinates = model_data.get('rental_coordinates', {})
-        model.user_locations = model_data.get('user_locations', {})
-        model.rental_owners = model_data.get('rental_owners', {})
+        for name in LAZY_COMPONENTS:
+            if lazy and model_data[name] is not None:
+                model._pending_components[name] = model_data[name]
+                model.lazy_components[name] = {'loaded': False}
+            else:
+                setattr(model, name, model_data[name])
+        # Artifact mới không có encoder: None = dựng lại từ user_catalog/item_catalog khi cần
+        model.user_encoder = model_data.get('user_encoder')
+        model.item_encoder = model_data.get('item_encoder')
+        model.popularity_stats = model_data.get('popularity_stats', {})
+        model.user_location_sums = model_data.get('user_location_sums', {})
+        model.anonymous_rentals = model_data.get('anonymous_rentals', set())
+        model._packed_incremental_state = model_data.get('incremental_state')
+        if 'user_catalog' in model_data:
+            model.item_catalog = ItemCatalog.from_state(model_data['item_catalog'])
+            model.user_catalog = UserCatalog.from_state(model_data['user_catalog'])
+            model._attach_catalog_views()
+        else:
+            # Artifact cũ: encoder + dict theo string id (item_features có thể thiếu) -> dựng catalog lúc load
+            item_maps = artifact_item_maps(model_data)
+            model.item_features = dict(item_maps['item_features'])
+            model.rental_coordinates = dict(item_maps['rental_coordinates'])
+            model.rental_owners = dict(item_maps['rental_owners'])
+            model.popularity_scores = dict(item_maps['popularity_scores'])
+            model.user_locations = model_data.get('user_locations', {})
+            model._build_catalogs()
+        model.trained_at = model_data.get('trained_at')
+        model.similarity_top_k = model_data.get('similarity_top_k')
+        model.matrix_storage = model_data.get('matrix_storage', DEFAULT_MATRIX_STORAGE)
         
         # 🔥 FIX: Restore matrix_sparsity with safe fallback
         if 'matrix_sparsity' in model_data:
@@ -1112,46 +2367,98 @@ class RecommendationModel:
             model.matrix_density = model_data['matrix_density']
         else:
             # Calculate if not in file
-            n_users = len(model.user_encoder.classes_)
-            n_items = len(model.item_encoder.classes_)
+            n_users, n_items = model.user_item_matrix.shape
             total_cells = n_users * n_items
             non_zero_cells = model.user_item_matrix.nnz
             
             model.matrix_sparsity = 100 * (1 - non_zero_cells / max(total_cells, 1))
             model.matrix_density = 100 - model.matrix_sparsity
         
-        print(f"✅ Model loaded successfully")
-        print(f"   Trained at: {model_data.get('trained_at', 'unknown')}")
-        print(f"   Rental coordinates loaded: {len(model.rental_coordinates)}")
-        print(f"   User locations loaded: {len(model.user_locations)}")
-        print(f"   🔥 Matrix sparsity: {model.matrix_sparsity:.2f}%")
-        
         return model
 
 
-def main():
-    """Main training pipeline"""
-    print("\n" + "="*70)
-    print("🤖 RENTAL RECOMMENDATION MODEL TRAINING WITH GEO FEATURES")
-    print("="*70 + "\n")
+# ==================== CLI HELPERS (train_model.py + run_training.py) ====================
+
+def add_training_arguments(parser):
+    """Flag dùng chung cho main() và training/run_training.py"""
+    parser.add_argument('--stream', action='store_true',
+                        help='Đọc interactions.csv theo chunk (log quá lớn để load 1 lần)')
+    parser.add_argument('--chunksize', type=int, default=200_000, help='Số dòng mỗi chunk khi --stream')
+    parser.add_argument('--no-preaggregate', action='store_true',
+                        help='Không gộp event lặp / không tách anonymous (dùng nguyên log; --stream luôn bỏ qua)')
+    parser.add_argument('--preaggregate-window', default=DEFAULT_WINDOW,
+                        help="Cửa sổ gộp event (pandas offset, vd '30min'; '' = gộp bỏ qua thời gian)")
+    parser.add_argument('--preaggregate-score', choices=['once', 'sum'], default='once',
+                        help='Điểm mỗi cửa sổ: 1 event hay tổng các event')
+    parser.add_argument('--no-cache', action='store_true', help='Tắt stage cache (tính lại mọi stage)')
+    parser.add_argument('--cache-dir', default=None, help='Thư mục stage cache (mặc định ./.cache/stages)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Số stage chạy song song sau khi có matrix (mặc định = số CPU)')
+    parser.add_argument('--similarity-top-k', type=int, default=None,
+                        help='Chỉ giữ K neighbor mỗi user/item (mặc định giữ hết)')
+    parser.add_argument('--similarity-jobs', type=int, default=None, help='Số worker tính similarity (mặc định = số CPU)')
+    parser.add_argument('--similarity-block-size', type=int, default=DEFAULT_BLOCK_SIZE)
+    parser.add_argument('--similarity-backend', choices=['thread', 'process'], default='thread')
+    parser.add_argument('--matrix-storage', choices=MATRIX_STORAGES, default=DEFAULT_MATRIX_STORAGE,
+                        help='Kiểu lưu matrix + similarity: float32 (~1/2 dung lượng), '
+                             'int8 (similarity lượng tử hoá 8 bit, scale theo hàng)')
+    parser.add_argument('--no-trace-memory', action='store_true',
+                        help='Không đo peak Python heap bằng tracemalloc khi train (nhanh hơn ~20%%)')
+
+
+def build_model(args):
+    """RecommendationModel cấu hình theo flag của add_training_arguments()"""
+    model = RecommendationModel()
+    model.similarity_top_k = args.similarity_top_k
+    model.similarity_jobs = args.similarity_jobs
+    model.similarity_block_size = args.similarity_block_size
+    model.similarity_backend = args.similarity_backend
+    model.max_workers = args.workers or os.cpu_count() or 1
+    model.trace_memory = not args.no_trace_memory
+    model.matrix_storage = args.matrix_storage
+    if not args.no_cache and not args.stream:
+        from training.stage_cache import StageCache
+        model.stage_cache = StageCache(args.cache_dir) if args.cache_dir else StageCache()
+    return model
+
+
+def load_interactions(path, cache=None):
+    """-> (interactions_df, csv_key) - csv_key = None khi không có cache"""
+    if cache is not None:
+        return cache.load_csv(path)
+    import pandas as pd
+    return pd.read_csv(path), None
+
+
+def preaggregate(interactions_df, args, cache=None, csv_key=None):
+    """
+    Gộp event lặp + tách anonymous theo flag -> (cf_df, popularity_only_df, report | None, key | None)
     
-    # ========================================
-    # BƯỚC 1: LOAD DATA
-    # ========================================
-    print("📂 Loading datasets...")
+    key: stage-cache key của output (truyền vào model.train(input_key=...))
+    """
+    if args.no_preaggregate:
+        return interactions_df, None, None, csv_key
     
-    if not os.path.exists('./data/interactions.csv'):
-        print("❌ interactions.csv not found!")
-        print("   Run: python data/export_dataset.py first")
-        return
+    window = args.preaggregate_window or None
     
-    if not os.path.exists('./data/rentals.csv'):
-        print("❌ rentals.csv not found!")
-        print("   Run: python data/export_dataset.py first")
-        return
+    def compute():
+        return preaggregate_interactions(interactions_df, window=window, score_mode=args.preaggregate_score)
     
-    interactions_df = pd.read_csv('./data/interactions.csv')
-    rentals_df = pd.read_csv('./data/rentals.csv')
+    if cache is not None and csv_key is not None:
+        key = cache.fingerprint('preaggregate', STAGE_VERSIONS['preaggregate'], csv_key, window, args.preaggregate_score)
+        result, _ = cache.cached('preaggregate', key, compute)
+    else:
+        key = None
+        result = compute()
+    
+    print_report(result[2])
+    return (*result, key)
+
+
+def _train_in_memory(model, rentals_df, args):
+    """Load toàn bộ interactions.csv rồi train (mặc định) -> CF interactions_df (None = huỷ)"""
+    cache = model.stage_cache
+    interactions_df, csv_key = load_interactions('./data/interactions.csv', cache)
     
     print(f"✅ Loaded {len(interactions_df)} interactions")
     print(f"✅ Loaded {len(rentals_df)} rentals")
@@ -1173,21 +2480,78 @@ def main():
         response = input("Continue anyway? (y/n): ")
         if response.lower() != 'y':
             print("Training cancelled.")
-            return
+            return None
+    
+    # Gộp event lặp + tách anonymous ra khỏi CF matrix
+    interactions_df, popularity_only_df, _, input_key = preaggregate(interactions_df, args, cache, csv_key)
     
     # ========================================
     # BƯỚC 2: TRAIN MODEL
     # ========================================
-    model = RecommendationModel()
-    model.train(interactions_df, rentals_df)
+    model.train(interactions_df, rentals_df, popularity_only_df=popularity_only_df, input_key=input_key)
+    return interactions_df
+
+
+def main():
+    """Main training pipeline (interactive) - chạy headless/cron: training/run_training.py"""
+    import pandas as pd
+    
+    parser = argparse.ArgumentParser(description='Train rental recommendation model')
+    add_training_arguments(parser)
+    parser.add_argument('--reports', action='store_true',
+                        help='Tạo biểu đồ sau khi save (mặc định bỏ qua: python training/generate_reports.py)')
+    parser.add_argument('--report-workers', type=int, default=None, help='Số process vẽ biểu đồ khi --reports')
+    args = parser.parse_args()
+    
+    print("\n" + "="*70)
+    print("🤖 RENTAL RECOMMENDATION MODEL TRAINING WITH GEO FEATURES")
+    print("="*70 + "\n")
+    
+    # ========================================
+    # BƯỚC 1: LOAD DATA
+    # ========================================
+    print("📂 Loading datasets...")
+    
+    if not os.path.exists('./data/interactions.csv'):
+        print("❌ interactions.csv not found!")
+        print("   Run: python data/export_dataset.py first")
+        return
+    
+    if not os.path.exists('./data/rentals.csv'):
+        print("❌ rentals.csv not found!")
+        print("   Run: python data/export_dataset.py first")
+        return
+    
+    rentals_df = pd.read_csv('./data/rentals.csv')
+    
+    model = build_model(args)
+    
+    if args.stream:
+        # Streaming: không load toàn bộ interactions, bỏ qua các bước check trên DataFrame
+        print(f"✅ Loaded {len(rentals_df)} rentals")
+        model.train_streaming('./data/interactions.csv', rentals_df, chunksize=args.chunksize)
+        interactions_df = None
+    else:
+        interactions_df = _train_in_memory(model, rentals_df, args)
+        if interactions_df is None:
+            return
+    
+    if model.stage_cache is not None:
+        cache = model.stage_cache
+        print(f"\n♻️ Stage cache: {cache.hits} hits, {cache.misses} misses "
+              f"({os.path.abspath(cache.cache_dir)}, {cache.size_bytes() / (1024*1024):.1f} MB)")
     
     # ========================================
     # BƯỚC 3: TEST RECOMMENDATIONS
     # ========================================
     print("\n📊 Testing recommendations...\n")
     
-    if len(interactions_df) > 0:
+    if interactions_df is not None and len(interactions_df) > 0:
         test_user = interactions_df['userId'].iloc[0]
+    else:
+        test_user = model.user_encoder.classes_[0] if len(model.user_encoder.classes_) else None
+    
+    if test_user is not None:
         recommendations = model.recommend_for_user(test_user, n_recommendations=5)
         
         print(f"   Test recommendations for user '{test_user}':")
@@ -1222,108 +2586,28 @@ def main():
     model.save('./models/recommendation_model.pkl')
     
     # ========================================
-    # ✨ BƯỚC 5: TỰ ĐỘNG TẠO VISUALIZATION
+    # BƯỚC 5: VISUALIZATION (tuỳ chọn, đọc artifact đã lưu)
     # ========================================
-    print("\n" + "="*70)
-    print("🎨 GENERATING MODEL VISUALIZATIONS")
-    print("="*70 + "\n")
-    
-    try:
-        # Import ModelVisualizer từ cùng thư mục
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        sys.path.insert(0, current_dir)
-        
-        from model_visualizer import ModelVisualizer
-        
-        # Tạo thư mục reports
-        reports_dir = './reports'
-        os.makedirs(reports_dir, exist_ok=True)
-        print(f"📁 Reports directory: {os.path.abspath(reports_dir)}\n")
-        
-        # Khởi tạo visualizer
-        visualizer = ModelVisualizer(model_path='./models/recommendation_model.pkl')
-        
-        # Tạo từng biểu đồ
-        print("📊 Creating visualizations...")
-        print("-" * 70)
-        
-        stats = visualizer.plot_matrix_heatmap()
-        visualizer.plot_interaction_distribution()
-        visualizer.plot_user_similarity_heatmap()
-        visualizer.plot_popularity_chart()
-        visualizer.plot_geographic_distribution()
-        visualizer.plot_interactions_per_user()
-        visualizer.plot_interactions_per_item()
-        
-        print("-" * 70)
+    reports_generated = False
+    if args.reports:
         print("\n" + "="*70)
-        print("✅ VISUALIZATION COMPLETED SUCCESSFULLY")
+        print("🎨 GENERATING MODEL VISUALIZATIONS")
         print("="*70 + "\n")
         
-        # Liệt kê file đã tạo
-        print("📊 Generated Visualization Reports:")
-        print(f"   📁 Location: {os.path.abspath(reports_dir)}/")
-        print("\n   Files created:")
-        
-        report_files = [
-            ('1_user_item_matrix.png', 'User-Item Interaction Matrix'),
-            ('2_interaction_distribution.png', 'Interaction Score Distribution'),
-            ('3_user_similarity.png', 'User-User Similarity Heatmap'),
-            ('4_popularity_ranking.png', 'Top 10 Most Popular Rentals'),
-            ('5_geographic_distribution.png', 'Geographic Distribution Map'),
-            ('6_interactions_per_user.png', 'Interactions per User'),
-            ('7_interactions_per_item.png', 'Interactions per Rental'),
-        ]
-        
-        for filename, description in report_files:
-            filepath = os.path.join(reports_dir, filename)
-            if os.path.exists(filepath):
-                size_kb = os.path.getsize(filepath) / 1024
-                print(f"   ✅ {filename:<35} | {size_kb:>6.1f} KB | {description}")
-            else:
-                print(f"   ⚠️  {filename:<35} | MISSING")
-        
-        print()
-        
-        # In thống kê chi tiết
-        print("=" * 70)
-        print("📈 MODEL STATISTICS SUMMARY")
-        print("=" * 70)
-        print(f"   👥 Total Users:           {stats['n_users']:>6,}")
-        print(f"   🏠 Total Rentals:         {stats['n_items']:>6,}")
-        print(f"   📊 Matrix Size:           {stats['n_users']:>6,} × {stats['n_items']:<6,} = {stats['total_cells']:>10,} cells")
-        print(f"   💾 Non-zero Cells:        {stats['nnz']:>10,}")
-        print(f"   📉 Matrix Sparsity:       {stats['sparsity']:>9.2f}%")
-        print(f"   📈 Matrix Density:        {stats['density']:>9.2f}%")
-        print("=" * 70)
-        print()
-        
-        # Hướng dẫn xem báo cáo
-        print("💡 HOW TO VIEW REPORTS:")
-        print("   Option 1 (Docker): docker cp python-ml:/app/reports ./local_reports")
-        print("   Option 2 (Local):  Open files in ./reports/ folder")
-        print("   Option 3 (VSCode): Click on files in Explorer panel")
-        print()
-        
-    except ImportError as e:
-        print(f"\n⚠️ WARNING: Cannot import ModelVisualizer")
-        print(f"   Error: {e}")
-        print(f"   Make sure model_visualizer.py is in: {current_dir}/")
-        print(f"   Training completed successfully, but visualizations skipped.")
-        
-    except FileNotFoundError as e:
-        print(f"\n⚠️ WARNING: Model file not found")
-        print(f"   Error: {e}")
-        print(f"   Make sure model is saved at: ./models/recommendation_model.pkl")
-        
-    except Exception as e:
-        print(f"\n⚠️ WARNING: Failed to generate visualizations")
-        print(f"   Error: {e}")
-        print(f"   Training completed successfully, but visualizations skipped.")
-        print(f"\n   🐛 Debug info:")
-        import traceback
-        traceback.print_exc()
-        
+        try:
+            from training.generate_reports import generate_reports, print_summary
+            
+            result = generate_reports('./models/recommendation_model.pkl', './reports', workers=args.report_workers)
+            print_summary(result, './reports')
+            reports_generated = not result['failed']
+        except Exception as e:
+            print(f"\n⚠️ WARNING: Failed to generate visualizations")
+            print(f"   Error: {e}")
+            print(f"   Training completed successfully, but visualizations skipped.")
+            print(f"\n   🐛 Debug info:")
+            import traceback
+            traceback.print_exc()
+    
     # ========================================
     # BƯỚC 6: KẾT THÚC
     # ========================================
@@ -1333,8 +2617,12 @@ def main():
     
     print("🚀 NEXT STEPS:")
     print("   1. ✅ Model trained and saved")
-    print("   2. ✅ Visualizations generated")
-    print("   3. 📊 View reports in ./reports/ folder")
+    if reports_generated:
+        print("   2. ✅ Visualizations generated")
+        print("   3. 📊 View reports in ./reports/ folder")
+    else:
+        print("   2. 🎨 Generate reports: python training/generate_reports.py")
+        print("   3. 📊 View reports in ./reports/ folder")
     print("   4. 🚀 Start API: python app/main.py")
     print("   5. 🧪 Test API: curl http://localhost:8001/health")
     print("   6. 🎯 Get recommendations: POST http://localhost:8001/recommend/personalized")
@@ -0,0 +1,77 @@
+"""
+🔄 INCREMENTAL UPDATE - Cập nhật model đã train với interactions mới (chạy hourly)
+
+Usage (chạy từ PyThon_ML_App/):
+    python training/update_model.py --interactions ./data/interactions_new.csv
+    python training/update_model.py --interactions ./data/interactions.csv --since auto \\
+        --rentals ./data/rentals.csv
+
+--since auto: chỉ lấy interactions có timestamp sau lần save gần nhất của artifact.
+Interactions mới đi qua cùng stage pre-aggregation như train_model.py
+(gộp event lặp, anonymous chỉ cộng vào popularity) trừ khi --no-preaggregate.
+Exit code: 0 = OK (kể cả không có gì mới), 1 = lỗi.
+"""
+import os
+import sys
+import argparse
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from training.train_model import RecommendationModel
+from training.preaggregate import preaggregate_interactions, print_report, DEFAULT_WINDOW
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Incrementally update a trained recommendation model')
+    parser.add_argument('--model', default='./models/recommendation_model.pkl')
+    parser.add_argument('--interactions', required=True, help='CSV interactions mới (schema export_dataset.py)')
+    parser.add_argument('--rentals', default=None, help='CSV rentals mới/thay đổi (tuỳ chọn)')
+    parser.add_argument('--since', default=None,
+                        help="Chỉ dùng interactions sau mốc này (ISO datetime hoặc 'auto' = trained_at của artifact)")
+    parser.add_argument('--output', default=None, help='Mặc định ghi đè --model')
+    parser.add_argument('--no-preaggregate', action='store_true')
+    parser.add_argument('--preaggregate-window', default=DEFAULT_WINDOW)
+    parser.add_argument('--preaggregate-score', choices=['once', 'sum'], default='once')
+    args = parser.parse_args()
+
+    try:
+        model = RecommendationModel.load(args.model)
+    except Exception as e:
+        print(f"❌ Cannot load model: {e}")
+        return 1
+
+    interactions_df = pd.read_csv(args.interactions)
+    rentals_df = pd.read_csv(args.rentals) if args.rentals else None
+
+    if args.since:
+        since = model.trained_at if args.since == 'auto' else args.since
+        if since:
+            timestamps = pd.to_datetime(interactions_df['timestamp'], errors='coerce')
+            interactions_df = interactions_df[timestamps > pd.Timestamp(since)]
+            print(f"   Filtered interactions since {since}: {len(interactions_df)} rows")
+
+    popularity_only_df = None
+    if not args.no_preaggregate:
+        interactions_df, popularity_only_df, report = preaggregate_interactions(
+            interactions_df, window=args.preaggregate_window or None, score_mode=args.preaggregate_score
+        )
+        print_report(report)
+
+    try:
+        summary = model.update(interactions_df, rentals_df, popularity_only_df=popularity_only_df)
+    except Exception as e:
+        print(f"❌ Update failed: {e}")
+        return 1
+
+    if summary['new_interactions'] == 0 and summary['popularity_only_interactions'] == 0 and rentals_df is None:
+        print("✅ Nothing to update")
+        return 0
+
+    model.save(args.output or args.model)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""
+👥 USER CATALOG - userId interned (IdTable) + centroid vị trí dạng cột
+
+- Row 0..n_users-1 = user_encoder.classes_ (row == user_idx của matrix),
+  user chỉ có trong user_locations nối phía sau
+- longitude / latitude: float64 (centroid giữ nguyên như dict cũ), has_location mask
+- model.user_locations là view read-only (MaskedView) -> call site cũ chạy như dict
+
+Usage:
+    catalog = UserCatalog.build(user_encoder.classes_, user_locations)
+    row = catalog.row(user_id)                  # None nếu không có
+    catalog.location_at(row) if catalog.has_location[row] else None
+"""
+import numpy as np
+
+from training.id_table import IdTable, MaskedView
+
+USER_CATALOG_VERSION = 1
+
+
+class UserCatalog:
+    """Columnar user table; xem docstring module"""
+
+    def __init__(self, user_ids, longitude, latitude, has_location):
+        self.user_ids = user_ids        # IdTable: userId <-> row
+        self.longitude = longitude
+        self.latitude = latitude
+        self.has_location = has_location
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    @classmethod
+    def build(cls, user_ids, user_locations):
+        """user_ids = user_encoder.classes_; user_locations = {userId: (lon, lat)}"""
+        ids = [str(user_id) for user_id in user_ids]
+        known = set(ids)
+        ids.extend(sorted(user_id for user_id in user_locations if user_id not in known))
+
+        locations = [user_locations.get(user_id) for user_id in ids]
+        longitude = np.array([loc[0] if loc is not None else 0.0 for loc in locations], dtype=np.float64)
+        latitude = np.array([loc[1] if loc is not None else 0.0 for loc in locations], dtype=np.float64)
+        has_location = np.array([loc is not None for loc in locations], dtype=bool)
+        return cls(IdTable.build(ids), longitude, latitude, has_location)
+
+    def to_state(self):
+        return {
+            'version': USER_CATALOG_VERSION,
+            'user_ids': self.user_ids.to_state(),
+            'longitude': self.longitude,
+            'latitude': self.latitude,
+            'has_location': self.has_location,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(IdTable.from_state(state['user_ids']), state['longitude'], state['latitude'], state['has_location'])
+
+    def memory_bytes(self):
+        return int(self.user_ids.nbytes + self.longitude.nbytes + self.latitude.nbytes + self.has_location.nbytes)
+
+    def row(self, user_id):
+        return self.user_ids.code(user_id)
+
+    def location_at(self, row):
+        return (float(self.longitude[row]), float(self.latitude[row]))
+
+    def location_view(self):
+        return MaskedView(self.user_ids, self.has_location, self.location_at)
+
+
+def artifact_user_locations(model_data):
+    """{userId: (lon, lat)} từ artifact dict (artifact mới: view trên user_catalog)"""
+    state = model_data.get('user_catalog')
+    if state is None:
+        return model_data.get('user_locations') or {}
+    return UserCatalog.from_state(state).location_view()